@@ -1,554 +1,408 @@
+import heapq
+import importlib
+import importlib.util
+import json
+import marshal
+import math
+import os
 import random
-from collections import defaultdict
 import re
+import sys
+import time
+import warnings
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import Mapping
+from contextlib import redirect_stdout
+from dataclasses import dataclass
+from itertools import accumulate, islice
+from operator import itemgetter
+
+# 只有部分子命令用到的模組（argparse、csv、hashlib、http.server、concurrent.futures、statistics 等）
+# 都在用到的函式內才匯入，讓 import conquest 與只做分析的命令啟動得快一些。
+
+class _LazyModule:
+    """
+    第一次存取屬性時才匯入的模組。匯入後把模組層級的 alias 換成真正的模組，之後的存取不再經過這裡。
+    """
+
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+# numpy 為選用依賴；未安裝時為 None，退回原本的逐次模擬。匯入 numpy 需要數十毫秒，只在批次引擎真正用到時才匯入
+np = _LazyModule('numpy', 'np') if importlib.util.find_spec('numpy') is not None else None
+
+# 批次模擬時每一批處理的場次數，用來限制中間陣列的記憶體用量
+BATCH_CHUNK_RUNS = 1 << 18
 
 # --- 數據庫 ---
-# 將所有遊戲數據結構化，方便程式讀取
-# 結構：{'副本名稱': {'難度': {'stamina': 體力, 'drops': {'類型': {'rolls': 份數, 'pool': [{'item': 名稱, 'quantity': 數量, 'prob': 機率}, ...]}}}}}
-GAME_DATA = {
-    '壁虎': {
-        '簡單': {
-            'stamina': 20,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 4,
-                    'pool': [
-                        {'item': '強化石', 'quantity': 1, 'prob': 0.15}, {'item': '赤紅結晶', 'quantity': 3, 'prob': 0.25},
-                        {'item': '赤紅結晶', 'quantity': 4, 'prob': 0.15}, {'item': '細胞', 'quantity': 1, 'prob': 0.15},
-                        {'item': '2階進化石-力', 'quantity': 1, 'prob': 0.10}, {'item': '2階進化石-技', 'quantity': 1, 'prob': 0.10},
-                        {'item': '2階進化石-速', 'quantity': 1, 'prob': 0.10}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 1,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-初級', 'quantity': 1, 'prob': 0.40},
-                        {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 1,
-                    'pool': [
-                        {'item': '強化石', 'quantity': 1, 'prob': 0.10}, {'item': '赤紅結晶', 'quantity': 2, 'prob': 0.60},
-                        {'item': '赤紅結晶', 'quantity': 3, 'prob': 0.20}, {'item': '赤紅結晶', 'quantity': 4, 'prob': 0.10}
-                    ]
-                }
-            }
-        },
-        '普通': {
-            'stamina': 25,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 4,
-                    'pool': [
-                        {'item': '強化石', 'quantity': 2, 'prob': 0.15}, {'item': '赤紅結晶', 'quantity': 3, 'prob': 0.20},
-                        {'item': '赤紅結晶', 'quantity': 4, 'prob': 0.10}, {'item': '赤紅結晶', 'quantity': 5, 'prob': 0.10},
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.15}, {'item': '3階進化石-力', 'quantity': 1, 'prob': 0.05},
-                        {'item': '3階進化石-技', 'quantity': 1, 'prob': 0.05}, {'item': '3階進化石-速', 'quantity': 1, 'prob': 0.05},
-                        {'item': '2階進化石-力', 'quantity': 1, 'prob': 0.05}, {'item': '2階進化石-技', 'quantity': 1, 'prob': 0.05},
-                        {'item': '2階進化石-速', 'quantity': 1, 'prob': 0.05}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 1,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-初級', 'quantity': 1, 'prob': 0.40},
-                        {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 1,
-                    'pool': [
-                        {'item': '強化石', 'quantity': 1, 'prob': 0.05}, {'item': '強化石', 'quantity': 2, 'prob': 0.05},
-                        {'item': '赤紅結晶', 'quantity': 3, 'prob': 0.60}, {'item': '赤紅結晶', 'quantity': 4, 'prob': 0.30}
-                    ]
-                }
-            }
-        },
-        '困難': {
-            'stamina': 30,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 5,
-                    'pool': [
-                        {'item': '強化石', 'quantity': 3, 'prob': 0.05}, {'item': '強化石', 'quantity': 4, 'prob': 0.10},
-                        {'item': '赤紅結晶', 'quantity': 4, 'prob': 0.10}, {'item': '赤紅結晶', 'quantity': 5, 'prob': 0.15},
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.15}, {'item': '3階進化石-力', 'quantity': 1, 'prob': 0.15},
-                        {'item': '3階進化石-技', 'quantity': 1, 'prob': 0.15}, {'item': '3階進化石-速', 'quantity': 1, 'prob': 0.15}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 2,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-初級', 'quantity': 1, 'prob': 0.40},
-                        {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 1,
-                    'pool': [
-                        {'item': '強化石', 'quantity': 2, 'prob': 0.15}, {'item': '赤紅結晶', 'quantity': 4, 'prob': 0.55},
-                        {'item': '赤紅結晶', 'quantity': 5, 'prob': 0.30}
-                    ]
-                }
-            }
-        },
-        '深淵': {
-            'stamina': 35,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 6,
-                    'pool': [
-                        {'item': '強化石', 'quantity': 5, 'prob': 0.15}, {'item': '赤紅結晶', 'quantity': 5, 'prob': 0.15},
-                        {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.10}, {'item': '細胞', 'quantity': 1, 'prob': 0.15},
-                        {'item': '3階進化石-力', 'quantity': 1, 'prob': 0.15}, {'item': '3階進化石-技', 'quantity': 1, 'prob': 0.15},
-                        {'item': '3階進化石-速', 'quantity': 1, 'prob': 0.15}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 3,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-中級', 'quantity': 1, 'prob': 0.10},
-                        {'item': '戰鬥秘典-初級', 'quantity': 1, 'prob': 0.30}, {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 1,
-                    'pool': [
-                        {'item': '強化石', 'quantity': 3, 'prob': 0.20}, {'item': '赤紅結晶', 'quantity': 5, 'prob': 0.80}
-                    ]
-                }
-            }
-        },
-    },
-    '獨眼梟': {
-        '簡單': {
-            'stamina': 35,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 5,
-                    'pool': [
-                        {'item': '稀有強化石', 'quantity': 1, 'prob': 0.15}, {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.20},
-                        {'item': '赤紅結晶', 'quantity': 7, 'prob': 0.05}, {'item': '細胞', 'quantity': 1, 'prob': 0.15},
-                        {'item': '3階進化石-力', 'quantity': 1, 'prob': 0.15}, {'item': '3階進化石-技', 'quantity': 1, 'prob': 0.15},
-                        {'item': '3階進化石-速', 'quantity': 1, 'prob': 0.15}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 3,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-中級', 'quantity': 1, 'prob': 0.40},
-                        {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 2,
-                    'pool': [
-                        {'item': '稀有強化石', 'quantity': 1, 'prob': 0.10}, {'item': '赤紅結晶', 'quantity': 5, 'prob': 0.60},
-                        {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.30}
-                    ]
-                }
-            }
-        },
-        '普通': {
-            'stamina': 40,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 5,
-                    'pool': [
-                        {'item': '稀有強化石', 'quantity': 1, 'prob': 0.10}, {'item': '稀有強化石', 'quantity': 2, 'prob': 0.05},
-                        {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.10}, {'item': '赤紅結晶', 'quantity': 7, 'prob': 0.10},
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.20}, {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.03},
-                        {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.03}, {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.03},
-                        {'item': '3階進化石-力', 'quantity': 1, 'prob': 0.12}, {'item': '3階進化石-技', 'quantity': 1, 'prob': 0.12},
-                        {'item': '3階進化石-速', 'quantity': 1, 'prob': 0.12}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 3,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-中級', 'quantity': 1, 'prob': 0.40},
-                        {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 2,
-                    'pool': [
-                        {'item': '稀有強化石', 'quantity': 1, 'prob': 0.05}, {'item': '稀有強化石', 'quantity': 2, 'prob': 0.05},
-                        {'item': '赤紅結晶', 'quantity': 5, 'prob': 0.60}, {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.30}
-                    ]
-                }
-            }
-        },
-        '困難': {
-            'stamina': 45,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 5,
-                    'pool': [
-                        {'item': '稀有強化石', 'quantity': 2, 'prob': 0.15}, {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.10},
-                        {'item': '赤紅結晶', 'quantity': 7, 'prob': 0.10}, {'item': '細胞', 'quantity': 1, 'prob': 0.20},
-                        {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.04}, {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.04},
-                        {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.04}, {'item': '3階進化石-力', 'quantity': 1, 'prob': 0.11},
-                        {'item': '3階進化石-技', 'quantity': 1, 'prob': 0.11}, {'item': '3階進化石-速', 'quantity': 1, 'prob': 0.11}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 3,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-中級', 'quantity': 1, 'prob': 0.40},
-                        {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 3,
-                    'pool': [
-                        {'item': '稀有強化石', 'quantity': 2, 'prob': 0.10}, {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.90}
-                    ]
-                }
-            }
-        },
-        '深淵': {
-            'stamina': 50,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 5,
-                    'pool': [
-                        {'item': '稀有強化石', 'quantity': 4, 'prob': 0.15}, {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.10},
-                        {'item': '赤紅結晶', 'quantity': 7, 'prob': 0.10}, {'item': '細胞', 'quantity': 1, 'prob': 0.20},
-                        {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.05}, {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.05},
-                        {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.05}, {'item': '3階進化石-力', 'quantity': 1, 'prob': 0.10},
-                        {'item': '3階進化石-技', 'quantity': 1, 'prob': 0.10}, {'item': '3階進化石-速', 'quantity': 1, 'prob': 0.10}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 3,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-中級', 'quantity': 1, 'prob': 0.40},
-                        {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 3,
-                    'pool': [
-                        {'item': '稀有強化石', 'quantity': 3, 'prob': 0.10}, {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.90}
-                    ]
-                }
-            }
-        },
-    },
-    '百足': {
-        '簡單': {
-            'stamina': 50,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 7,
-                    'pool': [
-                        {'item': '精良強化石', 'quantity': 1, 'prob': 0.15}, {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.10},
-                        {'item': '赤紅結晶', 'quantity': 7, 'prob': 0.10}, {'item': '細胞', 'quantity': 1, 'prob': 0.20},
-                        {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.05}, {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.05},
-                        {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.05}, {'item': '3階進化石-力', 'quantity': 1, 'prob': 0.10},
-                        {'item': '3階進化石-技', 'quantity': 1, 'prob': 0.10}, {'item': '3階進化石-速', 'quantity': 1, 'prob': 0.10}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 3,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-中級', 'quantity': 1, 'prob': 0.40},
-                        {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 2,
-                    'pool': [
-                        {'item': '精良強化石', 'quantity': 1, 'prob': 0.10}, {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.60},
-                        {'item': '赤紅結晶', 'quantity': 7, 'prob': 0.30}
-                    ]
-                }
-            }
-        },
-        '普通': {
-            'stamina': 55,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 7,
-                    'pool': [
-                        {'item': '精良強化石', 'quantity': 1, 'prob': 0.10}, {'item': '精良強化石', 'quantity': 2, 'prob': 0.05},
-                        {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.10}, {'item': '赤紅結晶', 'quantity': 7, 'prob': 0.10},
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.20}, {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.05},
-                        {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.05}, {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.05},
-                        {'item': '3階進化石-力', 'quantity': 1, 'prob': 0.10}, {'item': '3階進化石-技', 'quantity': 1, 'prob': 0.10},
-                        {'item': '3階進化石-速', 'quantity': 1, 'prob': 0.10}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 3,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-中級', 'quantity': 1, 'prob': 0.40},
-                        {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 2,
-                    'pool': [
-                        {'item': '精良強化石', 'quantity': 1, 'prob': 0.05}, {'item': '精良強化石', 'quantity': 2, 'prob': 0.05},
-                        {'item': '赤紅結晶', 'quantity': 6, 'prob': 0.60}, {'item': '赤紅結晶', 'quantity': 7, 'prob': 0.30}
-                    ]
-                }
-            }
-        },
-        '困難': {
-            'stamina': 60,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 7,
-                    'pool': [
-                        {'item': '精良強化石', 'quantity': 2, 'prob': 0.15}, {'item': '赤紅結晶', 'quantity': 8, 'prob': 0.20},
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.20}, {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.05},
-                        {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.05}, {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.05},
-                        {'item': '3階進化石-力', 'quantity': 1, 'prob': 0.10}, {'item': '3階進化石-技', 'quantity': 1, 'prob': 0.10},
-                        {'item': '3階進化石-速', 'quantity': 1, 'prob': 0.10}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 3,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-中級', 'quantity': 1, 'prob': 0.40},
-                        {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 2,
-                    'pool': [
-                        {'item': '精良強化石', 'quantity': 2, 'prob': 0.10}, {'item': '赤紅結晶', 'quantity': 7, 'prob': 0.90}
-                    ]
-                }
-            }
-        },
-        '深淵': {
-            'stamina': 70,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 7,
-                    'pool': [
-                        {'item': '精良強化石', 'quantity': 4, 'prob': 0.15}, {'item': '赤紅結晶', 'quantity': 8, 'prob': 0.20},
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.20}, {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.07},
-                        {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.07}, {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.07},
-                        {'item': '3階進化石-力', 'quantity': 1, 'prob': 0.08}, {'item': '3階進化石-技', 'quantity': 1, 'prob': 0.08},
-                        {'item': '3階進化石-速', 'quantity': 1, 'prob': 0.08}
-                    ]
-                },
-                '機率掉落': {
-                    'rolls': 3,
-                    'pool': [
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.30}, {'item': '戰鬥秘典-中級', 'quantity': 1, 'prob': 0.40},
-                        {'item': '黃金兔寶寶', 'quantity': 1, 'prob': 0.30}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 2,
-                    'pool': [
-                        {'item': '精良強化石', 'quantity': 2, 'prob': 0.05}, {'item': '精良強化石', 'quantity': 3, 'prob': 0.05},
-                        {'item': '赤紅結晶', 'quantity': 7, 'prob': 0.45}, {'item': '赤紅結晶', 'quantity': 8, 'prob': 0.45}
-                    ]
-                }
-            }
-        },
-    },
-    '野呂': {
-        '簡單': {
-            'stamina': 50,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 4,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 1, 'prob': 0.12}, {'item': '細胞', 'quantity': 1, 'prob': 0.19},
-                        {'item': '5階進化石-力', 'quantity': 1, 'prob': 0.10}, {'item': '5階進化石-技', 'quantity': 1, 'prob': 0.10},
-                        {'item': '5階進化石-速', 'quantity': 1, 'prob': 0.10}, {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.13},
-                        {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.13}, {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.13}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 1,
-                    'pool': [ {'item': '界限晶幣', 'quantity': 1, 'prob': 1.0} ]
-                }
-            }
-        },
-        '普通': {
-            'stamina': 55,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 5,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 1, 'prob': 0.15}, {'item': '細胞', 'quantity': 1, 'prob': 0.19},
-                        {'item': '5階進化石-力', 'quantity': 1, 'prob': 0.10}, {'item': '5階進化石-技', 'quantity': 1, 'prob': 0.10},
-                        {'item': '5階進化石-速', 'quantity': 1, 'prob': 0.10}, {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.12},
-                        {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.12}, {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.12}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 1,
-                    'pool': [ {'item': '界限晶幣', 'quantity': 1, 'prob': 1.0} ]
-                }
-            }
-        },
-        '困難': {
-            'stamina': 60,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 6,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 1, 'prob': 0.15}, {'item': '細胞', 'quantity': 1, 'prob': 0.19},
-                        {'item': '5階進化石-力', 'quantity': 1, 'prob': 0.11}, {'item': '5階進化石-技', 'quantity': 1, 'prob': 0.11},
-                        {'item': '5階進化石-速', 'quantity': 1, 'prob': 0.11}, {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.11},
-                        {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.11}, {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.11}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 2,
-                    'pool': [ {'item': '界限晶幣', 'quantity': 1, 'prob': 1.0} ]
-                }
-            }
-        },
-        '深淵': {
-            'stamina': 70,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 7,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 1, 'prob': 0.10}, {'item': '界限晶幣', 'quantity': 2, 'prob': 0.05},
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.19}, {'item': '5階進化石-力', 'quantity': 1, 'prob': 0.11},
-                        {'item': '5階進化石-技', 'quantity': 1, 'prob': 0.11}, {'item': '5階進化石-速', 'quantity': 1, 'prob': 0.11},
-                        {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.11}, {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.11},
-                        {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.11}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 2,
-                    'pool': [ {'item': '界限晶幣', 'quantity': 1, 'prob': 1.0} ]
-                }
-            }
-        },
-    },
-    '多田良': {
-        '簡單': {
-            'stamina': 50,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 4,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 1, 'prob': 0.15}, {'item': '3階進階結晶', 'quantity': 1, 'prob': 0.05},
-                        {'item': '赤紅結晶', 'quantity': 10, 'prob': 0.05}, {'item': '細胞', 'quantity': 1, 'prob': 0.06},
-                        {'item': '5階進化石-力', 'quantity': 1, 'prob': 0.10}, {'item': '5階進化石-技', 'quantity': 1, 'prob': 0.10},
-                        {'item': '5階進化石-速', 'quantity': 1, 'prob': 0.10}, {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.13},
-                        {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.13}, {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.13}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 1,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 1, 'prob': 1.0},
-                        {'item': '赤紅結晶', 'quantity': 1, 'prob': 1.0}
-                    ]
-                }
-            }
-        },
-        '普通': {
-            'stamina': 55,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 5,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 1, 'prob': 0.18}, {'item': '3階進階結晶', 'quantity': 1, 'prob': 0.05},
-                        {'item': '赤紅結晶', 'quantity': 12, 'prob': 0.05}, {'item': '細胞', 'quantity': 1, 'prob': 0.06},
-                        {'item': '5階進化石-力', 'quantity': 1, 'prob': 0.10}, {'item': '5階進化石-技', 'quantity': 1, 'prob': 0.10},
-                        {'item': '5階進化石-速', 'quantity': 1, 'prob': 0.10}, {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.12},
-                        {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.12}, {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.12}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 1,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 1, 'prob': 1.0},
-                        {'item': '赤紅結晶', 'quantity': 1, 'prob': 1.0}
-                    ]
-                }
-            }
-        },
-        '困難': {
-            'stamina': 60,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 6,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 1, 'prob': 0.18}, {'item': '3階進階結晶', 'quantity': 2, 'prob': 0.05},
-                        {'item': '赤紅結晶', 'quantity': 15, 'prob': 0.05}, {'item': '細胞', 'quantity': 1, 'prob': 0.06},
-                        {'item': '5階進化石-力', 'quantity': 1, 'prob': 0.11}, {'item': '5階進化石-技', 'quantity': 1, 'prob': 0.11},
-                        {'item': '5階進化石-速', 'quantity': 1, 'prob': 0.11}, {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.11},
-                        {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.11}, {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.11}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 1,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 2, 'prob': 1.0},
-                        {'item': '赤紅結晶', 'quantity': 2, 'prob': 1.0}
-                    ]
-                }
-            }
-        },
-        '深淵': {
-            'stamina': 70,
-            'drops': {
-                '一般掉落': {
-                    'rolls': 7,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 2, 'prob': 0.09}, {'item': '界限晶幣', 'quantity': 1, 'prob': 0.09},
-                        {'item': '3階進階結晶', 'quantity': 3, 'prob': 0.05}, {'item': '赤紅結晶', 'quantity': 15, 'prob': 0.05},
-                        {'item': '細胞', 'quantity': 1, 'prob': 0.06}, {'item': '5階進化石-力', 'quantity': 1, 'prob': 0.11},
-                        {'item': '5階進化石-技', 'quantity': 1, 'prob': 0.11}, {'item': '5階進化石-速', 'quantity': 1, 'prob': 0.11},
-                        {'item': '4階進化石-力', 'quantity': 1, 'prob': 0.11}, {'item': '4階進化石-技', 'quantity': 1, 'prob': 0.11},
-                        {'item': '4階進化石-速', 'quantity': 1, 'prob': 0.11}
-                    ]
-                },
-                '部位掉落': {
-                    'rolls': 1,
-                    'pool': [
-                        {'item': '界限晶幣', 'quantity': 2, 'prob': 1.0},
-                        {'item': '赤紅結晶', 'quantity': 4, 'prob': 1.0}
-                    ]
-                }
-            }
-        },
+# 所有遊戲數據存放在同目錄的 conquest_data.json，第一次用到時才載入。
+# 檔案格式：{'schema_version': 1, 'data_version': 版本, 'stages': 關卡數據}
+# 關卡數據結構：{'副本名稱': {'難度': {'stamina': 體力, 'drops': {'類型': {'rolls': 份數, 'pool': [{'item': 名稱, 'quantity': 數量, 'prob': 機率}, ...]}}}}}
+GAME_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'conquest_data.json')
+GAME_DATA_SCHEMA_VERSION = 1
+# 一般掉落池的機率總和與 1 的容許誤差
+PROB_SUM_TOLERANCE = 1e-6
+
+def _is_positive_int(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value > 0
+
+def validate_game_data(game_data):
+    """
+    檢查關卡數據的結構與數值，回傳問題描述的列表（沒有問題時為空列表）。
+    除了欄位與型別之外，也會標出機率總和不為 1 的掉落池：
+    random.choices 會默默把它們正規化，使模擬結果與期望值計算不一致。
+    """
+    issues = []
+    for boss, difficulties in game_data.items():
+        for difficulty, details in difficulties.items():
+            stage_name = f"{boss}-{difficulty}"
+            if not _is_positive_int(details.get('stamina')):
+                issues.append(f"{stage_name}: stamina 必須是正整數")
+            drops = details.get('drops')
+            if not isinstance(drops, dict) or not drops:
+                issues.append(f"{stage_name}: drops 必須是非空的字典")
+                continue
+            for drop_type, drop_data in drops.items():
+                where = f"{stage_name} {drop_type}"
+                if not _is_positive_int(drop_data.get('rolls')):
+                    issues.append(f"{where}: rolls 必須是正整數")
+                pool = drop_data.get('pool')
+                if not isinstance(pool, list) or not pool:
+                    issues.append(f"{where}: pool 必須是非空的列表")
+                    continue
+                valid = True
+                for position, entry in enumerate(pool):
+                    if not isinstance(entry.get('item'), str) or not entry.get('item'):
+                        issues.append(f"{where} 第 {position + 1} 項: item 必須是非空字串")
+                        valid = False
+                    if not _is_positive_int(entry.get('quantity')):
+                        issues.append(f"{where} 第 {position + 1} 項: quantity 必須是正整數")
+                        valid = False
+                    prob = entry.get('prob')
+                    if isinstance(prob, bool) or not isinstance(prob, (int, float)) or not 0 <= prob <= 1:
+                        issues.append(f"{where} 第 {position + 1} 項: prob 必須介於 0 與 1 之間")
+                        valid = False
+                if not valid:
+                    continue
+                total = sum(entry['prob'] for entry in pool)
+                if total > 1.01:
+                    partial = [entry['item'] for entry in pool if entry['prob'] != 1]
+                    if partial:
+                        issues.append(f"{where}: 組合包（機率總和 {total:g}）會無視機率直接給予 {', '.join(partial)}")
+                elif abs(total - 1) > PROB_SUM_TOLERANCE:
+                    issues.append(f"{where}: 機率總和為 {total:g}，模擬時會被正規化為 1")
+    return issues
+
+def load_game_data(path=None, validate=True):
+    """
+    讀取關卡數據檔並檢查 schema 版本；validate=True 時對每個問題發出警告。
+    """
+    if path is None:
+        path = GAME_DATA_PATH
+    with open(path, 'r', encoding='utf-8') as f:
+        document = json.load(f)
+    if document.get('schema_version') != GAME_DATA_SCHEMA_VERSION:
+        raise ValueError(f"不支援的數據檔版本：{document.get('schema_version')}（需要 {GAME_DATA_SCHEMA_VERSION}）")
+    stages = document['stages']
+    if validate:
+        for issue in validate_game_data(stages):
+            warnings.warn(issue, stacklevel=2)
+    return stages
+
+def save_game_data(stages, path=None, data_version=None):
+    """
+    以與 conquest_data.json 相同的格式（每個掉落格一行）寫出關卡數據，先寫暫存檔再取代，避免寫到一半的檔案。
+    data_version 未給時沿用 1。
+    """
+    if path is None:
+        path = GAME_DATA_PATH
+    document = {
+        'schema_version': GAME_DATA_SCHEMA_VERSION,
+        'data_version': 1 if data_version is None else data_version,
+        'stages': stages,
     }
+    text = json.dumps(document, ensure_ascii=False, indent=2)
+    text = re.sub(r'\{\s*("item": [^{}]*?)\s*\}', lambda m: '{' + re.sub(r',\s+', ', ', m.group(1)) + '}', text)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(text + '\n')
+    os.replace(temp_path, path)
+
+class LazyGameData(Mapping):
+    """第一次存取時才載入數據檔的唯讀映射，匯入模組時不必解析整份數據。"""
+
+    def __init__(self, path=None):
+        self._path = path
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            self._data = load_game_data(self._path)
+        return self._data
+
+    def reload(self):
+        """重新讀取數據檔（例如遊戲改版更新數據後）。"""
+        self._data = None
+        return self._load()
+
+    def __getitem__(self, boss):
+        return self._load()[boss]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __contains__(self, boss):
+        return boss in self._load()
+
+GAME_DATA = LazyGameData()
+
+# --- 預編譯掉落表 ---
+# GAME_DATA 是方便手動維護的巢狀結構；分析與模擬都改用一次編譯好的掉落表，
+# 執行時不再反覆查字串鍵、重建權重列表或重新加總機率。
+
+@dataclass(frozen=True, slots=True)
+class DropPool:
+    """單一掉落類型編譯後的結果。道具以整數 ID 表示，對應 CompiledGameData.item_names。"""
+    drop_type: str
+    rolls: int
+    is_bundle: bool
+    item_ids: tuple
+    quantities: tuple
+    probs: tuple
+    cum_weights: tuple
+    total_weight: float
+    loot: tuple  # 每一格的 (道具 ID, 數量)，供 random.choices 直接抽取
+    rows: tuple  # 每一格的道具在所屬關卡 StageTable.item_ids 中的位置
+    # 以下為批次引擎使用的 numpy 陣列，未安裝 numpy 時為 None
+    item_ids_array: object = None
+    quantities_array: object = None
+    cum_weights_array: object = None
+    guide: object = None
+
+@dataclass(frozen=True, slots=True)
+class StageTable:
+    """單一關卡（副本-難度）編譯後的掉落表。"""
+    boss: str
+    difficulty: str
+    stamina: int
+    pools: tuple
+    item_ids: tuple  # 此關卡會掉落的道具 ID，依首次出現的順序
+    expected_loot: tuple  # 每場的 (道具 ID, 期望掉落數)
+
+    @property
+    def name(self):
+        return f"{self.boss}-{self.difficulty}"
+
+@dataclass(frozen=True, slots=True)
+class ItemInfo:
+    """道具的顯示排序資訊，每個道具只計算一次。"""
+    name: str
+    priority: int  # 類別優先順序，未列出的類別為 99
+    stone_grade: int  # 精良 3、稀有 2、一般強化石 1，其他道具 0
+    tier: int  # 名稱中的「N階」，沒有則為 0
+    sort_key: tuple  # (priority, stone_grade, tier, name)
+
+ITEM_PRIORITY = {
+    '強化石': 1, '稀有強化石': 1, '精良強化石': 1,
+    '2階進化石': 2, '3階進化石': 2, '4階進化石': 2, '5階進化石': 2,
+    '3階進階結晶': 3, '赤紅結晶': 3, '界限晶幣': 3,
+    '細胞': 4,
+    '戰鬥秘典': 5,
+    '黃金兔寶寶': 6
 }
 
-def calculate_ev_per_stamina():
+def build_item_info(item_name):
+    """由道具名稱算出分類優先順序、強化石等級與階數。"""
+    base_name = ''.join(filter(lambda c: not c.isdigit() and c not in ['-', '力', '技', '速', '階', '進', '晶'], item_name))
+    tier_match = re.search(r'(\d+)階', item_name)
+    tier = int(tier_match.group(1)) if tier_match else 0
+    stone_grade = 0
+    if '精良' in item_name: stone_grade = 3
+    elif '稀有' in item_name: stone_grade = 2
+    elif '強化石' in item_name: stone_grade = 1
+    priority = ITEM_PRIORITY.get(base_name, 99)
+    return ItemInfo(item_name, priority, stone_grade, tier, (priority, stone_grade, tier, item_name))
+
+class CompiledGameData:
+    """
+    整份遊戲數據編譯後的結果。各關卡在第一次被用到時才編譯，
+    只模擬單一關卡時不必編譯其他關卡。
+    """
+    __slots__ = ('game_data', 'item_names', 'item_ids', '_stages', '_items')
+
+    def __init__(self, game_data):
+        self.game_data = game_data
+        self.item_names = []  # 道具 ID -> 名稱
+        self.item_ids = {}  # 名稱 -> 道具 ID
+        self._stages = {}
+        self._items = None
+
+    @property
+    def items(self):
+        """{道具名稱: ItemInfo}，第一次用到時掃過所有關卡一次算好（不需要編譯關卡）。"""
+        if self._items is None:
+            names = dict.fromkeys(
+                item_drop['item']
+                for difficulties in self.game_data.values()
+                for details in difficulties.values()
+                for drop_data in details['drops'].values()
+                for item_drop in drop_data['pool']
+            )
+            self._items = {name: build_item_info(name) for name in names}
+        return self._items
+
+    def item_info(self, item_name):
+        """取得道具的 ItemInfo；不在數據中的名稱（例如外部資料）會在此時計算並記住。"""
+        info = self.items.get(item_name)
+        if info is None:
+            info = self._items[item_name] = build_item_info(item_name)
+        return info
+
+    def stage(self, boss, difficulty):
+        """取得單一關卡的 StageTable，找不到關卡時回傳 None。"""
+        key = (boss, difficulty)
+        stage = self._stages.get(key)
+        if stage is None:
+            details = self.game_data.get(boss, {}).get(difficulty)
+            if details is None:
+                return None
+            stage = _compile_stage(boss, difficulty, details, self.item_ids, self.item_names)
+            self._stages[key] = stage
+        return stage
+
+    @property
+    def stages(self):
+        """{(副本, 難度): StageTable}，依數據中的順序；尚未編譯的關卡會在此時編譯。"""
+        return {
+            (boss, difficulty): self.stage(boss, difficulty)
+            for boss, difficulties in self.game_data.items()
+            for difficulty in difficulties
+        }
+
+# 累積權重查表的格數：先用 u 落在哪一格直接查出結果，只有跨越邊界的格子才需要二分搜尋
+GUIDE_TABLE_SIZE = 1 << 12
+
+def _build_guide_table(cum_weights):
+    """
+    為累積權重建立查表，回傳 (每格對應的格子索引, 該格是否跨越邊界)。
+    """
+    num_entries = len(cum_weights)
+    edges = np.linspace(0.0, cum_weights[-1], GUIDE_TABLE_SIZE + 1)
+    lower = np.searchsorted(cum_weights, edges[:-1], side='right')
+    upper = np.searchsorted(cum_weights, edges[1:], side='right')
+    return np.minimum(lower, num_entries - 1), lower != upper
+
+def _compile_pool(drop_type, drop_data, item_ids, item_names, stage_rows, with_arrays=True):
+    """
+    將一個掉落類型編譯成 DropPool，並把新出現的道具登記到 item_ids / item_names，
+    以及所屬關卡的道具順序 stage_rows。
+    """
+    pool = drop_data['pool']
+    ids = []
+    for item_drop in pool:
+        name = item_drop['item']
+        if name not in item_ids:
+            item_ids[name] = len(item_names)
+            item_names.append(name)
+        ids.append(item_ids[name])
+        stage_rows.setdefault(item_ids[name], len(stage_rows))
+    quantities = tuple(d['quantity'] for d in pool)
+    probs = tuple(d['prob'] for d in pool)
+    cum_weights = tuple(accumulate(probs))
+    total_weight = cum_weights[-1] if cum_weights else 0.0
+    # 檢查是否為組合包 (總機率 > 1.01)
+    is_bundle = sum(probs) > 1.01
+    arrays = {}
+    if with_arrays and np is not None:
+        cum_weights_array = np.array(cum_weights, dtype=np.float64)
+        arrays = {
+            'item_ids_array': np.array(ids, dtype=np.intp),
+            'quantities_array': np.array(quantities, dtype=np.int64),
+            'cum_weights_array': cum_weights_array,
+        }
+        if not is_bundle and total_weight > 0:
+            arrays['guide'] = _build_guide_table(cum_weights_array)
+    return DropPool(
+        drop_type=drop_type,
+        rolls=drop_data['rolls'],
+        is_bundle=is_bundle,
+        item_ids=tuple(ids),
+        quantities=quantities,
+        probs=probs,
+        cum_weights=cum_weights,
+        total_weight=total_weight,
+        loot=tuple(zip(ids, quantities)),
+        rows=tuple(stage_rows[item_id] for item_id in ids),
+        **arrays,
+    )
+
+def _compile_stage(boss, difficulty, details, item_ids, item_names, with_arrays=True):
+    """將一個關卡編譯成 StageTable；with_arrays=False 時不建立批次引擎用的 numpy 陣列。"""
+    stage_rows = {}
+    pools = tuple(
+        _compile_pool(drop_type, drop_data, item_ids, item_names, stage_rows, with_arrays)
+        for drop_type, drop_data in details['drops'].items()
+    )
+    # 【注意】此處的計算邏輯對於組合包和普通掉落都適用，無需更改
+    # 因為期望值是線性的，(A+B)的期望值 = A的期望值 + B的期望值
+    expected = {}
+    for pool in pools:
+        for item_id, quantity, prob in zip(pool.item_ids, pool.quantities, pool.probs):
+            expected[item_id] = expected.get(item_id, 0.0) + quantity * prob * pool.rolls
+    return StageTable(
+        boss=boss,
+        difficulty=difficulty,
+        stamina=details['stamina'],
+        pools=pools,
+        item_ids=tuple(stage_rows),
+        expected_loot=tuple(expected.items()),
+    )
+
+def compile_game_data(game_data=None, lazy=False):
+    """
+    將 GAME_DATA 編譯成以陣列為主的掉落表：道具名稱轉成整數 ID，
+    並預先算好數量、機率、累積權重、組合包旗標與體力消耗。
+    lazy=True 時只建立容器，各關卡在第一次用到時才編譯。
+    """
+    if game_data is None:
+        game_data = GAME_DATA
+    compiled = CompiledGameData(game_data)
+    if not lazy:
+        compiled.stages
+    return compiled
+
+_compiled_game_data = None
+
+def get_compiled_game_data(refresh=False):
+    """取得 GAME_DATA 的編譯結果（各關卡延遲編譯）；refresh=True 時捨棄先前的結果。"""
+    global _compiled_game_data
+    if _compiled_game_data is None or refresh:
+        _compiled_game_data = compile_game_data(lazy=True)
+    return _compiled_game_data
+
+def calculate_ev_per_stamina(compiled=None):
     """
     計算每個關卡中，每種道具的期望掉落數量，並換算成每體力期望值（體力效率）。
     期望值(EV) = 掉落數量 * 掉落機率
     """
+    if compiled is None:
+        compiled = get_compiled_game_data()
+    item_names = compiled.item_names
     all_items_efficiency = defaultdict(dict)
-    for boss, difficulties in GAME_DATA.items():
-        for difficulty, details in difficulties.items():
-            stamina_cost = details['stamina']
-            stage_name = f"{boss}-{difficulty}"
-            stage_total_ev = defaultdict(float)
-            for drop_type, drop_data in details['drops'].items():
-                rolls = drop_data['rolls']
-                pool = drop_data['pool']
-                
-                # 【注意】此處的計算邏輯對於組合包和普通掉落都適用，無需更改
-                # 因為期望值是線性的，(A+B)的期望值 = A的期望值 + B的期望值
-                for item_drop in pool:
-                    item_name = item_drop['item']
-                    quantity = item_drop['quantity']
-                    prob = item_drop['prob']
-                    ev = quantity * prob
-                    stage_total_ev[item_name] += ev * rolls
-            for item_name, total_ev in stage_total_ev.items():
-                efficiency = total_ev / stamina_cost
-                all_items_efficiency[item_name][stage_name] = efficiency
+    for stage in compiled.stages.values():
+        stage_name = stage.name
+        for item_id, total_ev in stage.expected_loot:
+            all_items_efficiency[item_names[item_id]][stage_name] = total_ev / stage.stamina
     return all_items_efficiency
 
 def find_best_stage(all_items_efficiency):
@@ -563,48 +417,2715 @@ def find_best_stage(all_items_efficiency):
         best_stages[item_name] = (best_stage, stages[best_stage])
     return best_stages
 
-def simulate_runs(boss, difficulty, num_runs):
+# --- 期望值快取 ---
+# 掉落表只有在遊戲改版時才會變動，因此以每個關卡內容的雜湊值作為快取鍵：
+# 修改某個關卡的掉落池只會讓該關卡的快取失效，其他關卡仍直接沿用。
+
+# 行程內 LRU 快取的最大筆數
+EV_CACHE_SIZE = 256
+
+_ev_cache = OrderedDict()
+# 關卡內容雜湊的記憶：(副本, 難度, 內容指紋) -> 雜湊。指紋是 details 的 marshal 序列化結果，
+# 由 C 實作、比正規化 JSON 快得多，且完整反映內容，就地修改掉落池也會得到新的指紋；
+# 內容相同但鍵的順序不同時指紋不同，只會多算一次雜湊，結果仍相同。
+_stage_hash_memo = {}
+
+def stage_content_hash(boss, difficulty, details):
+    """以關卡名稱與內容的正規化 JSON 計算 SHA-256 雜湊值。"""
+    import hashlib
+    payload = json.dumps([boss, difficulty, details], ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _cache_get(key, cache_dir):
+    """先查行程內快取，再查磁碟快取；都沒有時回傳 None。"""
+    if key in _ev_cache:
+        _ev_cache.move_to_end(key)
+        return _ev_cache[key]
+    if cache_dir:
+        path = os.path.join(cache_dir, f"{key}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        _cache_put(key, value, None)
+        return value
+    return None
+
+def _cache_put(key, value, cache_dir):
+    """寫入行程內快取（超過上限時淘汰最久未使用的項目），有指定 cache_dir 時也寫入磁碟。"""
+    _ev_cache[key] = value
+    _ev_cache.move_to_end(key)
+    while len(_ev_cache) > EV_CACHE_SIZE:
+        _ev_cache.popitem(last=False)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"{key}.json")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+def clear_ev_cache():
+    """清空行程內的期望值快取與關卡雜湊的記憶（磁碟快取不受影響）。"""
+    _ev_cache.clear()
+    _stage_hash_memo.clear()
+
+def _stage_key(boss, difficulty, details):
+    """關卡的快取鍵；每次查詢都依目前內容計算指紋，內容相同的關卡只計算一次雜湊。"""
+    fingerprint = (boss, difficulty, marshal.dumps(details))
+    key = _stage_hash_memo.get(fingerprint)
+    if key is None:
+        key = 'stage-' + stage_content_hash(boss, difficulty, details)
+        if len(_stage_hash_memo) >= EV_CACHE_SIZE:
+            _stage_hash_memo.clear()
+        _stage_hash_memo[fingerprint] = key
+    return key
+
+def _stage_efficiency(boss, difficulty, details, cache_dir=None):
+    """回傳單一關卡的 (內容雜湊, [[道具, 體力效率], ...])，優先使用快取。"""
+    key = _stage_key(boss, difficulty, details)
+    efficiency = _cache_get(key, cache_dir)
+    if efficiency is None:
+        item_names = []
+        stage = _compile_stage(boss, difficulty, details, {}, item_names, with_arrays=False)
+        efficiency = [[item_names[item_id], total_ev / stage.stamina] for item_id, total_ev in stage.expected_loot]
+        _cache_put(key, efficiency, cache_dir)
+    return key, efficiency
+
+def cached_ev_per_stamina(game_data=None, cache_dir=None):
+    """
+    與 calculate_ev_per_stamina 結果相同，但每個關卡的結果都依內容雜湊快取。
+    cache_dir 有給時同時使用磁碟快取，程式重新啟動後也不必重新計算。
+    """
+    if game_data is None:
+        game_data = GAME_DATA
+    all_items_efficiency = defaultdict(dict)
+    for boss, difficulties in game_data.items():
+        for difficulty, details in difficulties.items():
+            _, efficiency = _stage_efficiency(boss, difficulty, details, cache_dir)
+            stage_name = f"{boss}-{difficulty}"
+            for item_name, value in efficiency:
+                all_items_efficiency[item_name][stage_name] = value
+    return all_items_efficiency
+
+def _game_data_key(game_data):
+    """將所有關卡的內容雜湊組合成整份數據的快取鍵（關卡雜湊依內容指紋記憶，不會重新做正規化 JSON）。"""
+    import hashlib
+    stage_keys = [
+        _stage_key(boss, difficulty, details)
+        for boss, difficulties in game_data.items()
+        for difficulty, details in difficulties.items()
+    ]
+    return hashlib.sha256('|'.join(stage_keys).encode('ascii')).hexdigest()
+
+def cached_best_stages(game_data=None, cache_dir=None):
+    """
+    與 find_best_stage(calculate_ev_per_stamina()) 結果相同，以所有關卡雜湊組合成的鍵快取。
+    """
+    if game_data is None:
+        game_data = GAME_DATA
+    key = 'best-' + _game_data_key(game_data)
+    best_stages = _cache_get(key, cache_dir)
+    if best_stages is None:
+        best_stages = {
+            item: list(value)
+            for item, value in find_best_stage(cached_ev_per_stamina(game_data, cache_dir)).items()
+        }
+        _cache_put(key, best_stages, cache_dir)
+    return {item: tuple(value) for item, value in best_stages.items()}
+
+# --- 道具→關卡索引 ---
+
+@dataclass(frozen=True, slots=True)
+class EfficiencyIndex:
+    """
+    預先排序好的效率索引：每個道具的關卡依效率由高到低排列，另有關卡→道具的反查表。
+    查詢前 K 名為 O(K)，門檻與區間查詢為 O(log n + K)。
+    """
+    stages_by_item: dict  # {道具: (關卡, ...)}，依效率由高到低
+    efficiency_by_item: dict  # {道具: (效率, ...)}，與 stages_by_item 對齊
+    items_by_stage: dict  # {關卡: {道具: 效率}}
+
+    def top(self, item, k):
+        """效率最高的前 k 個關卡，回傳 [(關卡, 效率), ...]。"""
+        stages = self.stages_by_item.get(item, ())
+        return list(zip(stages[:k], self.efficiency_by_item[item][:k])) if stages else []
+
+    def between(self, item, low=None, high=None):
+        """效率介於 [low, high] 的關卡（未給的一側不設限），依效率由高到低。"""
+        stages = self.stages_by_item.get(item)
+        if not stages:
+            return []
+        efficiencies = self.efficiency_by_item[item]
+        # 效率為遞減排列，以負值做二分搜尋
+        start = 0 if high is None else bisect_left(efficiencies, -high, key=lambda e: -e)
+        stop = len(efficiencies) if low is None else bisect_right(efficiencies, -low, key=lambda e: -e)
+        return list(zip(stages[start:stop], efficiencies[start:stop]))
+
+    def above(self, item, threshold):
+        """效率高於 threshold 的關卡，依效率由高到低。"""
+        return [(stage, e) for stage, e in self.between(item, low=threshold) if e > threshold]
+
+    def items_for_stage(self, stage):
+        """某關卡會掉落的道具及其效率。"""
+        return dict(self.items_by_stage.get(stage, {}))
+
+def build_efficiency_index(all_items_efficiency):
+    """由 calculate_ev_per_stamina 的結果建立 EfficiencyIndex。"""
+    stages_by_item = {}
+    efficiency_by_item = {}
+    items_by_stage = defaultdict(dict)
+    for item, stages in all_items_efficiency.items():
+        ranked = sorted(stages.items(), key=lambda pair: -pair[1])
+        stages_by_item[item] = tuple(stage for stage, _ in ranked)
+        efficiency_by_item[item] = tuple(efficiency for _, efficiency in ranked)
+        for stage, efficiency in stages.items():
+            items_by_stage[stage][item] = efficiency
+    return EfficiencyIndex(stages_by_item, efficiency_by_item, dict(items_by_stage))
+
+_efficiency_indexes = OrderedDict()
+
+def get_efficiency_index(game_data=None, cache_dir=None):
+    """取得效率索引；以所有關卡的內容雜湊為鍵快取，掉落表未變動時直接沿用。"""
+    if game_data is None:
+        game_data = GAME_DATA
+    key = _game_data_key(game_data)
+    if key in _efficiency_indexes:
+        _efficiency_indexes.move_to_end(key)
+        return _efficiency_indexes[key]
+    index = build_efficiency_index(cached_ev_per_stamina(game_data, cache_dir))
+    _efficiency_indexes[key] = index
+    while len(_efficiency_indexes) > EV_CACHE_SIZE:
+        _efficiency_indexes.popitem(last=False)
+    return index
+
+# --- 掉落率敏感度分析 ---
+# 體力效率 = Σ 數量 × 機率 × 份數 / 體力，對每一格的機率與數量都是線性的：
+# 梯度是常數，改變一格只會影響該格道具在該關卡的效率，因此翻轉最佳關卡的門檻可以直接算出，
+# 套用修改時也只需重新計算被修改的關卡。
+
+def _flip_threshold(stages, stage_name):
+    """
+    回傳 (效率需要改變多少才會讓最佳關卡改變, 翻轉後的最佳關卡)。
+    stage_name 是最佳關卡時為降到第二名所需的（負）變化量，否則為超過最佳關卡所需的變化量；
+    只有一個關卡掉落此道具時回傳 (None, None)。
+    """
+    best = max(stages, key=stages.get)
+    if stage_name != best:
+        return stages[best] - stages[stage_name], stage_name
+    others = {name: value for name, value in stages.items() if name != stage_name}
+    if not others:
+        return None, None
+    runner_up = max(others, key=others.get)
+    return others[runner_up] - stages[stage_name], runner_up
+
+def rate_sensitivity(game_data=None, all_items_efficiency=None):
+    """
+    計算每個關卡、每種掉落類型中每一格的敏感度，回傳列表，每列為
+    {'stage', 'drop_type', 'entry', 'item', 'prob', 'quantity', 'grad_prob', 'grad_quantity',
+     'best_stage', 'prob_to_flip', 'quantity_to_flip', 'flip_stage'}。
+    grad_prob / grad_quantity 為該道具在該關卡的體力效率對這一格機率／數量的偏微分；
+    prob_to_flip / quantity_to_flip 為讓此道具的最佳關卡改變所需的變化量（正為增加、負為減少），
+    在合法範圍內（機率 0~1、數量 >= 0）無法翻轉時為 None，為 0 時表示已與其他關卡同效率；
+    flip_stage 為翻轉後的最佳關卡。
+    """
+    if game_data is None:
+        game_data = GAME_DATA
+    if all_items_efficiency is None:
+        all_items_efficiency = cached_ev_per_stamina(game_data)
+    records = []
+    for boss, difficulties in game_data.items():
+        for difficulty, details in difficulties.items():
+            stage_name = f"{boss}-{difficulty}"
+            for drop_type, drop_data in details['drops'].items():
+                for entry, item_drop in enumerate(drop_data['pool']):
+                    item, quantity, prob = item_drop['item'], item_drop['quantity'], item_drop['prob']
+                    stages = all_items_efficiency[item]
+                    grad_prob = quantity * drop_data['rolls'] / details['stamina']
+                    grad_quantity = prob * drop_data['rolls'] / details['stamina']
+                    delta, flip_stage = _flip_threshold(stages, stage_name)
+                    prob_to_flip = quantity_to_flip = None
+                    if delta is not None and grad_prob > 0 and 0 <= prob + delta / grad_prob <= 1:
+                        prob_to_flip = delta / grad_prob
+                    if delta is not None and grad_quantity > 0 and quantity + delta / grad_quantity >= 0:
+                        quantity_to_flip = delta / grad_quantity
+                    records.append({
+                        'stage': stage_name,
+                        'drop_type': drop_type,
+                        'entry': entry,
+                        'item': item,
+                        'prob': prob,
+                        'quantity': quantity,
+                        'grad_prob': grad_prob,
+                        'grad_quantity': grad_quantity,
+                        'best_stage': max(stages, key=stages.get),
+                        'prob_to_flip': prob_to_flip,
+                        'quantity_to_flip': quantity_to_flip,
+                        'flip_stage': flip_stage if prob_to_flip is not None or quantity_to_flip is not None else None,
+                    })
+    return records
+
+def apply_stage_change(all_items_efficiency, best_stages, boss, difficulty, details):
+    """
+    關卡 boss-difficulty 的數據改為 details 後，只重新計算這個關卡的效率，
+    並只為這個關卡會掉落（或原本會掉落）的道具重新找最佳關卡。
+    就地更新 all_items_efficiency 與 best_stages，
+    回傳最佳關卡有改變的 [(道具, 舊的 (關卡, 效率) 或 None, 新的 (關卡, 效率) 或 None), ...]。
+    """
+    stage_name = f"{boss}-{difficulty}"
+    _, efficiency = _stage_efficiency(boss, difficulty, details)
+    updated = dict(efficiency)
+    affected = [item for item, stages in all_items_efficiency.items() if stage_name in stages]
+    affected += [item for item in updated if item not in affected]
+    changes = []
+    for item in affected:
+        stages = all_items_efficiency.setdefault(item, {})
+        if item in updated:
+            stages[stage_name] = updated[item]
+        else:
+            stages.pop(stage_name, None)
+        old = best_stages.get(item)
+        new = find_best_stage({item: stages}).get(item)
+        if new is None:
+            best_stages.pop(item, None)
+            del all_items_efficiency[item]
+        else:
+            best_stages[item] = new
+        if (old[0] if old else None) != (new[0] if new else None):
+            changes.append((item, old, new))
+    return changes
+
+def what_if(changes, game_data=None):
+    """
+    試算修改掉落率後最佳關卡的變化，不修改原本的數據。
+    changes 為 [(副本, 難度, 掉落類型, 格子序號, {'prob': 值, 'quantity': 值}), ...]，
+    回傳 (新的最佳關卡, [(道具, 舊, 新), ...])；找不到關卡或格子時回傳 None。
+    """
+    if game_data is None:
+        game_data = GAME_DATA
+    all_items_efficiency = cached_ev_per_stamina(game_data)
+    best_stages = find_best_stage(all_items_efficiency)
+    modified = {}
+    flipped = []
+    for boss, difficulty, drop_type, entry, values in changes:
+        details = modified.get((boss, difficulty)) or game_data.get(boss, {}).get(difficulty)
+        if details is None or drop_type not in details['drops'] or not 0 <= entry < len(details['drops'][drop_type]['pool']):
+            print("錯誤：找不到指定的關卡或掉落格。請檢查輸入是否正確。")
+            return None
+        # 只複製被修改的掉落類型，其餘共用原本的數據
+        pool = list(details['drops'][drop_type]['pool'])
+        pool[entry] = {**pool[entry], **values}
+        drops = {**details['drops'], drop_type: {**details['drops'][drop_type], 'pool': pool}}
+        details = modified[(boss, difficulty)] = {**details, 'drops': drops}
+        flipped += apply_stage_change(all_items_efficiency, best_stages, boss, difficulty, details)
+    return best_stages, flipped
+
+# --- 掉落模擬 ---
+
+def simulate_runs(boss, difficulty, num_runs, seed=None, engine='auto', workers=None, verbose=True,
+                  histogram=False, window_runs=None):
     """
     根據指定的關卡和次數進行模擬掉落。
+    engine: 'auto' 有安裝 numpy 時使用批次引擎，否則使用逐次模擬；也可指定 'numpy' 或 'python'。
+    workers 大於 1 時以多行程平行模擬（需要 numpy，不能與 engine='python' 同時指定）。verbose=False 時不印出進度訊息。
+    histogram=True 時另外記錄每場與每 window_runs 場累計掉落的直方圖，回傳 (掉落物總計, 消耗體力, LootHistogram)；
+    直方圖需要 numpy，一律使用批次引擎。num_runs 為負數時拋出 ValueError。
     """
+    if num_runs < 0:
+        raise ValueError(f"模擬次數不可為負數：{num_runs}")
     if boss not in GAME_DATA or difficulty not in GAME_DATA[boss]:
         print("錯誤：找不到指定的關卡。請檢查輸入是否正確。")
-        return None, 0
-    stage_data = GAME_DATA[boss][difficulty]
-    stamina_cost = stage_data['stamina']
-    total_stamina_spent = stamina_cost * num_runs
+        return (None, 0, None) if histogram else (None, 0)
+    if engine == 'python' and workers is not None and workers > 1:
+        raise ValueError("python 引擎不支援多行程平行模擬，請改用 numpy 引擎或不指定 workers")
+    if engine == 'auto':
+        engine = 'numpy' if np is not None else 'python'
+    if verbose:
+        print(f"\n--- 正在模擬【{boss}-{difficulty}】共 {num_runs} 次 ---")
+    if histogram:
+        if workers is not None and workers > 1:
+            return simulate_runs_parallel(
+                boss, difficulty, num_runs, seed=seed, workers=workers, per_run='histogram', window_runs=window_runs
+            )
+        return simulate_runs_batch(boss, difficulty, num_runs, seed=seed, per_run='histogram', window_runs=window_runs)
+    if workers is not None and workers > 1:
+        total_loot, total_stamina_spent, _ = simulate_runs_parallel(
+            boss, difficulty, num_runs, seed=seed, workers=workers, per_run=False
+        )
+        return total_loot, total_stamina_spent
+    if engine == 'numpy':
+        total_loot, total_stamina_spent, _ = simulate_runs_batch(boss, difficulty, num_runs, seed=seed, per_run=False)
+        return total_loot, total_stamina_spent
+    return _simulate_runs_python(boss, difficulty, num_runs, seed)
+
+def _loot_by_name(totals, item_ids, item_names):
+    """將以道具 ID 索引的總計轉回 {道具名稱: 數量}，略過數量為 0 的道具。"""
     total_loot = defaultdict(int)
-    print(f"\n--- 正在模擬【{boss}-{difficulty}】共 {num_runs} 次 ---")
+    for item_id in item_ids:
+        if totals[item_id] > 0:
+            total_loot[item_names[item_id]] = int(totals[item_id])
+    return total_loot
+
+def _simulate_runs_python(boss, difficulty, num_runs, seed=None):
+    """
+    逐次模擬：每一場、每種掉落類型、每一份都各抽一次。
+    """
+    rand = random.Random(seed) if seed is not None else random
+    compiled = get_compiled_game_data()
+    stage = compiled.stage(boss, difficulty)
+    total_stamina_spent = stage.stamina * num_runs
+    totals = [0] * len(compiled.item_names)
     for _ in range(num_runs):
-        for drop_type, drop_data in stage_data['drops'].items():
-            rolls = drop_data['rolls']
-            pool = drop_data['pool']
-            population = pool
-            weights = [d['prob'] for d in pool]
-
-            # 【*** 此處為本次修改的核心 ***】
-            # 檢查是否為組合包 (總機率 > 1.01)
-            if sum(weights) > 1.01:
+        for pool in stage.pools:
+            if pool.is_bundle:
                 # 如果是組合包，直接給予所有物品
-                for _ in range(rolls): # 處理掉落份數
-                    for item_drop in pool:
-                        total_loot[item_drop['item']] += item_drop['quantity']
+                for _ in range(pool.rolls): # 處理掉落份數
+                    for item_id, quantity in pool.loot:
+                        totals[item_id] += quantity
+            elif pool.total_weight > 0:
+                # 否則，使用原始的機率抽獎邏輯（池子是空的或所有機率都是0時直接跳過）
+                for item_id, quantity in rand.choices(pool.loot, cum_weights=pool.cum_weights, k=pool.rolls):
+                    totals[item_id] += quantity
+    return _loot_by_name(totals, stage.item_ids, compiled.item_names), total_stamina_spent
+
+def _require_numpy():
+    """確認 numpy 可用，批次引擎相關功能都依賴它。"""
+    if np is None:
+        raise RuntimeError("此功能需要安裝 numpy（pip install numpy）")
+
+def _pool_picks(pool, draws):
+    """
+    將 [0, 1) 亂數陣列轉成抽中的格子序號：在累積權重上抽獎，等同 random.choices 的抽法
+    （機率總和不為 1 時同樣會被正規化）。先查表，只有跨越邊界的格子才二分搜尋。
+    """
+    num_entries = len(pool.cum_weights)
+    guide_picks, guide_ambiguous = pool.guide
+    draws = draws * pool.total_weight
+    cells = np.minimum((draws * (GUIDE_TABLE_SIZE / pool.total_weight)).astype(np.intp), GUIDE_TABLE_SIZE - 1)
+    picks = guide_picks[cells]
+    ambiguous = guide_ambiguous[cells]
+    picks[ambiguous] = np.minimum(
+        np.searchsorted(pool.cum_weights_array, draws[ambiguous], side='right'), num_entries - 1
+    )
+    return picks
+
+def _draw_batch_chunk(stage, num_runs, rng, uniforms=None):
+    """
+    一次抽出 num_runs 場的所有掉落，回傳形狀為 (關卡道具數, 場次) 的每場數量陣列，
+    列的順序與 stage.item_ids 相同。
+    uniforms 可提供與 stage.pools 對齊、形狀為 (場次, 份數) 的 [0, 1) 亂數陣列，
+    用來代替 rng 抽出的亂數（變異數縮減模式使用）。
+    """
+    per_run = np.zeros((len(stage.item_ids), num_runs), dtype=np.int64)
+    for position, pool in enumerate(stage.pools):
+        if pool.is_bundle:
+            # 組合包：每一份都直接給予所有物品
+            for row, quantity in zip(pool.rows, pool.quantities):
+                per_run[row] += quantity * pool.rolls
+            continue
+        if pool.guide is None:
+            # 池子是空的或所有機率都是0，就跳過
+            continue
+        num_entries = len(pool.cum_weights)
+        draws = rng.random((num_runs, pool.rolls)) if uniforms is None else uniforms[position]
+        picks = _pool_picks(pool, draws)
+        offsets = np.arange(num_runs, dtype=np.intp)[:, None] * num_entries
+        counts = np.bincount((offsets + picks).ravel(), minlength=num_runs * num_entries)
+        counts = counts.reshape(num_runs, num_entries)
+        for entry, (row, quantity) in enumerate(zip(pool.rows, pool.quantities)):
+            per_run[row] += counts[:, entry] * quantity
+    return per_run
+
+def _stage_max_per_run(stage):
+    """單場任一道具可能的最大掉落數。"""
+    max_per_run = 0
+    for pool in stage.pools:
+        if pool.quantities:
+            max_per_run += pool.rolls * (sum(pool.quantities) if pool.is_bundle else max(pool.quantities))
+    return max_per_run
+
+def simulate_runs_batch(boss, difficulty, num_runs, seed=None, per_run=True, window_runs=None):
+    """
+    批次模擬引擎：一次抽出所有場次的掉落，不再逐次呼叫 random.choices。
+    回傳 (掉落物總計, 消耗體力, 每場掉落陣列)。
+    每場掉落陣列為 {道具: 長度 num_runs 的 numpy 陣列}，可直接拿來做統計；
+    per_run=False 時每個掉落池只做一次多項分布抽樣，只回傳總計（第三項為 None）；
+    per_run='histogram' 時第三項改為 LootHistogram，記憶體用量不隨場數增加，
+    window_runs 為其區間累計的區間長度（預設 HISTOGRAM_WINDOW_RUNS）。
+    """
+    if boss not in GAME_DATA or difficulty not in GAME_DATA[boss]:
+        print("錯誤：找不到指定的關卡。請檢查輸入是否正確。")
+        return None, 0, None
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    compiled = get_compiled_game_data()
+    stage = compiled.stage(boss, difficulty)
+    num_items = len(compiled.item_names)
+    total_stamina_spent = stage.stamina * num_runs
+    totals = np.zeros(num_items, dtype=np.int64)
+    per_run_loot = None
+
+    if per_run == 'histogram':
+        per_run_loot = LootHistogram(
+            [compiled.item_names[item_id] for item_id in stage.item_ids], _stage_max_per_run(stage),
+            window_runs or HISTOGRAM_WINDOW_RUNS,
+        )
+        rows = np.array(stage.item_ids, dtype=np.intp)
+        for start in range(0, num_runs, BATCH_CHUNK_RUNS):
+            chunk = _draw_batch_chunk(stage, min(BATCH_CHUNK_RUNS, num_runs - start), rng)
+            per_run_loot.update(chunk)
+            totals[rows] += chunk.sum(axis=1)
+    elif not per_run:
+        # N 場共 N*份數 次獨立抽獎，各格子的命中次數服從多項分布，可一次抽出
+        for pool in stage.pools:
+            if pool.is_bundle:
+                np.add.at(totals, pool.item_ids_array, pool.quantities_array * pool.rolls * num_runs)
+                continue
+            if pool.guide is None:
+                continue
+            probs = np.diff(pool.cum_weights_array, prepend=0.0) / pool.total_weight
+            counts = rng.multinomial(num_runs * pool.rolls, probs)
+            np.add.at(totals, pool.item_ids_array, counts * pool.quantities_array)
+    else:
+        # 每場各道具的數量上限很小，用最小的整數型別存放以節省記憶體
+        max_per_run = _stage_max_per_run(stage)
+        per_run_matrix = np.zeros((len(stage.item_ids), num_runs), dtype=np.min_scalar_type(max_per_run))
+        rows = np.array(stage.item_ids, dtype=np.intp)
+        for start in range(0, num_runs, BATCH_CHUNK_RUNS):
+            chunk_runs = min(BATCH_CHUNK_RUNS, num_runs - start)
+            chunk = _draw_batch_chunk(stage, chunk_runs, rng)
+            per_run_matrix[:, start:start + chunk_runs] = chunk
+            totals[rows] += chunk.sum(axis=1)
+        per_run_loot = {compiled.item_names[item_id]: per_run_matrix[row] for row, item_id in enumerate(stage.item_ids)}
+
+    return _loot_by_name(totals, stage.item_ids, compiled.item_names), total_stamina_spent, per_run_loot
+
+# --- 每場掉落直方圖 ---
+
+# 區間累計直方圖預設的區間長度：記錄每連續 100 場累計掉落的分布
+HISTOGRAM_WINDOW_RUNS = 100
+# 連續未掉落場數以 2 的次方分桶，第 k 桶為 [2^k, 2^(k+1)) 場
+HISTOGRAM_STREAK_BINS = 64
+# 區間累計直方圖所有道具合計的格子數上限（int64 約 64 MB）；格子數約為 道具數 × 單場上限 × window_runs
+HISTOGRAM_MAX_WINDOW_CELLS = 1 << 23
+
+def _check_window_runs(num_items, max_per_run, window_runs):
+    """window_runs 必須是正整數，且區間累計直方圖的大小不超過 HISTOGRAM_MAX_WINDOW_CELLS，否則拋出 ValueError。"""
+    if isinstance(window_runs, bool) or not isinstance(window_runs, int) or window_runs < 1:
+        raise ValueError(f"window_runs 必須是正整數：{window_runs}")
+    if num_items * (max_per_run * window_runs + 1) > HISTOGRAM_MAX_WINDOW_CELLS:
+        limit = max(1, (HISTOGRAM_MAX_WINDOW_CELLS // max(num_items, 1) - 1) // max(max_per_run, 1))
+        raise ValueError(f"window_runs 過大：{window_runs}（此關卡最多 {limit}）")
+
+def _streak_bins(lengths):
+    """連續未掉落場數（皆 >= 1）所屬的桶。"""
+    return np.minimum(np.frexp(np.asarray(lengths, dtype=np.float64))[1] - 1, HISTOGRAM_STREAK_BINS - 1)
+
+def _histogram_quantile(counts, q):
+    """由計數陣列求第 q 分位數所在的格子，沒有資料時回傳 None。"""
+    cumulative = np.cumsum(counts)
+    if cumulative[-1] == 0:
+        return None
+    return int(np.searchsorted(cumulative, q * cumulative[-1], side='left'))
+
+class LootHistogram:
+    """
+    以固定大小的計數陣列記錄各道具的掉落分布，記憶體用量與模擬場數無關：
+    - per_run[i, q]：道具 i 單場掉落 q 個的場數
+    - window[i, q]：每連續 window_runs 場（從第一場起對齊）累計掉落 q 個的區間數
+    - dry_streaks[i, k]：連續未掉落場數落在第 k 桶的次數（見 HISTOGRAM_STREAK_BINS）
+    依場次順序以 update() 加入每批結果；merge() 接上緊接在後的另一段模擬，
+    交界處的連續未掉落會正確相接，因此依順序合併的結果與單一行程一次跑完完全相同。
+    """
+    __slots__ = ('items', 'window_runs', 'runs', 'per_run', 'window', 'dry_streaks', 'longest_dry',
+                 'head_dry', 'tail_dry', 'pending', 'pending_runs')
+
+    def __init__(self, items, max_per_run, window_runs=HISTOGRAM_WINDOW_RUNS):
+        _require_numpy()
+        num_items = len(items)
+        _check_window_runs(num_items, max_per_run, window_runs)
+        self.items = tuple(items)
+        self.window_runs = window_runs
+        self.runs = 0
+        self.per_run = np.zeros((num_items, max_per_run + 1), dtype=np.int64)
+        self.window = np.zeros((num_items, max_per_run * window_runs + 1), dtype=np.int64)
+        self.dry_streaks = np.zeros((num_items, HISTOGRAM_STREAK_BINS), dtype=np.int64)
+        # 以下只計入兩端都已結束的連續未掉落；開頭與結尾尚未結束的部分另外記錄，合併時再相接
+        self.longest_dry = np.zeros(num_items, dtype=np.int64)
+        self.head_dry = np.zeros(num_items, dtype=np.int64)
+        self.tail_dry = np.zeros(num_items, dtype=np.int64)
+        # 最後一個未滿 window_runs 場的區間累計
+        self.pending = np.zeros(num_items, dtype=np.int64)
+        self.pending_runs = 0
+
+    def update(self, chunk):
+        """依場次順序加入一批形狀為 (道具數, 場次) 的每場掉落陣列。"""
+        num_items, num_runs = chunk.shape
+        if num_runs == 0:
+            return
+        head = np.full(num_items, num_runs, dtype=np.int64)
+        tail = np.full(num_items, num_runs, dtype=np.int64)
+        dry_streaks = np.zeros_like(self.dry_streaks)
+        longest_dry = np.zeros(num_items, dtype=np.int64)
+        for row in range(num_items):
+            self.per_run[row] += np.bincount(chunk[row], minlength=self.per_run.shape[1])
+            hits = np.flatnonzero(chunk[row])
+            if hits.size == 0:
+                continue
+            head[row] = hits[0]
+            tail[row] = num_runs - 1 - hits[-1]
+            gaps = np.diff(hits) - 1
+            gaps = gaps[gaps > 0]
+            if gaps.size:
+                dry_streaks[row] = np.bincount(_streak_bins(gaps), minlength=HISTOGRAM_STREAK_BINS)
+                longest_dry[row] = gaps.max()
+        self._update_windows(chunk)
+        self._join_streaks(head, tail, dry_streaks, longest_dry, num_runs)
+        self.runs += num_runs
+
+    def _update_windows(self, chunk):
+        num_items, num_runs = chunk.shape
+        start = 0
+        if self.pending_runs:
+            # 先補滿上一批留下的未滿區間
+            start = min(self.window_runs - self.pending_runs, num_runs)
+            self.pending += chunk[:, :start].sum(axis=1)
+            self.pending_runs += start
+            if self.pending_runs < self.window_runs:
+                return
+            self.window[np.arange(num_items), self.pending] += 1
+            self.pending = np.zeros(num_items, dtype=np.int64)
+            self.pending_runs = 0
+        full = (num_runs - start) // self.window_runs
+        stop = start + full * self.window_runs
+        if full:
+            sums = chunk[:, start:stop].reshape(num_items, full, self.window_runs).sum(axis=2)
+            for row in range(num_items):
+                self.window[row] += np.bincount(sums[row], minlength=self.window.shape[1])
+        self.pending = chunk[:, stop:].sum(axis=1).astype(np.int64)
+        self.pending_runs = num_runs - stop
+
+    def _join_streaks(self, head, tail, dry_streaks, longest_dry, num_runs):
+        """接上緊接在後、共 num_runs 場的一段的連續未掉落資訊。"""
+        self.dry_streaks += dry_streaks
+        np.maximum(self.longest_dry, longest_dry, out=self.longest_dry)
+        self_all_dry = self.head_dry == self.runs
+        other_all_dry = head == num_runs
+        # 前段結尾與後段開頭的連續未掉落在交界處相接；兩側都有掉落時才成為一段完整的紀錄
+        joined = self.tail_dry + head
+        closed = ~self_all_dry & ~other_all_dry & (joined > 0)
+        if closed.any():
+            rows = np.flatnonzero(closed)
+            np.add.at(self.dry_streaks, (rows, _streak_bins(joined[rows])), 1)
+            np.maximum(self.longest_dry, np.where(closed, joined, 0), out=self.longest_dry)
+        self.head_dry = np.where(self_all_dry, self.runs + head, self.head_dry)
+        self.tail_dry = np.where(other_all_dry, self.tail_dry + num_runs, tail)
+
+    def merge(self, other):
+        """
+        將緊接在本段之後模擬的另一段（例如下一個工作行程的結果）就地合併進來並回傳自己。
+        本段場數必須是 window_runs 的倍數，區間累計才能無損合併。
+        """
+        if other.items != self.items or other.window_runs != self.window_runs or other.per_run.shape != self.per_run.shape:
+            raise ValueError("直方圖的道具或區間長度不同，無法合併")
+        if self.pending_runs and other.runs:
+            raise ValueError("前一段的場數不是 window_runs 的倍數，區間累計無法無損合併")
+        if other.runs == 0:
+            return self
+        self.per_run += other.per_run
+        self.window += other.window
+        self._join_streaks(other.head_dry, other.tail_dry, other.dry_streaks, other.longest_dry, other.runs)
+        self.pending = other.pending.copy()
+        self.pending_runs = other.pending_runs
+        self.runs += other.runs
+        return self
+
+    def _all_dry_streaks(self, row):
+        """含開頭與結尾尚未結束部分的連續未掉落分桶計數。"""
+        counts = self.dry_streaks[row].copy()
+        edges = [self.head_dry[row]] if self.head_dry[row] == self.runs else [self.head_dry[row], self.tail_dry[row]]
+        for length in edges:
+            if length > 0:
+                counts[_streak_bins(length)] += 1
+        return counts
+
+    def summary(self, quantiles=(0.01, 0.5, 0.99)):
+        """
+        各道具的摘要：{道具: {'mean', 'per_run': {分位: 數量}, 'window': {分位: 數量}, 'worst_window', 'longest_dry'}}。
+        window 為每 window_runs 場累計數量的分位數，worst_window 為最差的一個區間。
+        """
+        result = {}
+        for row, item in enumerate(self.items):
+            values = np.arange(self.per_run.shape[1])
+            windows = np.flatnonzero(self.window[row])
+            result[item] = {
+                'mean': float(self.per_run[row] @ values / self.runs) if self.runs else 0.0,
+                'per_run': {q: _histogram_quantile(self.per_run[row], q) for q in quantiles},
+                'window': {q: _histogram_quantile(self.window[row], q) for q in quantiles},
+                'worst_window': int(windows[0]) if windows.size else None,
+                'longest_dry': int(max(self.longest_dry[row], self.head_dry[row], self.tail_dry[row])),
+            }
+        return result
+
+    def to_dict(self):
+        """可直接存成 JSON 的完整計數；各計數列表去掉結尾的 0。"""
+        def trimmed(counts):
+            nonzero = np.flatnonzero(counts)
+            return counts[:nonzero[-1] + 1].tolist() if nonzero.size else []
+
+        return {
+            'runs': self.runs,
+            'window_runs': self.window_runs,
+            'items': {
+                item: {
+                    'per_run': trimmed(self.per_run[row]),
+                    'window': trimmed(self.window[row]),
+                    'dry_streaks': trimmed(self._all_dry_streaks(row)),
+                    'longest_dry': int(max(self.longest_dry[row], self.head_dry[row], self.tail_dry[row])),
+                }
+                for row, item in enumerate(self.items)
+            },
+        }
+
+# --- 多行程平行模擬 ---
+
+def _split_runs(num_runs, workers):
+    """將 num_runs 平均分給 workers 個工作行程，前面的行程多分到餘數。"""
+    share, remainder = divmod(num_runs, workers)
+    return [share + (1 if k < remainder else 0) for k in range(workers)]
+
+def _simulate_worker(boss, difficulty, num_runs, seed_sequence, per_run, window_runs=None):
+    """工作行程的進入點：以分配到的獨立亂數流執行批次模擬，回傳以道具名稱為鍵的總計與每場陣列（或直方圖）。"""
+    total_loot, _, per_run_loot = simulate_runs_batch(
+        boss, difficulty, num_runs, seed=seed_sequence, per_run=per_run, window_runs=window_runs
+    )
+    return dict(total_loot), per_run_loot
+
+def simulate_runs_parallel(boss, difficulty, num_runs, seed=None, workers=None, per_run=True, executor=None,
+                           window_runs=None):
+    """
+    將模擬分給多個行程執行。由單一 seed 以 SeedSequence.spawn 產生各行程獨立的亂數流，
+    最後依行程順序合併，因此相同 seed 與 workers 數量的結果完全一致。
+    executor 可傳入既有的 ProcessPoolExecutor 重複使用；回傳值與 simulate_runs_batch 相同。
+    per_run='histogram' 時各行程分到的場數會對齊 window_runs，直方圖依行程順序無損合併；
+    window_runs 過大（見 HISTOGRAM_MAX_WINDOW_CELLS）時在分派工作前就拋出 ValueError。
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    if boss not in GAME_DATA or difficulty not in GAME_DATA[boss]:
+        print("錯誤：找不到指定的關卡。請檢查輸入是否正確。")
+        return None, 0, None
+    _require_numpy()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, num_runs)) if num_runs else 1
+    seed_sequence = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    if per_run == 'histogram':
+        # 除了最後一個行程，分到的場數都是區間長度的倍數，區間累計才能跨行程相接
+        window_runs = window_runs or HISTOGRAM_WINDOW_RUNS
+        stage = get_compiled_game_data().stage(boss, difficulty)
+        _check_window_runs(len(stage.item_ids), _stage_max_per_run(stage), window_runs)
+        windows, remainder = divmod(num_runs, window_runs)
+        shares = [share * window_runs for share in _split_runs(windows, workers)]
+        shares[-1] += remainder
+    else:
+        shares = _split_runs(num_runs, workers)
+    children = seed_sequence.spawn(workers)
+    jobs = [(boss, difficulty, share, child, per_run, window_runs) for share, child in zip(shares, children)]
+
+    if workers == 1:
+        results = [_simulate_worker(*jobs[0])]
+    elif executor is not None:
+        results = list(executor.map(_simulate_worker, *zip(*jobs)))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simulate_worker, *zip(*jobs)))
+
+    total_loot = defaultdict(int)
+    for partial, _ in results:
+        for item, quantity in partial.items():
+            total_loot[item] += quantity
+    per_run_loot = None
+    if per_run == 'histogram':
+        per_run_loot = results[0][1]
+        for _, histogram in results[1:]:
+            per_run_loot.merge(histogram)
+    elif per_run:
+        stage = get_compiled_game_data().stage(boss, difficulty)
+        item_names = get_compiled_game_data().item_names
+        per_run_loot = {
+            item_names[item_id]: np.concatenate([arrays[item_names[item_id]] for _, arrays in results])
+            for item_id in stage.item_ids
+        }
+    stamina_cost = GAME_DATA[boss][difficulty]['stamina']
+    return total_loot, stamina_cost * num_runs, per_run_loot
+
+# --- 串流模擬與收斂回報 ---
+
+def simulate_runs_stream(boss, difficulty, num_runs, seed=None, chunk_runs=BATCH_CHUNK_RUNS,
+                         tolerance=None, relative=False, confidence=0.95, items=None):
+    """
+    分批模擬並以產生器逐批回報目前的累計結果，適合長時間的大量模擬。
+    每批產出 {'runs', 'stamina', 'totals', 'mean', 'stderr', 'runs_per_second', 'elapsed', 'converged'}，
+    mean / stderr 為每場平均掉落數與其標準誤。
+    tolerance 有給時，一旦所有追蹤道具的信賴區間半寬都小於 tolerance（relative=True 時為相對於平均值的比例）
+    就提前結束；items 可限定要追蹤的道具，預設為此關卡的所有道具。chunk_runs 必須至少為 1。
+    """
+    from statistics import NormalDist
+    if chunk_runs < 1:
+        raise ValueError(f"每批模擬次數必須至少為 1：{chunk_runs}")
+    if boss not in GAME_DATA or difficulty not in GAME_DATA[boss]:
+        print("錯誤：找不到指定的關卡。請檢查輸入是否正確。")
+        return
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    compiled = get_compiled_game_data()
+    stage = compiled.stage(boss, difficulty)
+    names = [compiled.item_names[item_id] for item_id in stage.item_ids]
+    tracked = [row for row, name in enumerate(names) if items is None or name in items]
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    sums = np.zeros(len(names), dtype=np.float64)
+    squares = np.zeros(len(names), dtype=np.float64)
+    done = 0
+    started = time.perf_counter()
+    while done < num_runs:
+        batch = min(chunk_runs, num_runs - done)
+        chunk = _draw_batch_chunk(stage, batch, rng)
+        sums += chunk.sum(axis=1)
+        squares += np.einsum('ij,ij->i', chunk, chunk, dtype=np.float64)
+        done += batch
+        elapsed = time.perf_counter() - started
+        mean = sums / done
+        variance = np.maximum(squares / done - mean ** 2, 0.0) * (done / (done - 1) if done > 1 else 0.0)
+        stderr = np.sqrt(variance / done)
+        half_width = z * stderr
+        if relative:
+            half_width = np.divide(half_width, mean, out=np.zeros_like(half_width), where=mean > 0)
+        converged = tolerance is not None and done > 1 and bool(np.all(half_width[tracked] < tolerance))
+        yield {
+            'runs': done,
+            'stamina': done * stage.stamina,
+            'totals': {name: int(sums[row]) for row, name in enumerate(names)},
+            'mean': {name: float(mean[row]) for row, name in enumerate(names)},
+            'stderr': {name: float(stderr[row]) for row, name in enumerate(names)},
+            'runs_per_second': done / elapsed if elapsed > 0 else float('inf'),
+            'elapsed': elapsed,
+            'converged': converged,
+        }
+        if converged:
+            return
+
+# --- 變異數縮減模擬 ---
+# 一般蒙地卡羅的誤差以 1/√N 收斂，低機率道具需要大量模擬才能估準。
+# 以下模式只改變每一份抽獎所用的 [0, 1) 亂數，每場的邊際分布仍與一般模擬相同。
+
+VARIANCE_REDUCTION_METHODS = ('plain', 'antithetic', 'stratified', 'halton')
+# 分層與準隨機模式以獨立重複組的平均值估計標準誤
+VARIANCE_REDUCTION_REPLICATES = 16
+
+def _first_primes(count):
+    """前 count 個質數，作為 Halton 序列各維度的底數。"""
+    primes = []
+    candidate = 2
+    while len(primes) < count:
+        if all(candidate % p for p in primes if p * p <= candidate):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+def _halton(start, num_points, dimensions):
+    """Halton 低差異序列第 start 到 start + num_points - 1 點，形狀為 (num_points, dimensions)。"""
+    points = np.zeros((num_points, dimensions))
+    indices = np.arange(start, start + num_points, dtype=np.int64)
+    for d, base in enumerate(_first_primes(dimensions)):
+        remaining = indices.copy()
+        factor = 1.0 / base
+        while remaining.any():
+            points[:, d] += factor * (remaining % base)
+            remaining //= base
+            factor /= base
+    return points
+
+def _split_uniforms(stage, matrix):
+    """將 (場次, 總維度) 的亂數矩陣依各掉落池的份數切開，與 stage.pools 對齊。"""
+    uniforms, column = [], 0
+    for pool in stage.pools:
+        if pool.is_bundle or pool.guide is None:
+            uniforms.append(None)
+            continue
+        uniforms.append(matrix[:, column:column + pool.rolls])
+        column += pool.rolls
+    return uniforms
+
+def _stage_dimensions(stage):
+    """單場需要的亂數個數（所有需要抽獎的掉落池份數總和）。"""
+    return sum(pool.rolls for pool in stage.pools if not pool.is_bundle and pool.guide is not None)
+
+def simulate_runs_variance_reduced(boss, difficulty, num_runs, method='antithetic', seed=None,
+                                   replicates=VARIANCE_REDUCTION_REPLICATES):
+    """
+    以變異數縮減的方式估計某關卡每場各道具的平均掉落數。
+    method: 'plain' 一般模擬；'antithetic' 每組亂數 u 搭配 1-u 成對模擬；
+    'stratified' 對每一份抽獎做拉丁超立方分層；'halton' 以隨機平移的 Halton 低差異序列取代亂數。
+    回傳 {'method', 'runs', 'mean', 'stderr', 'ess'}；ess 為有效樣本數，
+    即一般蒙地卡羅要達到相同標準誤所需的模擬次數。
+    估計標準誤至少需要兩個樣本：plain 至少 2 場、antithetic 至少 2 對（4 場），
+    stratified / halton 至少 2 組重複組、每組至少 2 場，不足時拋出 ValueError。
+    """
+    if boss not in GAME_DATA or difficulty not in GAME_DATA[boss]:
+        print("錯誤：找不到指定的關卡。請檢查輸入是否正確。")
+        return None
+    if method not in VARIANCE_REDUCTION_METHODS:
+        raise ValueError(f"未知的模擬方式：{method}（可用：{', '.join(VARIANCE_REDUCTION_METHODS)}）")
+    if method in ('plain', 'antithetic'):
+        minimum = 4 if method == 'antithetic' else 2
+        if num_runs < minimum:
+            raise ValueError(f"模擬次數太少，無法估計標準誤：{method} 至少需要 {minimum} 場")
+    elif replicates < 2:
+        raise ValueError(f"重複組太少，無法估計標準誤：{method} 至少需要 2 組重複組")
+    elif num_runs < 2 * replicates:
+        raise ValueError(f"模擬次數太少，無法估計標準誤：{method} 每組重複組至少需要 2 場（{replicates} 組共需 {2 * replicates} 場）")
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    compiled = get_compiled_game_data()
+    stage = compiled.stage(boss, difficulty)
+    names = [compiled.item_names[item_id] for item_id in stage.item_ids]
+    dimensions = _stage_dimensions(stage)
+    num_items = len(names)
+    # 每場數量的總和與平方和（用來估計單場變異數），以及估計標準誤用的「樣本」總和與平方和
+    run_sum = np.zeros(num_items)
+    run_squares = np.zeros(num_items)
+    sample_sum = np.zeros(num_items)
+    sample_squares = np.zeros(num_items)
+    num_samples = 0
+    done = 0
+
+    if method in ('plain', 'antithetic'):
+        # 成對模擬時以每對的平均值作為一個樣本
+        pair = 2 if method == 'antithetic' else 1
+        num_runs -= num_runs % pair
+        while done < num_runs:
+            batch = min(BATCH_CHUNK_RUNS, num_runs - done)
+            if method == 'antithetic':
+                half = rng.random((batch // 2, dimensions))
+                chunk = _draw_batch_chunk(stage, batch, rng, _split_uniforms(stage, np.vstack((half, 1.0 - half))))
+                samples = (chunk[:, :batch // 2] + chunk[:, batch // 2:]) / 2.0
+            else:
+                chunk = _draw_batch_chunk(stage, batch, rng)
+                samples = chunk
+            run_sum += chunk.sum(axis=1)
+            run_squares += np.einsum('ij,ij->i', chunk, chunk, dtype=np.float64)
+            sample_sum += samples.sum(axis=1)
+            sample_squares += np.einsum('ij,ij->i', samples, samples, dtype=np.float64)
+            num_samples += samples.shape[1]
+            done += batch
+    else:
+        # 分層與準隨機點彼此不獨立，改以 replicates 組獨立隨機化的重複組估計標準誤
+        per_replicate = num_runs // replicates
+        num_runs = per_replicate * replicates
+        points = _halton(1, per_replicate, dimensions) if method == 'halton' else None
+        for _ in range(replicates):
+            if method == 'halton':
+                # Cranley-Patterson 隨機平移，讓每組重複組都是不偏估計
+                matrix = (points + rng.random(dimensions)) % 1.0
+            else:
+                strata = np.argsort(rng.random((per_replicate, dimensions)), axis=0)
+                matrix = (strata + rng.random((per_replicate, dimensions))) / per_replicate
+            chunk = _draw_batch_chunk(stage, per_replicate, rng, _split_uniforms(stage, matrix))
+            replicate_mean = chunk.mean(axis=1)
+            run_sum += chunk.sum(axis=1)
+            run_squares += np.einsum('ij,ij->i', chunk, chunk, dtype=np.float64)
+            sample_sum += replicate_mean
+            sample_squares += replicate_mean ** 2
+            num_samples += 1
+        done = num_runs
+
+    mean = run_sum / done
+    run_variance = np.maximum(run_squares / done - mean ** 2, 0.0) * done / (done - 1)
+    sample_mean = sample_sum / num_samples
+    sample_variance = np.maximum(sample_squares / num_samples - sample_mean ** 2, 0.0) * num_samples / (num_samples - 1)
+    stderr = np.sqrt(sample_variance / num_samples)
+    # 標準誤為 0 時：單場數量本身固定（如組合包）則有效樣本數就是模擬次數，否則估計值已精確
+    ess = np.where(run_variance > 0, np.inf, float(done))
+    np.divide(run_variance, stderr ** 2, out=ess, where=stderr > 0)
+    return {
+        'method': method,
+        'runs': done,
+        'mean': {name: float(mean[row]) for row, name in enumerate(names)},
+        'stderr': {name: float(stderr[row]) for row, name in enumerate(names)},
+        'ess': {name: float(ess[row]) for row, name in enumerate(names)},
+    }
+
+# --- 精確掉落分布 ---
+# 不靠抽樣，直接由掉落池算出每場的數量分布，再以卷積求 N 場的總量分布。
+
+# 截斷卷積長度超過此值時改用 FFT，較短時直接卷積比較快也比較精確
+FFT_CONVOLVE_THRESHOLD = 512
+
+def _convolve(a, b, size=None):
+    """兩個機率質量函數的卷積；size 有給時只保留前 size 項（數量只會增加，截斷不影響較小值的機率）。"""
+    full_size = len(a) + len(b) - 1
+    if size is None or size > full_size:
+        size = full_size
+    if min(len(a), len(b), size) <= FFT_CONVOLVE_THRESHOLD:
+        result = np.convolve(a[:size], b[:size])[:size]
+    else:
+        fft_size = 1 << (full_size - 1).bit_length()
+        result = np.fft.irfft(np.fft.rfft(a, fft_size) * np.fft.rfft(b, fft_size), fft_size)[:size]
+        np.maximum(result, 0.0, out=result)
+    return result
+
+def _power_distribution(pmf, num_runs, size=None):
+    """以反覆平方求 pmf 的 num_runs 次卷積；size 有給時只計算前 size 項。"""
+    result = np.ones(1)
+    base = pmf if size is None else pmf[:size]
+    while num_runs:
+        if num_runs & 1:
+            result = _convolve(result, base, size)
+        num_runs >>= 1
+        if num_runs:
+            base = _convolve(base, base, size)
+    return result
+
+def _stage_or_none(boss, difficulty):
+    """找不到關卡時印出錯誤並回傳 None。"""
+    stage = get_compiled_game_data().stage(boss, difficulty)
+    if stage is None:
+        print("錯誤：找不到指定的關卡。請檢查輸入是否正確。")
+    return stage
+
+def _stage_item_distribution(stage, item_id):
+    """由編譯好的掉落表算出單場內某道具數量的機率質量函數（索引即數量）。"""
+    pmf = np.ones(1)
+    for pool in stage.pools:
+        if item_id not in pool.item_ids:
+            continue
+        if pool.is_bundle:
+            # 組合包的數量是固定的，相當於把分布整體平移
+            shift = pool.rolls * sum(q for i, q in pool.loot if i == item_id)
+            pmf = np.concatenate((np.zeros(shift), pmf))
+            continue
+        if pool.total_weight <= 0:
+            continue
+        # 與 random.choices 相同，機率總和不為 1 時以總和正規化
+        roll_pmf = np.zeros(max(q for i, q in pool.loot if i == item_id) + 1)
+        for (entry_item, quantity), prob in zip(pool.loot, pool.probs):
+            if entry_item == item_id:
+                roll_pmf[quantity] += prob / pool.total_weight
+        roll_pmf[0] += max(0.0, 1.0 - roll_pmf.sum())
+        pmf = _convolve(pmf, _power_distribution(roll_pmf, pool.rolls))
+    return pmf
+
+def per_run_distribution(boss, difficulty, item):
+    """
+    某關卡單場掉落某道具數量的精確分布，回傳 numpy 陣列，第 k 項為剛好掉 k 個的機率。
+    """
+    _require_numpy()
+    stage = _stage_or_none(boss, difficulty)
+    if stage is None:
+        return None
+    item_id = get_compiled_game_data().item_ids.get(item)
+    if item_id is None or item_id not in stage.item_ids:
+        return np.ones(1)
+    return _stage_item_distribution(stage, item_id)
+
+def loot_distribution(boss, difficulty, item, num_runs):
+    """
+    挑戰 num_runs 次後某道具總數量的精確分布（以 FFT 一次求出 num_runs 次卷積）。
+    """
+    pmf = per_run_distribution(boss, difficulty, item)
+    if pmf is None:
+        return None
+    support = (len(pmf) - 1) * num_runs + 1
+    if len(pmf) == 1 or num_runs == 0:
+        return np.ones(1)
+    fft_size = 1 << (support - 1).bit_length()
+    result = np.fft.irfft(np.fft.rfft(pmf, fft_size) ** num_runs, fft_size)[:support]
+    np.maximum(result, 0.0, out=result)
+    return result / result.sum()
+
+def distribution_percentile(pmf, q):
+    """回傳分布的第 q 分位數（0 < q <= 1），即累積機率達到 q 的最小數量。"""
+    cdf = np.cumsum(pmf)
+    return int(min(np.searchsorted(cdf, q * cdf[-1] - 1e-12), len(pmf) - 1))
+
+def prob_at_least(boss, difficulty, item, num_runs, target):
+    """
+    挑戰 num_runs 次後至少拿到 target 個道具的精確機率。
+    只需要小於 target 的部分分布，卷積全程截斷在 target 項。
+    """
+    pmf = per_run_distribution(boss, difficulty, item)
+    if pmf is None:
+        return None
+    if target <= 0:
+        return 1.0
+    below = _power_distribution(pmf, num_runs, size=target)
+    return float(min(1.0, max(0.0, 1.0 - below.sum())))
+
+def runs_needed(boss, difficulty, item, target, confidence=0.95, max_runs=10**7):
+    """
+    至少要挑戰幾次，才有 confidence 的機率拿到 target 個道具。
+    機率隨次數單調遞增，因此先倍增找上界再二分搜尋；超過 max_runs 仍達不到時回傳 None。
+    """
+    pmf = per_run_distribution(boss, difficulty, item)
+    if pmf is None or len(pmf) == 1:
+        return None
+    if target <= 0:
+        return 0
+
+    def reached(num_runs):
+        below = _power_distribution(pmf, num_runs, size=target)
+        return 1.0 - below.sum() >= confidence
+
+    low, high = 0, 1
+    while not reached(high):
+        low, high = high, high * 2
+        if low >= max_runs:
+            return None
+    while high - low > 1:
+        middle = (low + high) // 2
+        if reached(middle):
+            high = middle
+        else:
+            low = middle
+    return high if high <= max_runs else None
+
+# --- 多目標體力最佳化 ---
+# 以 calculate_ev_per_stamina 的效率矩陣建立線性規劃：
+#   最小化 Σ y_j（y_j 為投入關卡 j 的體力）
+#   限制   Σ_j 效率_ij * y_j >= 目標_i
+# 變數只有 20 個關卡，直接解它的對偶問題（原點即可行解，不需要兩階段單純形法）。
+
+LP_EPSILON = 1e-12
+# 機率限制模式最多調整目標的次數
+CHANCE_MAX_ITERATIONS = 50
+
+def _solve_min_stamina_lp(efficiency_rows, targets):
+    """
+    以單純形法解對偶問題 max Σ t_i u_i, s.t. Σ_i 效率_ij u_i <= 1, u >= 0。
+    efficiency_rows[j][i] 為關卡 j 對道具 i 的體力效率。
+    回傳每個關卡應投入的體力（即對偶問題鬆弛變數的檢驗數）；目標無法達成時回傳 None。
+    """
+    num_stages = len(efficiency_rows)
+    num_items = len(targets)
+    width = num_items + num_stages
+    tableau = []
+    for j, row in enumerate(efficiency_rows):
+        slack = [0.0] * num_stages
+        slack[j] = 1.0
+        tableau.append(list(row) + slack + [1.0])
+    objective = [-t for t in targets] + [0.0] * num_stages + [0.0]
+    basis = [num_items + j for j in range(num_stages)]
+    while True:
+        best_ratio = math.inf
+        # Bland 規則：取索引最小的負檢驗數入基，避免循環
+        entering = next((c for c in range(width) if objective[c] < -LP_EPSILON), None)
+        if entering is None:
+            break
+        leaving = None
+        for r, row in enumerate(tableau):
+            if row[entering] > LP_EPSILON:
+                ratio = row[-1] / row[entering]
+                if (leaving is None or ratio < best_ratio - LP_EPSILON
+                        or (abs(ratio - best_ratio) <= LP_EPSILON and basis[r] < basis[leaving])):
+                    leaving, best_ratio = r, ratio
+        if leaving is None:
+            # 對偶問題無界，代表原問題不可行
+            return None
+        pivot_row = tableau[leaving]
+        pivot = pivot_row[entering]
+        for c in range(width + 1):
+            pivot_row[c] /= pivot
+        for row in tableau + [objective]:
+            if row is not pivot_row and row[entering] != 0.0:
+                factor = row[entering]
+                for c in range(width + 1):
+                    row[c] -= factor * pivot_row[c]
+        basis[leaving] = entering
+    return [max(0.0, objective[num_items + j]) for j in range(num_stages)]
+
+def _plan_expected(stages, runs, item_ids):
+    """計算一組挑戰次數下，各道具的期望總數（依 item_ids 順序）。"""
+    expected = [0.0] * len(item_ids)
+    position = {item_id: i for i, item_id in enumerate(item_ids)}
+    for stage, stage_runs in zip(stages, runs):
+        if not stage_runs:
+            continue
+        for item_id, ev in stage.expected_loot:
+            if item_id in position:
+                expected[position[item_id]] += ev * stage_runs
+    return expected
+
+def _round_plan(stages, runs, item_ids, targets):
+    """
+    將線性規劃的挑戰次數無條件進位成整數，
+    再依體力消耗由高到低逐次減少，只要期望值仍達標就繼續減。
+    """
+    rounded = [math.ceil(r - 1e-9) for r in runs]
+    expected = _plan_expected(stages, rounded, item_ids)
+    position = {item_id: i for i, item_id in enumerate(item_ids)}
+    for j in sorted(range(len(stages)), key=lambda j: -stages[j].stamina):
+        stage_ev = [(position[item_id], ev) for item_id, ev in stages[j].expected_loot if item_id in position]
+        while rounded[j] > 0 and all(expected[i] - ev >= targets[i] - 1e-9 for i, ev in stage_ev):
+            rounded[j] -= 1
+            for i, ev in stage_ev:
+                expected[i] -= ev
+    return rounded
+
+def _chance_exact(stages, runs, item_ids, targets, confidence, pmf_cache):
+    """
+    以精確分布檢查每個道具「至少拿到目標數量」的機率。
+    回傳 (各道具達標機率, 各道具需要再補的數量)。
+    """
+    probabilities, shortfalls = [], []
+    for i, item_id in enumerate(item_ids):
+        size = int(targets[i])
+        if size <= 0:
+            # 目標為 0 一定達成，也沒有需要計算的截斷分布
+            probabilities.append(1.0)
+            shortfalls.append(0)
+            continue
+        below = np.ones(1)
+        for stage, stage_runs in zip(stages, runs):
+            if stage_runs and item_id in stage.item_ids:
+                key = (stage.boss, stage.difficulty, item_id)
+                if key not in pmf_cache:
+                    pmf_cache[key] = _stage_item_distribution(stage, item_id)
+                below = _convolve(below, _power_distribution(pmf_cache[key], stage_runs, size=size), size)
+        below = below[:size]
+        probability = float(min(1.0, max(0.0, 1.0 - below.sum())))
+        probabilities.append(probability)
+        if probability >= confidence or size == 0:
+            shortfalls.append(0)
+        else:
+            # 第 (1 - confidence) 分位數落在目標之下，差距即為需要補上的數量
+            quantile = int(np.searchsorted(np.cumsum(below), 1.0 - confidence))
+            shortfalls.append(max(1, size - quantile))
+    return probabilities, shortfalls
+
+def _chance_simulated(stages, runs, item_ids, targets, confidence, trials, rng):
+    """
+    以批次模擬估計整份計畫同時達成所有目標的機率。
+    回傳 (各道具達標機率, 各道具需要再補的數量, 同時達標機率)。
+    """
+    totals = np.zeros((len(item_ids), trials), dtype=np.int64)
+    position = {item_id: i for i, item_id in enumerate(item_ids)}
+    for stage, stage_runs in zip(stages, runs):
+        if not stage_runs:
+            continue
+        for start in range(0, trials, max(1, BATCH_CHUNK_RUNS // stage_runs)):
+            chunk_trials = min(max(1, BATCH_CHUNK_RUNS // stage_runs), trials - start)
+            chunk = _draw_batch_chunk(stage, chunk_trials * stage_runs, rng)
+            for row, item_id in enumerate(stage.item_ids):
+                if item_id in position:
+                    per_trial = chunk[row].reshape(chunk_trials, stage_runs).sum(axis=1)
+                    totals[position[item_id], start:start + chunk_trials] += per_trial
+    met = totals >= np.array(targets, dtype=np.float64)[:, None]
+    probabilities = [float(p) for p in met.mean(axis=1)]
+    joint = float(met.all(axis=0).mean())
+    shortfalls = []
+    for i in range(len(item_ids)):
+        quantile = np.quantile(totals[i], 1.0 - confidence, method='lower')
+        shortfalls.append(max(0, int(math.ceil(targets[i] - quantile))))
+    if joint < confidence and not any(shortfalls):
+        # 各道具單獨都達標但同時達標的機率不足：補強達標機率最低的道具
+        weakest = min(range(len(item_ids)), key=lambda i: probabilities[i])
+        shortfalls[weakest] = max(1, math.ceil(targets[weakest] * 0.02))
+    return probabilities, shortfalls, joint
+
+def optimize_farming(targets, stages=None, integer=True, confidence=None, method='exact', trials=2000, seed=None):
+    """
+    為多個道具目標找出總期望體力最低的刷關組合。
+    targets: {道具名稱: 目標數量}；stages: 可選的 (副本, 難度) 列表，預設為所有關卡。
+    integer=True 時挑戰次數為整數。confidence 有給時改為機率限制模式：
+    method='exact' 以精確分布要求每個道具各自有 confidence 的機率達標；
+    method='simulate' 以 trials 次模擬要求所有道具同時達標的機率達到 confidence。
+    回傳 {'runs': {關卡: 次數}, 'stamina': 總體力, 'expected': {道具: 期望數量}}，
+    機率限制模式另有 'probability'（以及 simulate 模式的 'joint_probability'）與 'confidence_met'；
+    調整 CHANCE_MAX_ITERATIONS 次仍未達到 confidence 時 'confidence_met' 為 False 並發出警告。
+    目標無法達成時回傳 None。
+    """
+    compiled = get_compiled_game_data()
+    if stages is None:
+        stage_tables = list(compiled.stages.values())
+    else:
+        stage_tables = [compiled.stage(boss, difficulty) for boss, difficulty in stages]
+        if any(stage is None for stage in stage_tables):
+            print("錯誤：找不到指定的關卡。請檢查輸入是否正確。")
+            return None
+    item_names = list(targets)
+    unknown = [name for name in item_names if name not in compiled.item_ids]
+    if unknown:
+        print(f"錯誤：找不到道具 {', '.join(unknown)}。")
+        return None
+    if confidence is not None:
+        _require_numpy()
+        integer = True  # 精確分布與模擬都需要整數挑戰次數
+        fractional = [name for name in item_names if targets[name] < 0 or not float(targets[name]).is_integer()]
+        if fractional:
+            print(f"錯誤：機率限制模式的目標數量必須是非負整數：{', '.join(fractional)}")
+            return None
+    item_ids = [compiled.item_ids[name] for name in item_names]
+    goal = [float(targets[name]) for name in item_names]
+    efficiency = calculate_ev_per_stamina(compiled)
+    efficiency_rows = [
+        [efficiency[name].get(stage.name, 0.0) for name in item_names]
+        for stage in stage_tables
+    ]
+
+    effective = list(goal)
+    pmf_cache = {}
+    rng = np.random.default_rng(seed) if confidence is not None and method == 'simulate' else None
+    probabilities = joint = None
+    for _ in range(CHANCE_MAX_ITERATIONS if confidence is not None else 1):
+        stamina = _solve_min_stamina_lp(efficiency_rows, effective)
+        if stamina is None:
+            print("錯誤：所選關卡無法達成目標。")
+            return None
+        runs = [y / stage.stamina for y, stage in zip(stamina, stage_tables)]
+        if integer:
+            runs = _round_plan(stage_tables, runs, item_ids, effective)
+        if confidence is None:
+            break
+        if method == 'simulate':
+            probabilities, shortfalls, joint = _chance_simulated(
+                stage_tables, runs, item_ids, goal, confidence, trials, rng
+            )
+            if joint >= confidence:
+                break
+        else:
+            probabilities, shortfalls = _chance_exact(
+                stage_tables, runs, item_ids, goal, confidence, pmf_cache
+            )
+            if not any(shortfalls):
+                break
+        effective = [e + s for e, s in zip(effective, shortfalls)]
+
+    expected = _plan_expected(stage_tables, runs, item_ids)
+    result = {
+        'runs': {stage.name: r for stage, r in zip(stage_tables, runs) if r > 0},
+        'stamina': sum(r * stage.stamina for stage, r in zip(stage_tables, runs)),
+        'expected': dict(zip(item_names, expected)),
+    }
+    if confidence is not None:
+        result['probability'] = dict(zip(item_names, probabilities))
+        if method == 'simulate':
+            result['joint_probability'] = joint
+            met = joint >= confidence
+        else:
+            met = all(p >= confidence for p in probabilities)
+        result['confidence_met'] = met
+        if not met:
+            warnings.warn(f"調整 {CHANCE_MAX_ITERATIONS} 次後仍未達到 {confidence:.2%} 的達標機率", stacklevel=2)
+    return result
+
+# --- 全關卡掃描 ---
+
+def _select_stages(bosses=None, difficulties=None):
+    """依副本與難度篩選關卡，保持 GAME_DATA 中的順序。"""
+    return [
+        stage for (boss, difficulty), stage in get_compiled_game_data().stages.items()
+        if (not bosses or boss in bosses) and (not difficulties or difficulty in difficulties)
+    ]
+
+def sweep_stages(total_stamina, bosses=None, difficulties=None, seed=None, workers=None):
+    """
+    以相同的體力預算一次模擬所有關卡（或篩選後的部分關卡）。
+    每個關卡以 SeedSequence 分到獨立的亂數流，所有關卡共用同一份編譯好的掉落表與同一個行程池。
+    沒有 numpy 時改以逐次模擬依序執行，各關卡的種子由 seed 衍生。
+    回傳列表，每列為 {'stage', 'runs', 'stamina', 'loot': {道具: 數量}, 'efficiency': {道具: 個/體力}}。
+    total_stamina 為負數時拋出 ValueError。
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    if total_stamina < 0:
+        raise ValueError(f"體力預算不可為負數：{total_stamina}")
+    stages = _select_stages(bosses, difficulties)
+    if np is None:
+        seeder = random.Random(seed) if seed is not None else None
+        totals = {
+            stage.name: _simulate_runs_python(
+                stage.boss, stage.difficulty, total_stamina // stage.stamina,
+                seeder.getrandbits(64) if seeder is not None else None,
+            )[0]
+            for stage in stages
+        }
+        return _sweep_table(stages, total_stamina, totals)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    stage_seeds = np.random.SeedSequence(seed).spawn(len(stages))
+
+    # 每個關卡再依 workers 切分，與 simulate_runs_parallel 使用相同的切分與亂數流
+    jobs = []
+    for stage, stage_seed in zip(stages, stage_seeds):
+        num_runs = total_stamina // stage.stamina
+        stage_workers = max(1, min(workers, num_runs))
+        for share, child in zip(_split_runs(num_runs, stage_workers), stage_seed.spawn(stage_workers)):
+            jobs.append((stage.boss, stage.difficulty, share, child, False))
+
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simulate_worker, *zip(*jobs)))
+    else:
+        results = [_simulate_worker(*job) for job in jobs]
+
+    totals = {stage.name: defaultdict(int) for stage in stages}
+    for (boss, difficulty, *_), (partial, _) in zip(jobs, results):
+        stage_totals = totals[f"{boss}-{difficulty}"]
+        for item, quantity in partial.items():
+            stage_totals[item] += quantity
+    return _sweep_table(stages, total_stamina, totals)
+
+def _sweep_table(stages, total_stamina, totals):
+    """將各關卡的掉落總計 {關卡: {道具: 數量}} 整理成 sweep_stages 的輸出列表。"""
+    table = []
+    for stage in stages:
+        num_runs = total_stamina // stage.stamina
+        stamina_spent = num_runs * stage.stamina
+        loot = dict(totals[stage.name])
+        table.append({
+            'stage': stage.name,
+            'runs': num_runs,
+            'stamina': stamina_spent,
+            'loot': loot,
+            'efficiency': {item: quantity / stamina_spent for item, quantity in loot.items()} if stamina_spent else {},
+        })
+    return table
+
+# --- 模擬與理論值比對 ---
+# 理論效率直接以原始機率計算期望值，模擬則以 random.choices 的方式抽獎（機率總和不為 1 時會被正規化，
+# 組合包則不看機率直接給予），兩者可能不一致。以下對每個關卡的每個道具做 z 檢定、
+# 對每個掉落池的各格命中次數做卡方適合度檢定，並以 Bonferroni 校正控制整體誤報率。
+
+VALIDATION_ALPHA = 0.001
+
+def _gammaincc(a, x):
+    """
+    正規化上不完全 Gamma 函數 Q(a, x)：x < a + 1 時以級數算出 P(a, x) 再取 1 - P，
+    否則以 Lentz 連分數直接計算 Q，兩者在各自的範圍內收斂快且不會損失尾端精度。
+    """
+    if x <= 0:
+        return 1.0
+    front = math.exp(a * math.log(x) - x - math.lgamma(a))
+    # x 接近 a 時兩種展開都要約 sqrt(a) 項才收斂
+    max_terms = 500 + int(20 * math.sqrt(a))
+    if x < a + 1:
+        term = total = 1.0 / a
+        for n in range(1, max_terms):
+            term *= x / (a + n)
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(0.0, 1.0 - front * total)
+    b = x + 1.0 - a
+    c, d = 1.0 / 1e-30, 1.0 / b
+    f = d
+    for i in range(1, max_terms):
+        numerator = -i * (i - a)
+        b += 2.0
+        d = numerator * d + b
+        d = 1.0 / (d if abs(d) > 1e-30 else 1e-30)
+        c = b + numerator / c
+        c = c if abs(c) > 1e-30 else 1e-30
+        f *= c * d
+        if abs(1.0 - c * d) < 1e-15:
+            break
+    return front * f
+
+def _chi2_sf(statistic, dof):
+    """卡方分布的右尾機率 Q(dof / 2, statistic / 2)。"""
+    if dof <= 0:
+        return 1.0
+    return _gammaincc(dof / 2, statistic / 2)
+
+def validate_simulation(num_runs=10**5, seed=None, alpha=VALIDATION_ALPHA, stages=None, game_data=None):
+    """
+    以批次引擎模擬每個關卡 num_runs 場，與 calculate_ev_per_stamina 使用的理論期望值比對。
+    stages 可限定 [(副本, 難度), ...]，預設為所有關卡；game_data 可指定要檢查的數據，預設為 GAME_DATA。
+    回傳 {'runs', 'alpha', 'tests': [...], 'flagged': 不一致的檢定數}，每筆檢定為
+    {'stage', 'test': 'z' 或 'chi2', 'target': 道具或掉落類型, 'expected', 'observed', 'statistic', 'p_value', 'flagged'}；
+    z 檢定的 expected / observed 為每場平均掉落數，卡方檢定為各格命中次數（機率總和小於 1 時最後一格為「未掉落」）。
+    """
+    from statistics import NormalDist
+    _require_numpy()
+    rng = np.random.default_rng(seed)
+    compiled = get_compiled_game_data() if game_data is None else compile_game_data(game_data, lazy=True)
+    if stages is None:
+        stage_tables = list(compiled.stages.values())
+    else:
+        stage_tables = [compiled.stage(boss, difficulty) for boss, difficulty in stages]
+        if any(stage is None for stage in stage_tables):
+            print("錯誤：找不到指定的關卡。請檢查輸入是否正確。")
+            return None
+    tests = []
+    for stage in stage_tables:
+        # 每個道具的每場平均掉落數：z = (模擬平均 - 理論期望) / 標準誤
+        sums = np.zeros(len(stage.item_ids), dtype=np.float64)
+        squares = np.zeros(len(stage.item_ids), dtype=np.float64)
+        for start in range(0, num_runs, BATCH_CHUNK_RUNS):
+            chunk = _draw_batch_chunk(stage, min(BATCH_CHUNK_RUNS, num_runs - start), rng)
+            sums += chunk.sum(axis=1)
+            squares += np.einsum('ij,ij->i', chunk, chunk, dtype=np.float64)
+        mean = sums / num_runs
+        variance = np.maximum(squares / num_runs - mean ** 2, 0.0) * num_runs / max(num_runs - 1, 1)
+        expected = dict(stage.expected_loot)
+        for row, item_id in enumerate(stage.item_ids):
+            theory = expected.get(item_id, 0.0)
+            stderr = math.sqrt(variance[row] / num_runs)
+            if stderr > 0:
+                z = (mean[row] - theory) / stderr
             else:
-                # 否則，使用原始的機率抽獎邏輯
+                z = 0.0 if math.isclose(mean[row], theory) else math.copysign(math.inf, mean[row] - theory)
+            tests.append({
+                'stage': stage.name,
+                'test': 'z',
+                'target': compiled.item_names[item_id],
+                'expected': theory,
+                'observed': float(mean[row]),
+                'statistic': z,
+                'p_value': 2 * (1 - NormalDist().cdf(abs(z))) if math.isfinite(z) else 0.0,
+            })
+
+        # 各掉落池每格的命中次數與原始機率比對；機率總和小於 1 時多一格「未掉落」
+        for pool in stage.pools:
+            if pool.is_bundle or pool.guide is None:
+                continue
+            draws = num_runs * pool.rolls
+            observed = np.bincount(_pool_picks(pool, rng.random(draws)), minlength=len(pool.probs)).astype(np.float64)
+            expected_counts = np.array(pool.probs, dtype=np.float64) * draws
+            missing = 1.0 - sum(pool.probs)
+            if missing > PROB_SUM_TOLERANCE:
+                observed = np.append(observed, 0.0)
+                expected_counts = np.append(expected_counts, missing * draws)
+            positive = expected_counts > 0
+            statistic = float(np.sum((observed[positive] - expected_counts[positive]) ** 2 / expected_counts[positive]))
+            if np.any(observed[~positive] > 0):
+                statistic = math.inf  # 機率為 0 的格子被抽中
+            tests.append({
+                'stage': stage.name,
+                'test': 'chi2',
+                'target': pool.drop_type,
+                'expected': expected_counts.tolist(),
+                'observed': observed.tolist(),
+                'statistic': statistic,
+                'p_value': _chi2_sf(statistic, int(positive.sum()) - 1) if math.isfinite(statistic) else 0.0,
+            })
+
+    threshold = alpha / max(len(tests), 1)
+    for test in tests:
+        test['flagged'] = test['p_value'] < threshold
+    return {
+        'runs': num_runs,
+        'alpha': alpha,
+        'tests': tests,
+        'flagged': sum(test['flagged'] for test in tests),
+    }
+
+# --- 玩家掉落紀錄匯入 ---
+# 紀錄檔（csv 或 ndjson）每一列是一份抽獎的結果，欄位為 stage（副本-難度）、drop_type、item、quantity，
+# item 留空表示這一份沒有掉落；可選的 count 欄位表示相同結果出現的次數（已彙總的紀錄）。每筆紀錄必須在同一行。
+# 逐列串流讀取，只保留 (關卡, 掉落類型, 道具, 數量) 的計數，記憶體用量與紀錄筆數無關。
+
+DROP_LOG_FIELDS = ('stage', 'drop_type', 'item', 'quantity')
+# 每次讀入的列數
+DROP_LOG_BLOCK_LINES = 1 << 16
+
+def _drop_log_count(value):
+    """紀錄中的 count 欄位：非負整數（CSV 為字串，NDJSON 為數字）。"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"count 必須是非負整數：{value!r}")
+    try:
+        count = int(value)
+    except ValueError:
+        raise ValueError(f"count 必須是非負整數：{value!r}") from None
+    if count < 0:
+        raise ValueError(f"count 必須是非負整數：{value!r}")
+    return count
+
+def _drop_log_quantity(item, value):
+    """紀錄中的 quantity 欄位：有道具時必須是正整數（CSV 為字串，NDJSON 為數字），未掉落時為 0。"""
+    if not item:
+        return 0
+    if isinstance(value, bool) or not isinstance(value, (int, str)) or not str(value).strip().isdigit():
+        raise ValueError(f"quantity 必須是正整數：{value!r}")
+    quantity = int(value)
+    if quantity <= 0:
+        raise ValueError(f"quantity 必須是正整數：{value!r}")
+    return quantity
+
+def read_drop_log(path, fmt=None, counts=None):
+    """
+    串流讀取掉落紀錄，回傳 Counter {(關卡, 掉落類型, 道具, 數量): 次數}，未掉落的紀錄道具為 ''、數量為 0。
+    fmt 為 'csv' 或 'ndjson'，未給時依副檔名判斷；path 為 '-' 時讀取標準輸入。
+    counts 可傳入既有的 Counter 累加多個檔案。
+    """
+    import csv
+    if counts is None:
+        counts = Counter()
+    if fmt is None:
+        fmt = 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8', newline='')
+    try:
+        if fmt == 'csv':
+            header = next(csv.reader([f.readline()]), None)
+            if header is None:
+                return counts
+            missing = [name for name in DROP_LOG_FIELDS if name not in header]
+            if missing:
+                raise ValueError(f"紀錄檔缺少欄位：{', '.join(missing)}")
+            key = itemgetter(*(header.index(name) for name in DROP_LOG_FIELDS))
+            count_column = header.index('count') if 'count' in header else None
+        line_number = 1 if fmt == 'csv' else 0  # 區塊開始前已讀取的行數（CSV 含標題列）
+        while True:
+            # 紀錄中大量重複的列在每個區塊內只解析一次；區塊大小固定，記憶體用量不隨檔案大小增加
+            lines = list(islice(f, DROP_LOG_BLOCK_LINES))
+            if not lines:
+                break
+            for line, repeat in Counter(lines).items():
+                if not line.strip():
+                    continue
                 try:
-                    results = random.choices(population, weights=weights, k=rolls)
-                    for choice in results:
-                        total_loot[choice['item']] += choice['quantity']
-                except ValueError as e:
-                    # 處理機率總和不為100%的容錯
-                    if "total of weights must be greater than zero" in str(e):
-                        # 如果池子是空的或所有機率都是0，就跳過
-                        pass
+                    if fmt == 'csv':
+                        row = next(csv.reader([line]))
+                        stage_name, drop_type, item, quantity = key(row)
+                        record_key = (stage_name, drop_type, item, _drop_log_quantity(item, quantity))
+                        weight = _drop_log_count(row[count_column]) if count_column is not None else 1
                     else:
-                        print(f"錯誤: 在模擬 {boss}-{difficulty} 的 {drop_type} 時發生錯誤: {e}")
-                        return None, 0
-                        
-    return total_loot, total_stamina_spent
+                        record = json.loads(line)
+                        item = record.get('item') or ''
+                        quantity = _drop_log_quantity(item, record.get('quantity'))
+                        record_key = (record['stage'], record['drop_type'], item, quantity)
+                        weight = _drop_log_count(record.get('count', 1))
+                except (ValueError, KeyError, IndexError, AttributeError) as error:
+                    # 重複的列只解析一次，出錯時回頭找出第一次出現的行號
+                    reason = f"缺少欄位 {error}" if isinstance(error, KeyError) else (
+                        "欄位數不足" if isinstance(error, IndexError) else error)
+                    raise ValueError(f"第 {line_number + lines.index(line) + 1} 行格式錯誤：{reason}") from None
+                counts[record_key] += weight * repeat
+            line_number += len(lines)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return counts
+
+def _betainc(a, b, x):
+    """正規化不完全 Beta 函數 I_x(a, b)，以 Lentz 連分數計算。"""
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+    if x > (a + 1) / (a + b + 2):
+        return 1.0 - _betainc(b, a, 1.0 - x)
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log1p(-x)) / a
+    f, c, d = 1.0, 1.0, 0.0
+    for i in range(300):
+        m = i // 2
+        if i == 0:
+            numerator = 1.0
+        elif i % 2 == 0:
+            numerator = m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m))
+        else:
+            numerator = -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))
+        d = 1.0 + numerator * d
+        d = 1.0 / (d if abs(d) > 1e-30 else 1e-30)
+        c = 1.0 + numerator / c
+        c = c if abs(c) > 1e-30 else 1e-30
+        f *= c * d
+        if abs(1.0 - c * d) < 1e-12:
+            break
+    return front * (f - 1.0)
+
+def _beta_ppf(q, a, b):
+    """Beta(a, b) 的第 q 分位數，以二分法反解 _betainc。"""
+    low, high = 0.0, 1.0
+    for _ in range(60):
+        middle = (low + high) / 2
+        if _betainc(a, b, middle) < q:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+def _rate_interval(count, trials, method, alpha, categories, confidence):
+    """單一格子的 (估計機率, 下限, 上限)：mle 為 Wilson 區間，bayes 為 Dirichlet 後驗邊際 Beta 的可信區間。"""
+    from statistics import NormalDist
+    if method == 'bayes':
+        a = count + alpha
+        b = trials - count + alpha * (categories - 1)
+        if a <= 0 or b <= 0:
+            # 後驗退化成單點（例如只有一格）
+            return (1.0, 1.0, 1.0) if b <= 0 else (0.0, 0.0, 0.0)
+        tail = (1 - confidence) / 2
+        return a / (a + b), _beta_ppf(tail, a, b), _beta_ppf(1 - tail, a, b)
+    if trials == 0:
+        return 0.0, 0.0, 1.0
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    p = count / trials
+    center = (p + z * z / (2 * trials)) / (1 + z * z / trials)
+    half = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / (1 + z * z / trials)
+    return p, max(0.0, center - half), min(1.0, center + half)
+
+def estimate_drop_rates(counts, game_data=None, method='mle', alpha=0.5, confidence=0.95):
+    """
+    由 read_drop_log 的計數估計各掉落池的機率。method 為 'mle'（最大概似，Wilson 區間）
+    或 'bayes'（對稱 Dirichlet(alpha) 先驗的後驗平均與可信區間）。
+    每個掉落池的格子依 (道具, 數量) 對應，數據中沒有但紀錄中出現的格子會附加在後面，
+    有「未掉落」紀錄時另有 item 為 None 的一格。組合包不需要估計，會略過。
+    回傳 ({(副本, 難度, 掉落類型): {'trials': 抽獎份數, 'entries': [{'item', 'quantity', 'count', 'prob', 'low', 'high'}, ...]}},
+    [數據中找不到的 (關卡, 掉落類型), ...])。
+    """
+    if game_data is None:
+        game_data = GAME_DATA
+    observed = defaultdict(Counter)
+    for (stage_name, drop_type, item, quantity), count in counts.items():
+        cell = (item, quantity) if item else (None, 0)
+        observed[(stage_name, drop_type)][cell] += count
+    estimates = {}
+    unknown = []
+    for (stage_name, drop_type), cells in observed.items():
+        boss, _, difficulty = stage_name.rpartition('-')
+        drop_data = game_data.get(boss, {}).get(difficulty, {}).get('drops', {}).get(drop_type)
+        if drop_data is None:
+            unknown.append((stage_name, drop_type))
+            continue
+        pool = drop_data['pool']
+        if sum(entry['prob'] for entry in pool) > 1.01:
+            continue
+        keys = list(dict.fromkeys([(entry['item'], entry['quantity']) for entry in pool] + list(cells)))
+        trials = sum(cells.values())
+        entries = []
+        for item, quantity in keys:
+            count = cells.get((item, quantity), 0)
+            prob, low, high = _rate_interval(count, trials, method, alpha, len(keys), confidence)
+            entries.append({'item': item, 'quantity': quantity, 'count': count, 'prob': prob, 'low': low, 'high': high})
+        estimates[(boss, difficulty, drop_type)] = {'trials': trials, 'entries': entries}
+    return estimates, unknown
+
+def updated_game_data(estimates, game_data=None, min_trials=100, digits=6):
+    """
+    以估計的機率產生新的關卡數據（不修改原本的數據）。只更新抽獎份數達到 min_trials 的掉落池；
+    「未掉落」不寫入掉落池，因此機率總和可能小於 1，validate_game_data 會標出這類掉落池。
+    """
+    if game_data is None:
+        game_data = GAME_DATA
+    stages = json.loads(json.dumps(dict(game_data)))
+    for (boss, difficulty, drop_type), estimate in estimates.items():
+        if estimate['trials'] < min_trials:
+            continue
+        entries = [entry for entry in estimate['entries'] if entry['item'] is not None]
+        pool = [{'item': entry['item'], 'quantity': entry['quantity'], 'prob': round(entry['prob'], digits)} for entry in entries]
+        if pool:
+            # 四捨五入的誤差補在機率最大的一格，讓總和維持與估計值相同
+            largest = max(pool, key=itemgetter('prob'))
+            residual = round(sum(entry['prob'] for entry in entries), digits) - sum(entry['prob'] for entry in pool)
+            largest['prob'] = round(largest['prob'] + residual, digits)
+        stages[boss][difficulty]['drops'][drop_type]['pool'] = pool
+    return stages
+
+# --- 體力回復時間軸模擬 ---
+# 以事件驅動的方式推進時間：體力每 regen_minutes 分鐘回復 1 點，達到上限 cap 後停止回復；
+# 補充事件（例如每日贈送的體力）可以超過上限。每次上線時把體力全部花在策略指定的關卡上。
+# 場次安排只取決於體力，與實際掉落無關，因此先排出每個時段各關卡的場數，
+# 再對每個 (時段, 關卡) 一次為所有試驗抽出多項分布，不必逐場模擬。
+
+TIMELINE_CHECKPOINT_MINUTES = 24 * 60
+
+def _schedule_policy(schedule):
+    """將 [(開始天數, 副本, 難度), ...] 的排程轉為策略函式；開始天數之前沿用前一個關卡。"""
+    schedule = sorted(schedule)
+    starts = [day * 24 * 60 for day, _, _ in schedule]
+
+    def policy(minute, expected):
+        position = bisect_right(starts, minute) - 1
+        _, boss, difficulty = schedule[max(position, 0)]
+        return boss, difficulty
+    return policy
+
+def plan_timeline(days, regen_minutes, cap, policy, start_stamina=0, refills=(), session_minutes=None,
+                  checkpoint_minutes=TIMELINE_CHECKPOINT_MINUTES):
+    """
+    排出體力時間軸上的所有挑戰，回傳 {'runs', 'expected', 'stamina_used', 'stamina_wasted'}，
+    runs 為每個時段的 {(副本, 難度): 場數}，expected 為每個時段結束時的 {道具: 累計期望數}。
+    policy 為 [(開始天數, 副本, 難度), ...] 的排程，或 policy(分鐘, 目前累計期望 {道具: 數量}) 回傳 (副本, 難度) 的函式。
+    refills 為 [(首次分鐘, 間隔分鐘或 None, 體力), ...]；session_minutes 為上線間隔，None 表示體力足夠就立刻挑戰。
+    stamina_wasted 為體力停在上限期間少回復的點數。找不到關卡時回傳 None。
+    days、regen_minutes、checkpoint_minutes 與 session_minutes 必須是正數，cap 不可為負數，
+    refills 的首次分鐘與間隔分鐘不可為負數、體力必須是正數，否則拋出 ValueError。
+    """
+    for name, value in (('days', days), ('regen_minutes', regen_minutes), ('checkpoint_minutes', checkpoint_minutes),
+                        ('session_minutes', 1 if session_minutes is None else session_minutes)):
+        if value <= 0:
+            raise ValueError(f"{name} 必須是正數：{value}")
+    if cap < 0:
+        raise ValueError(f"cap 不可為負數：{cap}")
+    refills = list(refills)
+    for first, period, amount in refills:
+        if first < 0 or (period or 0) < 0 or amount <= 0:
+            raise ValueError(f"體力補充的首次分鐘與間隔分鐘不可為負數，體力必須是正數：{(first, period, amount)}")
+    if not callable(policy):
+        policy = _schedule_policy(policy)
+    compiled = get_compiled_game_data()
+    horizon = days * 24 * 60
+    num_checkpoints = -(-horizon // checkpoint_minutes)
+    runs = [defaultdict(int) for _ in range(num_checkpoints)]
+    expected = defaultdict(float)
+    expected_by_checkpoint = []
+    stamina = start_stamina
+    anchor = 0  # 下一點體力開始計時的時間
+    stamina_used = 0
+    stamina_wasted = 0
+
+    def advance(minute):
+        # 推進到 minute：低於上限時每 regen_minutes 回復 1 點，停在上限期間少回復的點數記為浪費
+        nonlocal stamina, anchor, stamina_wasted
+        points = (minute - anchor) // regen_minutes
+        gained = max(0, min(points, cap - stamina))
+        stamina += gained
+        stamina_wasted += points - gained
+        anchor += points * regen_minutes
+
+    def play(minute, stage):
+        # 把體力全部花在 stage 上
+        nonlocal stamina, anchor, stamina_used
+        was_capped = stamina >= cap
+        count = stamina // stage.stamina
+        stamina -= count * stage.stamina
+        stamina_used += count * stage.stamina
+        if was_capped and stamina < cap:
+            anchor = minute  # 從上限降下來後才重新開始計時
+        if count == 0:
+            return
+        runs[min(minute // checkpoint_minutes, num_checkpoints - 1)][(stage.boss, stage.difficulty)] += count
+        for item_id, value in stage.expected_loot:
+            expected[compiled.item_names[item_id]] += value * count
+
+    def current_stage(minute):
+        stage = compiled.stage(*policy(minute, expected))
+        if stage is None:
+            print("錯誤：找不到指定的關卡。請檢查輸入是否正確。")
+        return stage
+
+    # 事件：(分鐘, 順序, 類型, 資料)；同一時間依序結算時段、補充體力、上線挑戰
+    events = [(min(checkpoint_minutes * (k + 1), horizon), 0, 'checkpoint', k) for k in range(num_checkpoints)]
+    events += [(first, 1, 'refill', (period, amount)) for first, period, amount in refills]
+    if session_minutes is not None:
+        events.append((0, 2, 'session', None))
+    heapq.heapify(events)
+    minute = 0
+    while True:
+        while events[0][0] <= minute:
+            _, _, kind, data = heapq.heappop(events)
+            if kind == 'checkpoint':
+                expected_by_checkpoint.append(dict(expected))
+                if data == num_checkpoints - 1:
+                    return {
+                        'runs': [dict(bucket) for bucket in runs],
+                        'expected': expected_by_checkpoint,
+                        'stamina_used': stamina_used,
+                        'stamina_wasted': stamina_wasted,
+                    }
+            elif kind == 'refill':
+                period, amount = data
+                stamina += amount
+                if period:
+                    heapq.heappush(events, (minute + period, 1, 'refill', data))
+            else:
+                heapq.heappush(events, (minute + session_minutes, 2, 'session', None))
+                stage = current_stage(minute)
+                if stage is None:
+                    return None
+                play(minute, stage)
+        next_minute = events[0][0]
+        if session_minutes is None:
+            # 體力足夠就立刻挑戰，否則推進到下一次湊滿一場體力的時間
+            stage = current_stage(minute)
+            if stage is None:
+                return None
+            if stamina >= stage.stamina:
+                play(minute, stage)
+                continue
+            if stage.stamina <= cap:
+                next_minute = min(next_minute, anchor + (stage.stamina - stamina) * regen_minutes)
+        advance(next_minute)
+        minute = next_minute
+
+def _draw_stage_totals(stage, num_runs, trials, rng):
+    """為 trials 次試驗各抽出 num_runs 場的總掉落，回傳形狀為 (試驗, 關卡道具數) 的陣列。"""
+    totals = np.zeros((trials, len(stage.item_ids)), dtype=np.int64)
+    for pool in stage.pools:
+        if pool.is_bundle:
+            for row, quantity in zip(pool.rows, pool.quantities):
+                totals[:, row] += quantity * pool.rolls * num_runs
+            continue
+        if pool.guide is None:
+            continue
+        probs = np.diff(pool.cum_weights_array, prepend=0.0) / pool.total_weight
+        counts = rng.multinomial(num_runs * pool.rolls, probs, size=trials)
+        for entry, (row, quantity) in enumerate(zip(pool.rows, pool.quantities)):
+            totals[:, row] += counts[:, entry] * quantity
+    return totals
+
+def simulate_timeline(days, regen_minutes, cap, policy, start_stamina=0, refills=(), session_minutes=None,
+                      trials=1000, seed=None, checkpoint_minutes=TIMELINE_CHECKPOINT_MINUTES):
+    """
+    模擬一段時間內（例如 90 天）依體力回復與補充刷關的累計收穫，參數同 plan_timeline。
+    回傳 plan_timeline 的結果，另加上 'checkpoints'（每個時段結束的分鐘數）
+    與 'samples'：{道具: 形狀為 (試驗, 時段) 的累計數量陣列}。找不到關卡時回傳 None。
+    """
+    _require_numpy()
+    timeline = plan_timeline(days, regen_minutes, cap, policy, start_stamina, refills, session_minutes,
+                             checkpoint_minutes)
+    if timeline is None:
+        return None
+    rng = np.random.default_rng(seed)
+    compiled = get_compiled_game_data()
+    num_checkpoints = len(timeline['runs'])
+    increments = {}
+    for checkpoint, bucket in enumerate(timeline['runs']):
+        for (boss, difficulty), count in bucket.items():
+            if count == 0:
+                continue
+            stage = compiled.stage(boss, difficulty)
+            totals = _draw_stage_totals(stage, count, trials, rng)
+            for row, item_id in enumerate(stage.item_ids):
+                name = compiled.item_names[item_id]
+                if name not in increments:
+                    increments[name] = np.zeros((trials, num_checkpoints), dtype=np.int64)
+                increments[name][:, checkpoint] += totals[:, row]
+    timeline['checkpoints'] = [
+        min(checkpoint_minutes * (k + 1), days * 24 * 60) for k in range(num_checkpoints)
+    ]
+    timeline['samples'] = {name: np.cumsum(values, axis=1) for name, values in increments.items()}
+    return timeline
+
+def timeline_quantiles(timeline, quantiles=(0.05, 0.5, 0.95)):
+    """各道具在每個時段結束時累計數量的分位數：{道具: {分位: [時段1, 時段2, ...]}}。"""
+    return {
+        item: {q: np.quantile(samples, q, axis=0).tolist() for q in quantiles}
+        for item, samples in timeline['samples'].items()
+    }
+
+# --- HTTP 服務 ---
+# 常駐的本機 HTTP/JSON 服務：啟動時編譯好所有關卡並建立效率索引與行程池，
+# 之後每個請求都不必重新載入數據或建立行程。有指定 seed 的結果是確定的，會直接快取編碼好的回應。
+#   GET  /analyze[?item=道具&top=K&min=下限&max=上限&all=1]
+#   POST /simulate  {"boss", "difficulty", "runs" 或 "stamina", "seed", "histogram", "window_runs"}
+#   POST /optimize  {"targets": {道具: 數量}, "stages": ["副本-難度", ...], "integer", "confidence", "method", "trials", "seed"}
+#   GET  /health
+
+SERVICE_CACHE_SIZE = 1024
+# 單一請求允許的最大模擬次數與 optimize 的模擬試驗次數，避免一個請求佔住服務太久
+SERVICE_MAX_RUNS = 10**8
+SERVICE_MAX_TRIALS = 10**5
+
+class ConquestService:
+    """HTTP 服務背後的共用狀態：編譯好的掉落表、效率索引、常駐的行程池與結果快取。"""
+
+    def __init__(self, workers=None, cache_size=SERVICE_CACHE_SIZE):
+        import threading
+        from concurrent.futures import ProcessPoolExecutor
+        self.workers = workers or os.cpu_count() or 1
+        self.compiled = get_compiled_game_data()
+        self.compiled.stages  # 預先編譯所有關卡
+        self.index = get_efficiency_index()
+        self.best_stages = cached_best_stages()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 and np is not None else None
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._best_stages_body = _encode_json({
+            item: {'stage': stage, 'efficiency': efficiency} for item, (stage, efficiency) in self.best_stages.items()
+        })
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def _cached(self, key, compute):
+        """以 key 查詢快取的回應內容；key 為 None 時（沒有 seed 的模擬）不快取。"""
+        if key is not None:
+            with self._lock:
+                body = self._cache.get(key)
+                if body is not None:
+                    self._cache.move_to_end(key)
+                    return body
+        body = _encode_json(compute())
+        if key is not None:
+            with self._lock:
+                self._cache[key] = body
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return body
+
+    def analyze(self, params):
+        """理論效率查詢；不帶參數時回傳啟動時就編碼好的各道具最佳關卡。參數可來自查詢字串或 JSON。"""
+        item = _request_field(params, 'item', str)
+        if item is None:
+            if _request_flag(params, 'all'):
+                return self._cached(('analyze', 'all'), cached_ev_per_stamina)
+            return self._best_stages_body
+        if item not in self.index.stages_by_item:
+            raise RequestError('item', f"找不到道具：{item}")
+        low = _request_number(params, 'min', float)
+        high = _request_number(params, 'max', float)
+        ranked = self.index.between(item, low, high)
+        top = _request_number(params, 'top', int, minimum=0)
+        if top is not None:
+            ranked = ranked[:top]
+        return _encode_json({item: [[stage, efficiency] for stage, efficiency in ranked]})
+
+    def simulate(self, payload):
+        """模擬單一關卡，以常駐行程池平行執行；需要 numpy。"""
+        _require_numpy()
+        boss = _request_field(payload, 'boss', str, required=True)
+        difficulty = _request_field(payload, 'difficulty', str, required=True)
+        stage = self.compiled.stage(boss, difficulty)
+        if stage is None:
+            raise RequestError('boss', f"找不到關卡：{boss}-{difficulty}")
+        if 'runs' in payload:
+            num_runs = _request_field(payload, 'runs', int, minimum=0, maximum=SERVICE_MAX_RUNS, required=True)
+        elif 'stamina' in payload:
+            stamina = _request_field(payload, 'stamina', int, minimum=0,
+                                     maximum=SERVICE_MAX_RUNS * stage.stamina, required=True)
+            num_runs = stamina // stage.stamina
+        else:
+            raise RequestError('runs', "需要 runs 或 stamina")
+        seed = _request_field(payload, 'seed', int, minimum=0)
+        histogram = _request_field(payload, 'histogram', bool, default=False)
+        window_runs = _request_field(payload, 'window_runs', int, minimum=1)
+        if histogram:
+            try:
+                _check_window_runs(len(stage.item_ids), _stage_max_per_run(stage), window_runs or HISTOGRAM_WINDOW_RUNS)
+            except ValueError as error:
+                raise RequestError('window_runs', str(error))
+
+        def compute():
+            loot, stamina_spent, per_run = simulate_runs_parallel(
+                boss, difficulty, num_runs, seed=seed, workers=self.workers,
+                per_run='histogram' if histogram else False, executor=self.executor, window_runs=window_runs,
+            )
+            row = _simulation_row(stage.name, num_runs, stamina_spent, loot)
+            if histogram:
+                row['histogram'] = per_run.to_dict()
+            return row
+
+        key = None if seed is None else ('simulate', stage.name, num_runs, seed, histogram, window_runs)
+        return self._cached(key, compute)
+
+    def optimize(self, payload):
+        """多目標體力最佳化，參數同 optimize_farming。"""
+        import argparse
+        targets = _request_field(payload, 'targets', dict, required=True)
+        if not targets:
+            raise RequestError('targets', "需要 targets：{道具: 數量}")
+        unknown = [name for name in targets if name not in self.compiled.item_ids]
+        if unknown:
+            raise RequestError('targets', f"找不到道具：{', '.join(unknown)}")
+        options = {
+            'integer': _request_field(payload, 'integer', bool, default=True),
+            'confidence': _request_field(payload, 'confidence', (int, float)),
+            'method': _request_field(payload, 'method', str, default='exact'),
+            'trials': _request_field(payload, 'trials', int, default=2000, minimum=1, maximum=SERVICE_MAX_TRIALS),
+            'seed': _request_field(payload, 'seed', int, minimum=0),
+        }
+        if options['method'] not in ('exact', 'simulate'):
+            raise RequestError('method', f"未知的方法：{options['method']}（可用：exact、simulate）")
+        if options['confidence'] is not None and not 0 < options['confidence'] < 1:
+            raise RequestError('confidence', f"欄位 confidence 必須介於 0 與 1 之間（不含）：{options['confidence']}")
+        for name, value in targets.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise RequestError('targets', f"道具 {name} 的目標數量必須是非負數字：{value!r}")
+            if options['confidence'] is not None and not float(value).is_integer():
+                raise RequestError('targets', f"機率限制模式的目標數量必須是整數：{name}={value}")
+        stage_names = _request_field(payload, 'stages', list)
+        stages = None
+        if stage_names:
+            if not all(isinstance(text, str) for text in stage_names):
+                raise RequestError('stages', "stages 必須是 \"副本-難度\" 字串的陣列")
+            try:
+                stages = [_parse_stage(text) for text in stage_names]
+            except argparse.ArgumentTypeError as error:
+                raise RequestError('stages', str(error))
+
+        def compute():
+            plan = optimize_farming({name: float(value) for name, value in targets.items()}, stages=stages, **options)
+            if plan is None:
+                raise RequestError('targets', "所選關卡無法達成目標")
+            return plan
+
+        random_plan = options['confidence'] is not None and options['method'] == 'simulate'
+        key = None if random_plan and options['seed'] is None else (
+            'optimize', json.dumps([targets, stage_names, options], sort_keys=True, ensure_ascii=False)
+        )
+        return self._cached(key, compute)
+
+class RequestError(ValueError):
+    """請求內容不符合格式；field 為出錯的欄位，會放在 400 回應的 'field' 中。"""
+
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+
+_TYPE_NAMES = {bool: '布林值', int: '整數', float: '數字', str: '字串', list: '陣列', dict: '物件'}
+
+def _request_field(payload, name, types, default=None, minimum=None, maximum=None, required=False):
+    """
+    取出 JSON 請求的欄位並檢查型別與範圍，不符時拋出 RequestError。
+    欄位不存在或為 null 時回傳 default（required=True 時視為錯誤）；bool 不會被當成整數。
+    """
+    value = payload.get(name)
+    if value is None:
+        if required:
+            raise RequestError(name, f"缺少欄位 {name}")
+        return default
+    types = types if isinstance(types, tuple) else (types,)
+    if (isinstance(value, bool) and bool not in types) or not isinstance(value, types):
+        expected = '或'.join(_TYPE_NAMES.get(kind, kind.__name__) for kind in types)
+        raise RequestError(name, f"欄位 {name} 必須是{expected}：{value!r}")
+    if minimum is not None and value < minimum:
+        raise RequestError(name, f"欄位 {name} 必須至少為 {minimum}：{value}")
+    if maximum is not None and value > maximum:
+        raise RequestError(name, f"欄位 {name} 不可超過 {maximum}：{value}")
+    return value
+
+def _request_number(params, name, kind, minimum=None):
+    """取出數字參數；查詢字串中的參數是字串，JSON 中的是數字，兩者都接受。不符時拋出 RequestError。"""
+    value = params.get(name)
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = kind(value)
+        except ValueError:
+            raise RequestError(name, f"欄位 {name} 必須是{_TYPE_NAMES[kind]}：{value!r}")
+    return _request_field({name: value}, name, (int,) if kind is int else (int, float), minimum=minimum)
+
+def _request_flag(params, name):
+    """布林參數：JSON 的 true/false，或查詢字串的 1/true/yes。"""
+    value = params.get(name)
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(_request_field(params, name, bool, default=False))
+
+def _encode_json(document):
+    return json.dumps(document, ensure_ascii=False).encode('utf-8')
+
+def _make_request_handler(service):
+    """建立綁定 service 的請求處理類別。"""
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import parse_qs, urlsplit
+
+    class ConquestRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # 支援持續連線，客戶端不必每個請求重新連線
+        # 回應標頭與內容先寫入緩衝區再一次送出，避免分成兩個封包時被延遲確認拖慢
+        wbufsize = 1 << 16
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == '/health':
+                self._respond(200, b'{"status": "ok"}')
+            elif url.path == '/analyze':
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                self._dispatch(service.analyze, params)
+            else:
+                self._respond(404, _encode_json({'error': f"找不到路徑：{url.path}"}))
+
+        def do_POST(self):
+            handlers = {'/analyze': service.analyze, '/simulate': service.simulate, '/optimize': service.optimize}
+            handler = handlers.get(urlsplit(self.path).path)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length)
+            if handler is None:
+                self._respond(404, _encode_json({'error': f"找不到路徑：{self.path}"}))
+                return
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError:
+                self._respond(400, _encode_json({'error': '請求內容不是有效的 JSON'}))
+                return
+            if not isinstance(payload, dict):
+                self._respond(400, _encode_json({'error': '請求內容必須是 JSON 物件'}))
+                return
+            self._dispatch(handler, payload)
+
+        def _dispatch(self, handler, payload):
+            try:
+                body = handler(payload)
+            except RequestError as error:
+                self._respond(400, _encode_json({'error': str(error), 'field': error.field}))
+            except ValueError as error:
+                self._respond(400, _encode_json({'error': str(error)}))
+            except RuntimeError as error:
+                self._respond(503, _encode_json({'error': str(error)}))
+            except Exception:
+                # 未預期的錯誤不把 Python 的例外內容回傳給客戶端，細節只印在服務端
+                import traceback
+                print(f"錯誤：處理 {self.path} 時發生未預期的錯誤", file=sys.stderr)
+                traceback.print_exc()
+                self._respond(500, _encode_json({'error': '服務內部錯誤'}))
+            else:
+                self._respond(200, body)
+
+        def _respond(self, status, body):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # 不逐筆記錄請求，避免拖慢回應
+
+    return ConquestRequestHandler
+
+def serve(host='127.0.0.1', port=8000, workers=None):
+    """啟動 HTTP 服務直到按下 Ctrl+C。"""
+    from http.server import ThreadingHTTPServer
+    service = ConquestService(workers)
+    server = ThreadingHTTPServer((host, port), _make_request_handler(service))
+    print(f"討伐戰模擬服務已啟動：http://{host}:{server.server_address[1]}/ （工作行程數: {service.workers}）", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+# --- 輸出格式與命令列介面 ---
+
+def item_sort_key(item_name):
+    """
+    自定義排序，讓結果更清晰。排序資訊在資料載入後對每個道具只計算一次，這裡只做查表。
+    """
+    return get_compiled_game_data().item_info(item_name).sort_key
+
+def print_best_stages(best_stages):
+    """印出各道具體力效率最高的關卡。"""
+    for item in sorted(best_stages.keys(), key=item_sort_key):
+        stage, efficiency = best_stages[item]
+        print(f"道具【{item:<12}】: 推薦關卡【{stage:<12}】 (理論效率: {efficiency:.4f} 個/體力)")
+
+def print_loot(loot, stamina_spent):
+    """印出模擬得到的掉落物總計與實際效率。"""
+    if not loot:
+        print("運氣不佳，沒有獲得任何道具。")
+        return
+    for item, quantity in sorted(loot.items(), key=lambda x: item_sort_key(x[0])):
+        sim_efficiency = quantity / stamina_spent if stamina_spent > 0 else 0
+        print(f"  - {item:<15}: {quantity:<5} 個 (實際效率: {sim_efficiency:.4f} 個/體力)")
+
+def print_histogram(histogram):
+    """印出 LootHistogram 的摘要：每區間累計的分位數、最差區間與最長連續未掉落場數。"""
+    print(f"每 {histogram.window_runs} 場累計掉落分布:")
+    summary = histogram.summary()
+    for item in sorted(summary, key=item_sort_key):
+        stats = summary[item]
+        if stats['window'][0.5] is None:
+            print(f"  - {item:<15}: 場數不足一個區間，最長連續未掉落 {stats['longest_dry']} 場")
+            continue
+        print(f"  - {item:<15}: 1%: {stats['window'][0.01]:<5} 中位數: {stats['window'][0.5]:<5} "
+              f"99%: {stats['window'][0.99]:<5} 最差: {stats['worst_window']:<5} 最長連續未掉落: {stats['longest_dry']} 場")
+
+def print_timeline(timeline, quantiles):
+    """印出時間軸模擬最後的累計收穫與 90% 區間。"""
+    days = timeline['checkpoints'][-1] / (24 * 60)
+    print(f"--- {days:g} 天共消耗體力: {timeline['stamina_used']}，因體力已滿少回復: {timeline['stamina_wasted']} ---")
+    expected = timeline['expected'][-1]
+    for item in sorted(quantiles, key=item_sort_key):
+        print(f"  - {item:<15}: 期望 {expected.get(item, 0.0):<10.1f} "
+              f"90% 區間: {quantiles[item][0.05][-1]:.0f} ~ {quantiles[item][0.95][-1]:.0f}")
+
+def print_sweep(table):
+    """以文字表格印出 sweep_stages 的結果。"""
+    for row in table:
+        print(f"\n--- 【{row['stage']}】挑戰 {row['runs']} 次，消耗體力: {row['stamina']} ---")
+        print_loot(row['loot'], row['stamina'])
+
+def print_plan(plan):
+    """印出 optimize_farming 的刷關計畫。"""
+    print(f"--- 刷關計畫（期望總體力: {plan['stamina']:.0f}）---")
+    for stage, runs in plan['runs'].items():
+        runs_text = f"{runs}" if isinstance(runs, int) else f"{runs:.2f}"
+        print(f"  - 關卡【{stage:<12}】: {runs_text} 次")
+    print("預期收穫:")
+    for item in sorted(plan['expected'], key=item_sort_key):
+        line = f"  - {item:<15}: {plan['expected'][item]:.1f} 個"
+        if 'probability' in plan:
+            line += f" (達標機率: {plan['probability'][item]:.2%})"
+        print(line)
+    if 'joint_probability' in plan:
+        print(f"全部同時達標機率: {plan['joint_probability']:.2%}")
+    if plan.get('confidence_met') is False:
+        print("警告：此計畫未達到要求的達標機率")
+
+def _simulation_row(stage_name, num_runs, stamina_spent, loot):
+    """單一關卡模擬結果的輸出格式，命令列與 HTTP 服務共用。"""
+    return {
+        'stage': stage_name,
+        'runs': num_runs,
+        'stamina': stamina_spent,
+        'loot': dict(loot),
+        'efficiency': {item: quantity / stamina_spent for item, quantity in loot.items()} if stamina_spent else {},
+    }
+
+def _loot_records(row):
+    """將一個關卡的模擬結果攤平成每個道具一列。"""
+    return [
+        {
+            'stage': row['stage'],
+            'runs': row['runs'],
+            'stamina': row['stamina'],
+            'item': item,
+            'quantity': row['loot'][item],
+            'efficiency': row['efficiency'][item],
+        }
+        for item in sorted(row['loot'], key=item_sort_key)
+    ]
+
+def write_output(document, records, fmt, stream=None):
+    """
+    以指定格式輸出結果：json 輸出完整文件，ndjson 與 csv 則每筆紀錄一行，方便串接其他工具。
+    """
+    import csv
+    if stream is None:
+        stream = sys.stdout
+    if fmt == 'json':
+        json.dump(document, stream, ensure_ascii=False, indent=2)
+        stream.write('\n')
+    elif fmt == 'ndjson':
+        for record in records:
+            stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+    elif fmt == 'csv':
+        if records:
+            writer = csv.DictWriter(stream, fieldnames=list(records[0]), lineterminator='\n')
+            writer.writeheader()
+            writer.writerows(records)
+
+def _argument_error(message):
+    """建立 argparse 的參數錯誤（argparse 只在命令列模式才匯入）。"""
+    import argparse
+    return argparse.ArgumentTypeError(message)
+
+def _positive_int(text):
+    """argparse 用的正整數型別。"""
+    try:
+        value = int(text)
+    except ValueError:
+        raise _argument_error(f"必須是整數：{text}")
+    if value < 1:
+        raise _argument_error(f"必須至少為 1：{text}")
+    return value
+
+def _parse_target(text):
+    """解析 道具=數量 形式的目標參數。"""
+    item, separator, quantity = text.rpartition('=')
+    if not separator or not item:
+        raise _argument_error(f"目標格式應為 道具=數量：{text}")
+    try:
+        return item, int(quantity)
+    except ValueError:
+        raise _argument_error(f"目標數量必須是整數：{text}")
+
+def _parse_stage(text):
+    """解析 副本-難度 形式的關卡參數。"""
+    boss, separator, difficulty = text.rpartition('-')
+    if not separator or boss not in GAME_DATA or difficulty not in GAME_DATA[boss]:
+        raise _argument_error(f"找不到關卡：{text}")
+    return boss, difficulty
+
+def _parse_rate_change(text):
+    """解析 副本-難度/掉落類型/格子序號/prob=值 形式的掉落率修改。"""
+    parts = text.split('/')
+    field, separator, value = parts[-1].partition('=')
+    if len(parts) != 4 or not separator or field not in ('prob', 'quantity') or not parts[2].isdigit():
+        raise _argument_error(f"格式應為 副本-難度/掉落類型/格子序號/prob=值：{text}")
+    boss, difficulty = _parse_stage(parts[0])
+    try:
+        number = int(value) if field == 'quantity' else float(value)
+    except ValueError:
+        raise _argument_error(f"{field} 必須是數字：{value}")
+    return boss, difficulty, parts[1], int(parts[2]), {field: number}
+
+def _parse_refill(text):
+    """解析 首次分鐘:間隔分鐘:體力 形式的體力補充事件。"""
+    try:
+        first, period, amount = (int(part) for part in text.split(':'))
+    except ValueError:
+        raise _argument_error(f"體力補充格式應為 首次分鐘:間隔分鐘:體力：{text}")
+    if first < 0 or period < 0 or amount <= 0:
+        raise _argument_error(f"體力補充的首次分鐘與間隔分鐘不可為負數，體力必須是正數：{text}")
+    return first, period or None, amount
+
+def _parse_schedule(text):
+    """解析 天數=副本-難度 形式的排程。"""
+    day, separator, stage = text.partition('=')
+    if not separator or not day.isdigit():
+        raise _argument_error(f"排程格式應為 天數=副本-難度：{text}")
+    return (int(day), *_parse_stage(stage))
+
+def build_parser():
+    """建立命令列參數解析器，子命令為 analyze、simulate、sweep、timeline、optimize 與 serve。"""
+    import argparse
+    parser = argparse.ArgumentParser(prog='conquest.py', description='討伐戰收益分析與模擬器（不帶參數時進入互動模式）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    bosses = list(GAME_DATA)
+    difficulties = list(dict.fromkeys(d for stages in GAME_DATA.values() for d in stages))
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--format', choices=['text', 'json', 'csv', 'ndjson'], default='text', help='輸出格式')
+    common.add_argument('--output', help='輸出檔案，預設為標準輸出')
+
+    analyze_parser = subparsers.add_parser('analyze', parents=[common], help='理論最佳收益分析')
+    analyze_parser.add_argument('--all', action='store_true', help='輸出所有道具在所有關卡的效率，而非只列最佳關卡')
+    analyze_parser.add_argument('--cache-dir', help='期望值的磁碟快取目錄，重複執行時可略過計算')
+    analyze_parser.add_argument('--item', help='只查詢指定道具，依效率由高到低列出關卡')
+    analyze_parser.add_argument('--top', type=int, help='搭配 --item，只列出前幾名')
+    analyze_parser.add_argument('--min', type=float, help='搭配 --item，效率下限')
+    analyze_parser.add_argument('--max', type=float, help='搭配 --item，效率上限')
+
+    simulate_parser = subparsers.add_parser('simulate', parents=[common], help='模擬單一關卡')
+    simulate_parser.add_argument('--boss', required=True, choices=bosses)
+    simulate_parser.add_argument('--difficulty', required=True, choices=difficulties)
+    amount = simulate_parser.add_mutually_exclusive_group(required=True)
+    amount.add_argument('--runs', type=_positive_int, help='模擬次數')
+    amount.add_argument('--stamina', type=_positive_int, help='總體力')
+    simulate_parser.add_argument('--seed', type=int, help='亂數種子')
+    simulate_parser.add_argument('--engine', choices=['auto', 'numpy', 'python'], default='auto')
+    simulate_parser.add_argument('--workers', type=int, help='工作行程數')
+    simulate_parser.add_argument('--stream', action='store_true', help='分批輸出累計結果與每秒模擬次數')
+    simulate_parser.add_argument('--chunk-runs', type=_positive_int, default=BATCH_CHUNK_RUNS, help='串流模式每批的模擬次數')
+    simulate_parser.add_argument('--tolerance', type=float, help='串流模式中信賴區間半寬小於此值時提前結束')
+    simulate_parser.add_argument('--relative', action='store_true', help='--tolerance 以相對於平均值的比例計算')
+    simulate_parser.add_argument('--histogram', action='store_true', help='記錄每場與區間累計掉落的直方圖（需要 numpy）')
+    simulate_parser.add_argument('--window-runs', type=_positive_int, default=HISTOGRAM_WINDOW_RUNS, help='直方圖區間累計的場數')
+
+    sweep_parser = subparsers.add_parser('sweep', parents=[common], help='以相同體力模擬所有關卡')
+    sweep_parser.add_argument('--stamina', type=_positive_int, required=True, help='每個關卡投入的總體力')
+    sweep_parser.add_argument('--boss', action='append', choices=bosses, help='只模擬指定副本，可重複指定')
+    sweep_parser.add_argument('--difficulty', action='append', choices=difficulties, help='只模擬指定難度，可重複指定')
+    sweep_parser.add_argument('--seed', type=int, help='亂數種子')
+    sweep_parser.add_argument('--workers', type=int, help='工作行程數，預設為 CPU 核心數')
+
+    timeline_parser = subparsers.add_parser('timeline', parents=[common], help='依體力回復與補充模擬長期刷關的累計收穫')
+    timeline_parser.add_argument('--days', type=_positive_int, default=90, help='模擬天數')
+    timeline_parser.add_argument('--regen-minutes', type=_positive_int, required=True, help='回復 1 點體力所需分鐘數')
+    timeline_parser.add_argument('--cap', type=int, required=True, help='自然回復的體力上限')
+    timeline_parser.add_argument('--start-stamina', type=int, default=0, help='開始時的體力')
+    timeline_parser.add_argument('--refill', type=_parse_refill, action='append', default=[], metavar='首次分鐘:間隔分鐘:體力',
+                                 help='體力補充事件，間隔為 0 表示只有一次，可重複指定')
+    timeline_parser.add_argument('--schedule', type=_parse_schedule, action='append', required=True,
+                                 metavar='天數=副本-難度', help='從第幾天開始改刷指定關卡，可重複指定')
+    timeline_parser.add_argument('--session-minutes', type=_positive_int, help='上線間隔分鐘數，預設體力足夠就立刻挑戰')
+    timeline_parser.add_argument('--trials', type=_positive_int, default=1000, help='模擬試驗次數')
+    timeline_parser.add_argument('--seed', type=int, help='亂數種子')
+
+    sensitivity_parser = subparsers.add_parser('sensitivity', parents=[common], help='掉落率敏感度與最佳關卡翻轉門檻')
+    sensitivity_parser.add_argument('--stage', type=_parse_stage, action='append', metavar='副本-難度',
+                                    help='只列出指定關卡，可重複指定')
+    sensitivity_parser.add_argument('--item', help='只列出指定道具')
+    sensitivity_parser.add_argument('--top', type=int, help='依翻轉所需的相對機率變化由小到大，只列出前幾名')
+    sensitivity_parser.add_argument('--set', type=_parse_rate_change, action='append', dest='changes',
+                                    metavar='副本-難度/掉落類型/格子序號/prob=值',
+                                    help='試算修改掉落率（或 quantity=值）後最佳關卡的變化，可重複指定')
+
+    validate_parser = subparsers.add_parser('validate', parents=[common], help='以統計檢定比對模擬結果與理論期望值')
+    validate_parser.add_argument('--runs', type=_positive_int, default=10**5, help='每個關卡的模擬次數')
+    validate_parser.add_argument('--stage', type=_parse_stage, action='append', metavar='副本-難度',
+                                 help='只檢查指定關卡，可重複指定')
+    validate_parser.add_argument('--alpha', type=float, default=VALIDATION_ALPHA, help='整體顯著水準（Bonferroni 校正前）')
+    validate_parser.add_argument('--seed', type=int, help='亂數種子')
+
+    ingest_parser = subparsers.add_parser('ingest', parents=[common], help='由玩家掉落紀錄估計實際掉落率')
+    ingest_parser.add_argument('logs', nargs='+', help='掉落紀錄檔（csv 或 ndjson，- 為標準輸入）')
+    ingest_parser.add_argument('--log-format', choices=['csv', 'ndjson'], help='紀錄檔格式，預設依副檔名判斷')
+    ingest_parser.add_argument('--method', choices=['mle', 'bayes'], default='mle')
+    ingest_parser.add_argument('--alpha', type=float, default=0.5, help='bayes 方法的對稱 Dirichlet 先驗參數')
+    ingest_parser.add_argument('--confidence', type=float, default=0.95, help='信賴（可信）區間的機率')
+    ingest_parser.add_argument('--write', metavar='路徑', help='將估計的機率寫成新的數據檔')
+    ingest_parser.add_argument('--min-trials', type=int, default=100, help='寫出數據檔時，抽獎份數至少要這麼多才更新')
+
+    serve_parser = subparsers.add_parser('serve', help='啟動本機 HTTP/JSON 服務')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    serve_parser.add_argument('--workers', type=int, help='工作行程數，預設為 CPU 核心數')
+
+    optimize_parser = subparsers.add_parser('optimize', parents=[common], help='以最少體力達成多個道具目標')
+    optimize_parser.add_argument('--target', type=_parse_target, action='append', required=True,
+                                 metavar='道具=數量', help='道具目標，可重複指定')
+    optimize_parser.add_argument('--stage', type=_parse_stage, action='append', metavar='副本-難度',
+                                 help='只考慮指定關卡，可重複指定')
+    optimize_parser.add_argument('--continuous', action='store_true', help='允許非整數的挑戰次數')
+    optimize_parser.add_argument('--confidence', type=float, help='機率限制模式的達標機率，例如 0.95')
+    optimize_parser.add_argument('--method', choices=['exact', 'simulate'], default='exact')
+    optimize_parser.add_argument('--trials', type=int, default=2000, help='simulate 方法的模擬次數')
+    optimize_parser.add_argument('--seed', type=int, help='亂數種子')
+    return parser
+
+def cli(argv):
+    """
+    命令列模式：不做啟動分析也不等待輸入，直接執行指定的子命令並輸出結果。
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        return serve(args.host, args.port, args.workers)
+    stream = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        return _run_command(args, parser, stream)
+    except RuntimeError as error:
+        if np is not None:
+            raise
+        # 未安裝 numpy 時，需要批次引擎的子命令或選項以一般的參數錯誤回報
+        parser.error(str(error))
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+def _run_command(args, parser, stream):
+    """執行解析好的子命令，回傳程式結束碼。"""
+    if args.command == 'analyze':
+        if args.item:
+            index = get_efficiency_index(cache_dir=args.cache_dir)
+            if args.item not in index.stages_by_item:
+                parser.error(f"找不到道具：{args.item}")
+            ranked = index.between(args.item, args.min, args.max)
+            if args.top is not None:
+                ranked = ranked[:args.top]
+            records = [{'item': args.item, 'stage': stage, 'efficiency': efficiency} for stage, efficiency in ranked]
+            document = {args.item: [[stage, efficiency] for stage, efficiency in ranked]}
+        elif args.all:
+            all_efficiency = cached_ev_per_stamina(cache_dir=args.cache_dir)
+            records = [
+                {'item': item, 'stage': stage, 'efficiency': efficiency}
+                for item in sorted(all_efficiency, key=item_sort_key)
+                for stage, efficiency in all_efficiency[item].items()
+            ]
+            document = {item: dict(stages) for item, stages in all_efficiency.items()}
+        else:
+            best_stages = cached_best_stages(cache_dir=args.cache_dir)
+            if args.format == 'text':
+                with redirect_stdout(stream):
+                    print_best_stages(best_stages)
+                return 0
+            records = [
+                {'item': item, 'stage': best_stages[item][0], 'efficiency': best_stages[item][1]}
+                for item in sorted(best_stages, key=item_sort_key)
+            ]
+            document = {record['item']: {'stage': record['stage'], 'efficiency': record['efficiency']} for record in records}
+        if args.format == 'text':
+            for record in records:
+                stream.write(f"{record['item']}\t{record['stage']}\t{record['efficiency']:.4f}\n")
+            return 0
+        write_output(document, records, args.format, stream)
+
+    elif args.command == 'simulate':
+        if args.difficulty not in GAME_DATA[args.boss]:
+            parser.error(f"找不到關卡：{args.boss}-{args.difficulty}")
+        stamina_cost = GAME_DATA[args.boss][args.difficulty]['stamina']
+        num_runs = args.runs if args.runs is not None else args.stamina // stamina_cost
+        if args.engine == 'python' and args.workers is not None and args.workers > 1:
+            parser.error("--engine python 不支援 --workers 平行模擬")
+        if args.stream:
+            return _stream_command(args, num_runs, stream)
+        try:
+            result = simulate_runs(
+                args.boss, args.difficulty, num_runs, seed=args.seed, engine=args.engine,
+                workers=args.workers, verbose=False, histogram=args.histogram, window_runs=args.window_runs,
+            )
+        except ValueError as error:
+            parser.error(str(error))
+        loot, stamina_spent, histogram = result if args.histogram else (*result, None)
+        row = _simulation_row(f"{args.boss}-{args.difficulty}", num_runs, stamina_spent, loot)
+        records = _loot_records(row)
+        if histogram is not None:
+            row['histogram'] = histogram.to_dict()
+            summary = histogram.summary()
+            for record in records:
+                stats = summary[record['item']]
+                record.update({
+                    'per_run_p50': stats['per_run'][0.5],
+                    'window_p01': stats['window'][0.01],
+                    'window_p99': stats['window'][0.99],
+                    'worst_window': stats['worst_window'],
+                    'longest_dry': stats['longest_dry'],
+                })
+        if args.format == 'text':
+            with redirect_stdout(stream):
+                print(f"總共挑戰 {num_runs} 次，消耗體力: {stamina_spent}")
+                print("掉落物總計:")
+                print_loot(loot, stamina_spent)
+                if histogram is not None:
+                    print_histogram(histogram)
+        else:
+            write_output(row, records, args.format, stream)
+
+    elif args.command == 'sweep':
+        table = sweep_stages(args.stamina, args.boss, args.difficulty, seed=args.seed, workers=args.workers)
+        if args.format == 'text':
+            with redirect_stdout(stream):
+                print_sweep(table)
+        else:
+            write_output(table, [record for row in table for record in _loot_records(row)], args.format, stream)
+
+    elif args.command == 'sensitivity':
+        if args.changes:
+            result = what_if(args.changes)
+            if result is None:
+                return 1
+            _, flipped = result
+            records = [
+                {'item': item, 'old_stage': old and old[0], 'old_efficiency': old and old[1],
+                 'new_stage': new and new[0], 'new_efficiency': new and new[1]}
+                for item, old, new in flipped
+            ]
+            if args.format == 'text':
+                if not records:
+                    stream.write("最佳關卡沒有改變。\n")
+                for record in records:
+                    stream.write(f"{record['item']}\t{record['old_stage']} → {record['new_stage']}\n")
+                return 0
+            write_output(records, records, args.format, stream)
+            return 0
+        stage_names = {f"{boss}-{difficulty}" for boss, difficulty in args.stage or ()}
+        records = [
+            record for record in rate_sensitivity()
+            if (not stage_names or record['stage'] in stage_names) and (not args.item or record['item'] == args.item)
+        ]
+        if args.top is not None:
+            flippable = [record for record in records if record['prob_to_flip'] is not None and record['prob'] > 0]
+            flippable.sort(key=lambda record: abs(record['prob_to_flip']) / record['prob'])
+            records = flippable[:args.top]
+        if args.format == 'text':
+            for record in records:
+                flip = "不會翻轉" if record['prob_to_flip'] is None else (
+                    f"機率 {record['prob']} → {record['prob'] + record['prob_to_flip']:.4f} 時最佳關卡變為 {record['flip_stage']}"
+                )
+                stream.write(f"{record['stage']}\t{record['drop_type']}#{record['entry']}\t{record['item']}\t"
+                             f"∂效率/∂機率={record['grad_prob']:.4f}\t{flip}\n")
+            return 0
+        write_output(records, records, args.format, stream)
+
+    elif args.command == 'validate':
+        report = validate_simulation(args.runs, seed=args.seed, alpha=args.alpha, stages=args.stage)
+        if report is None:
+            return 1
+        if args.format == 'text':
+            for test in report['tests']:
+                if test['flagged']:
+                    stream.write(f"⚠️ {test['stage']}\t{test['test']}\t{test['target']}\t"
+                                 f"統計量={test['statistic']:.2f}\tp={test['p_value']:.3g}\n")
+            stream.write(f"共 {len(report['tests'])} 項檢定，{report['flagged']} 項與理論值不一致"
+                         f"（每關卡模擬 {report['runs']} 次，α={report['alpha']}）\n")
+        else:
+            write_output(report, report['tests'], args.format, stream)
+        return 1 if report['flagged'] else 0
+
+    elif args.command == 'ingest':
+        counts = Counter()
+        for path in args.logs:
+            try:
+                read_drop_log(path, args.log_format, counts)
+            except (OSError, ValueError, KeyError) as error:
+                parser.error(f"無法讀取紀錄檔 {path}：{error}")
+        estimates, unknown = estimate_drop_rates(counts, method=args.method, alpha=args.alpha, confidence=args.confidence)
+        for stage_name, drop_type in unknown:
+            print(f"警告：數據中沒有 {stage_name} {drop_type}，已略過", file=sys.stderr)
+        if args.write:
+            save_game_data(updated_game_data(estimates, min_trials=args.min_trials), args.write)
+        records = [
+            {'stage': f"{boss}-{difficulty}", 'drop_type': drop_type, 'trials': estimate['trials'], **entry}
+            for (boss, difficulty, drop_type), estimate in estimates.items()
+            for entry in estimate['entries']
+        ]
+        if args.format == 'text':
+            for record in records:
+                item = record['item'] or '（未掉落）'
+                stream.write(f"{record['stage']}\t{record['drop_type']}\t{item} x{record['quantity']}\t"
+                             f"{record['count']}/{record['trials']}\t{record['prob']:.4f} "
+                             f"[{record['low']:.4f}, {record['high']:.4f}]\n")
+        else:
+            write_output(records, records, args.format, stream)
+
+    elif args.command == 'timeline':
+        try:
+            timeline = simulate_timeline(
+                args.days, args.regen_minutes, args.cap, args.schedule, start_stamina=args.start_stamina,
+                refills=args.refill, session_minutes=args.session_minutes, trials=args.trials, seed=args.seed,
+            )
+        except ValueError as error:
+            parser.error(str(error))
+        if timeline is None:
+            return 1
+        quantiles = timeline_quantiles(timeline)
+        if args.format == 'text':
+            with redirect_stdout(stream):
+                print_timeline(timeline, quantiles)
+            return 0
+        records = [
+            {
+                'day': minute / (24 * 60),
+                'item': item,
+                'expected': timeline['expected'][k].get(item, 0.0),
+                'p05': quantiles[item][0.05][k],
+                'p50': quantiles[item][0.5][k],
+                'p95': quantiles[item][0.95][k],
+            }
+            for k, minute in enumerate(timeline['checkpoints'])
+            for item in sorted(quantiles, key=item_sort_key)
+        ]
+        document = {
+            'checkpoints': timeline['checkpoints'],
+            'runs': [{f"{boss}-{difficulty}": count for (boss, difficulty), count in bucket.items()}
+                     for bucket in timeline['runs']],
+            'stamina_used': timeline['stamina_used'],
+            'stamina_wasted': timeline['stamina_wasted'],
+            'expected': timeline['expected'],
+            'quantiles': {item: {str(q): values for q, values in by_q.items()} for item, by_q in quantiles.items()},
+        }
+        write_output(document, records, args.format, stream)
+
+    elif args.command == 'optimize':
+        with redirect_stdout(sys.stderr):
+            plan = optimize_farming(
+                dict(args.target), stages=args.stage, integer=not args.continuous,
+                confidence=args.confidence, method=args.method, trials=args.trials, seed=args.seed,
+            )
+        if plan is None:
+            return 1
+        if args.format == 'text':
+            with redirect_stdout(stream):
+                print_plan(plan)
+        else:
+            stage_lookup = {stage.name: stage for stage in get_compiled_game_data().stages.values()}
+            records = [
+                {'stage': stage, 'runs': runs, 'stamina': runs * stage_lookup[stage].stamina}
+                for stage, runs in plan['runs'].items()
+            ]
+            write_output(plan, records, args.format, stream)
+    return 0
+
+def _stream_command(args, num_runs, stream):
+    """執行 simulate --stream：每批結果以 ndjson 或文字逐行輸出並立即 flush。"""
+    progress = simulate_runs_stream(
+        args.boss, args.difficulty, num_runs, seed=args.seed, chunk_runs=args.chunk_runs,
+        tolerance=args.tolerance, relative=args.relative,
+    )
+    if args.format == 'csv':
+        stream.write("runs,item,total,mean,stderr\n")
+    for report in progress:
+        if args.format == 'text':
+            worst = max(report['stderr'].values(), default=0.0)
+            stream.write(f"已模擬 {report['runs']} 次 ({report['runs_per_second']:,.0f} 次/秒)，最大標準誤: {worst:.5f}"
+                         + (" (已收斂)" if report['converged'] else "") + "\n")
+        elif args.format == 'csv':
+            for item in sorted(report['totals'], key=item_sort_key):
+                stream.write(f"{report['runs']},{item},{report['totals'][item]},{report['mean'][item]},{report['stderr'][item]}\n")
+        else:
+            stream.write(json.dumps(report, ensure_ascii=False) + "\n")
+        stream.flush()
+    return 0
 
 def main():
     """
@@ -617,33 +3138,10 @@ def main():
     # --- 第一部分：理論最佳解分析 ---
     print("\n【第一部分：理論最佳收益分析】")
     print("正在計算所有道具在各個關卡的「每體力期望掉落數」...")
-    all_efficiency = calculate_ev_per_stamina()
-    best_stages = find_best_stage(all_efficiency)
+    best_stages = cached_best_stages()
     print("\n--- 各道具體力效率最高的關卡如下 ---")
     
-    # 自定義排序，讓結果更清晰
-    def sort_key(item_name):
-        priority = {
-            '強化石': 1, '稀有強化石': 1, '精良強化石': 1,
-            '2階進化石': 2, '3階進化石': 2, '4階進化石': 2, '5階進化石': 2,
-            '3階進階結晶': 3, '赤紅結晶': 3, '界限晶幣': 3,
-            '細胞': 4,
-            '戰鬥秘典': 5,
-            '黃金兔寶寶': 6
-        }
-        base_name = ''.join(filter(lambda c: not c.isdigit() and c not in ['-', '力', '技', '速', '階', '進', '晶'], item_name))
-        tier_match = re.search(r'(\d+)階', item_name)
-        tier = int(tier_match.group(1)) if tier_match else 0
-        stone_type = 0
-        if '精良' in item_name: stone_type = 3
-        elif '稀有' in item_name: stone_type = 2
-        elif '強化石' in item_name: stone_type = 1
-        return (priority.get(base_name, 99), stone_type, tier, item_name)
-
-    sorted_items = sorted(best_stages.keys(), key=sort_key)
-    for item in sorted_items:
-        stage, efficiency = best_stages[item]
-        print(f"道具【{item:<12}】: 推薦關卡【{stage:<12}】 (理論效率: {efficiency:.4f} 個/體力)")
+    print_best_stages(best_stages)
 
     # --- 第二部分：手動模擬器 ---
     print("\n\n【第二部分：手動模擬器】")
@@ -696,14 +3194,11 @@ def main():
                 print(f"--- 模擬結束 ---")
                 print(f"總共挑戰 {num_runs} 次，消耗體力: {stamina_spent}")
                 print("掉落物總計:")
-                if not loot:
-                    print("運氣不佳，沒有獲得任何道具。")
-                else:
-                    sorted_loot = sorted(loot.items(), key=lambda x: sort_key(x[0]))
-                    for item, quantity in sorted_loot:
-                        sim_efficiency = quantity / stamina_spent if stamina_spent > 0 else 0
-                        print(f"  - {item:<15}: {quantity:<5} 個 (實際效率: {sim_efficiency:.4f} 個/體力)")
+                print_loot(loot, stamina_spent)
 
 # 程式執行入口
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        sys.exit(cli(sys.argv[1:]))
+    else:
+        main()
\ No newline at end of file
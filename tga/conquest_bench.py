@@ -0,0 +1,178 @@
+"""
+討伐戰模擬器的效能基準測試。
+
+量測 import conquest 與第一次載入數據的耗時、simulate_runs 各引擎在不同模擬次數下的每秒模擬次數、
+EV 分析的冷啟動與快取後耗時、道具排序耗時以及尖峰記憶體，結果存成 JSON，
+並可與先前的結果比較以找出效能退化。
+
+用法：
+    python conquest_bench.py --output bench.json
+    python conquest_bench.py --compare bench.json --threshold 0.2
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import conquest
+
+# 分別代表「含組合包（總機率 > 1.01）」與「只有一般掉落池」的關卡
+BENCH_STAGES = {
+    'bundle': ('多田良', '深淵'),
+    'normal': ('百足', '深淵'),
+}
+# 逐次模擬太慢，超過此次數就不量測
+PYTHON_ENGINE_MAX_RUNS = 10**5
+
+def _measure(func, repeat):
+    """
+    執行 func repeat 次取最短耗時，再另外執行一次量測尖峰記憶體
+    （tracemalloc 會拖慢執行，不與計時混在一起）。回傳 (秒數, 位元組)。
+    """
+    best = float('inf')
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+def bench_startup(repeat):
+    """
+    量測在新的直譯器中 import conquest 的耗時（取 -X importtime 的累計值，不含直譯器本身啟動），
+    以及第一次存取數據時讀取並驗證數據檔的耗時。
+    """
+    directory = os.path.dirname(os.path.abspath(conquest.__file__))
+    best = float('inf')
+    for _ in range(repeat + 1):  # 多跑一次：第一次可能需要編譯 .pyc，取最短耗時即可排除
+        completed = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import conquest'],
+            cwd=directory, capture_output=True, text=True, check=True,
+        )
+        line = next(line for line in reversed(completed.stderr.splitlines()) if line.rstrip().endswith('| conquest'))
+        best = min(best, int(line.split('|')[1]) / 1e6)
+    load_seconds, peak = _measure(conquest.GAME_DATA.reload, repeat)
+    return [
+        {'name': 'startup/import', 'seconds': best},
+        {'name': 'startup/load_data', 'seconds': load_seconds, 'peak_memory_bytes': peak},
+    ]
+
+def bench_simulation(max_runs, repeat):
+    """量測各引擎在 10^3 到 max_runs 次模擬下的每秒模擬次數。"""
+    results = []
+    engines = {
+        'python': lambda boss, difficulty, runs: conquest.simulate_runs(boss, difficulty, runs, seed=1, engine='python'),
+    }
+    if conquest.np is not None:
+        engines['numpy-totals'] = lambda boss, difficulty, runs: conquest.simulate_runs_batch(
+            boss, difficulty, runs, seed=1, per_run=False)
+        engines['numpy-per-run'] = lambda boss, difficulty, runs: conquest.simulate_runs_batch(
+            boss, difficulty, runs, seed=1, per_run=True)
+    for kind, (boss, difficulty) in BENCH_STAGES.items():
+        runs = 1000
+        while runs <= max_runs:
+            for engine, simulate in engines.items():
+                if engine == 'python' and runs > PYTHON_ENGINE_MAX_RUNS:
+                    continue
+                elapsed, peak = _measure(lambda: simulate(boss, difficulty, runs), repeat)
+                results.append({
+                    'name': f"simulate/{kind}/{engine}/{runs}",
+                    'stage': f"{boss}-{difficulty}",
+                    'runs': runs,
+                    'seconds': elapsed,
+                    'runs_per_second': runs / elapsed if elapsed > 0 else None,
+                    'peak_memory_bytes': peak,
+                })
+            runs *= 10
+    return results
+
+def bench_analysis(repeat):
+    """量測 EV 分析的冷啟動（重新編譯、清空快取）與快取後的耗時。"""
+    def cold():
+        conquest.clear_ev_cache()
+        compiled = conquest.compile_game_data()
+        conquest.find_best_stage(conquest.calculate_ev_per_stamina(compiled))
+
+    def warm():
+        conquest.cached_best_stages()
+
+    conquest.cached_best_stages()
+    results = []
+    for name, func in (('analysis/cold', cold), ('analysis/warm', warm)):
+        elapsed, peak = _measure(func, repeat)
+        results.append({'name': name, 'seconds': elapsed, 'peak_memory_bytes': peak})
+    return results
+
+def bench_sorting(repeat, copies=1000):
+    """量測以 item_sort_key 排序道具名稱的耗時（模擬大量輸出時的排序負擔）。"""
+    names = list(conquest.calculate_ev_per_stamina()) * copies
+    elapsed, peak = _measure(lambda: sorted(names, key=conquest.item_sort_key), repeat)
+    return [{'name': 'display/sort', 'items': len(names), 'seconds': elapsed, 'peak_memory_bytes': peak}]
+
+def run_benchmarks(max_runs=10**7, repeat=3):
+    """執行所有基準測試，回傳可直接存成 JSON 的結果。"""
+    results = []
+    results += bench_startup(repeat)
+    results += bench_simulation(max_runs, repeat)
+    results += bench_analysis(repeat)
+    results += bench_sorting(repeat)
+    return {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': getattr(conquest.np, '__version__', None),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+def compare(current, baseline, threshold):
+    """回傳比基準慢超過 threshold 比例的項目列表 [(名稱, 基準秒數, 目前秒數), ...]。"""
+    previous = {entry['name']: entry for entry in baseline['results']}
+    regressions = []
+    for entry in current['results']:
+        old = previous.get(entry['name'])
+        if old and old['seconds'] > 0 and entry['seconds'] > old['seconds'] * (1 + threshold):
+            regressions.append((entry['name'], old['seconds'], entry['seconds']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='討伐戰模擬器效能基準測試')
+    parser.add_argument('--max-runs', type=int, default=10**7, help='最大模擬次數（從 10^3 開始每次乘 10）')
+    parser.add_argument('--repeat', type=int, default=3, help='每個項目重複次數，取最短耗時')
+    parser.add_argument('--output', help='結果 JSON 檔案，預設輸出到標準輸出')
+    parser.add_argument('--compare', help='與先前的結果 JSON 比較')
+    parser.add_argument('--threshold', type=float, default=0.2, help='比較時視為退化的變慢比例')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.max_runs, args.repeat)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        sys.stdout.write('\n')
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for name, old, new in regressions:
+            print(f"⚠️ 效能退化：{name} {old:.4f}s → {new:.4f}s", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
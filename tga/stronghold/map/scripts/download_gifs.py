@@ -17,10 +17,289 @@ import re
 import os
 import json
 import time
-from urllib.request import urlopen, Request, urlretrieve
+import gzip
+import hashlib
+import io
+import ssl
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from base64 import b64encode
+from http.client import HTTPConnection, HTTPException, HTTPSConnection, IncompleteRead, RemoteDisconnected
+from urllib.parse import unquote, urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass, proxy_bypass_environment
 from urllib.error import URLError, HTTPError
 from html.parser import HTMLParser
 
+try:
+    from PIL import Image
+except ImportError:  # 感知雜湊（相似 GIF 偵測）為選用功能
+    Image = None
+
+# 並行下載的預設值：同時下載數、每個主機同時進行的請求數、每秒請求數與瞬間可連發的請求數
+DEFAULT_WORKERS = 8
+DEFAULT_PER_HOST = 4
+DEFAULT_RATE = 10.0
+DEFAULT_BURST = 10
+# 下載失敗時的重試次數與第一次重試前等待的秒數（之後每次加倍）
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+# 這些 HTTP 狀態碼代表暫時性錯誤，值得重試；其他 4xx 重試也不會成功
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# 所有請求共用的標頭與逾時秒數；每個主機最多保留的閒置連線數；最多跟隨的轉址次數
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+DEFAULT_TIMEOUT = 30
+DEFAULT_POOL_SIZE = 8
+MAX_REDIRECTS = 5
+REDIRECT_STATUS = {301, 302, 303, 307, 308}
+# 重複使用的閒置連線在送出請求、收到任何回應之前出現這些錯誤，代表伺服器已關閉該連線，可以換一條連線重送；
+# 逾時等其他錯誤可能是伺服器已經在處理請求，不自動重送
+STALE_CONNECTION_ERRORS = (RemoteDisconnected, ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+# 內容定址儲存：GIF 以 SHA-256 前 BLOB_HASH_LENGTH 個十六進位字元命名，相同內容只存一份
+BLOB_HASH_LENGTH = 16
+BLOB_NAME_PATTERN = re.compile(rf'^[0-9a-f]{{{BLOB_HASH_LENGTH}}}\.gif$')
+# 感知雜湊（dHash）距離不超過此值的 GIF 視為相似
+PHASH_DISTANCE = 4
+# 串流寫入時每次讀取的位元組數，每個下載只佔用這麼多記憶體
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# 目前的 umask（只能以設定再還原的方式讀取，匯入時讀一次）；mkstemp 建立的暫存檔權限固定為 0600，
+# 改名前改成與 open() 建立的檔案相同的 0666 & ~umask，下載的 GIF 與清單才不會變成只有擁有者能讀
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
+class IncompleteDownload(OSError):
+    """下載的位元組數與 Content-Length 或預期大小不符（例如連線中途斷掉）。"""
+
+class TokenBucket:
+    """令牌桶限速：每秒補充 rate 個令牌，最多累積 capacity 個，每個請求取用一個。"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """取得一個令牌，令牌不足時等待到補充為止。"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class HostLimiter:
+    """限制每個主機同時進行中的請求數。"""
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self.semaphores[host]
+
+class PooledResponse:
+    """
+    HttpClient.request 回傳的回應；關閉時若內容已讀完就把連線放回連線池，否則關掉連線。
+    semaphore 有給時（HostLimiter 取得的主機名額）在關閉時釋放。
+    """
+    def __init__(self, client, key, conn, response, url, semaphore=None):
+        self.client = client
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.url = url
+        self.semaphore = semaphore
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        return self.response.read(amt)
+
+    def close(self):
+        if self.conn is None:
+            return
+        if self.response.isclosed() and not self.response.will_close:
+            self.client._release(self.key, self.conn)
+        else:
+            self.response.close()
+            self.conn.close()
+        self.conn = None
+        if self.semaphore is not None:
+            self.semaphore.release()
+            self.semaphore = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class HttpClient:
+    """
+    共用的 HTTP 用戶端：以 http.client 為每個主機維護 keep-alive 連線池，
+    同一主機的後續請求重複使用已建立的 TCP/TLS 連線，省去每個檔案的握手時間。
+    標頭與逾時集中在這裡設定；非 2xx 回應與 urlopen 一樣拋出 HTTPError，連線錯誤拋出 URLError。
+    可在多個執行緒間共用，每條連線同一時間只借給一個請求。
+
+    與 urlopen 一樣依 proxies（{scheme: 代理網址}，預設為 getproxies() 讀到的 HTTP(S)_PROXY 等設定）
+    經代理伺服器連線，no_proxy 列出的主機直接連線：http 網址把完整網址送給代理，
+    https 網址以 CONNECT 建立通道後再做 TLS。代理網址中的帳號密碼會以 Proxy-Authorization 送出。
+    """
+    def __init__(self, headers=None, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE, proxies=None):
+        self.headers = dict(DEFAULT_HEADERS if headers is None else headers)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.system_proxies = proxies is None
+        self.proxies = getproxies() if proxies is None else dict(proxies)
+        self.ssl_context = ssl.create_default_context()
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def _proxy_for(self, scheme, host):
+        """回傳連到 host 要使用的代理網址，直接連線時回傳 None。"""
+        proxy = self.proxies.get(scheme)
+        if not proxy:
+            return None
+        bypass = proxy_bypass(host) if self.system_proxies else proxy_bypass_environment(host, self.proxies)
+        return None if bypass else proxy
+
+    def _acquire(self, key, timeout):
+        """取出一條閒置連線（回傳 (連線, True)），沒有時建立新連線（回傳 (連線, False)）。"""
+        with self.lock:
+            idle = self.idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        scheme, host, port, proxy = key
+        if proxy is None:
+            if scheme == 'https':
+                return HTTPSConnection(host, port, timeout=timeout, context=self.ssl_context), False
+            return HTTPConnection(host, port, timeout=timeout), False
+        proxy_parts = urlsplit(proxy if '://' in proxy else f"http://{proxy}")
+        # 代理網址沒有連接埠時與 urllib 一樣使用代理網址協定的預設連接埠
+        proxy_port = proxy_parts.port or (443 if proxy_parts.scheme == 'https' else 80)
+        if scheme == 'https':
+            # 先以明文連到代理送出 CONNECT，通道建立後才與目標主機做 TLS 握手
+            conn = HTTPSConnection(proxy_parts.hostname, proxy_port, timeout=timeout, context=self.ssl_context)
+            conn.set_tunnel(host, port, headers=_proxy_auth_headers(proxy_parts))
+            return conn, False
+        return HTTPConnection(proxy_parts.hostname, proxy_port, timeout=timeout), False
+
+    def _release(self, key, conn):
+        with self.lock:
+            idle = self.idle.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(self, method, url, headers, timeout):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise URLError(f"不支援的網址: {url}")
+        proxy = self._proxy_for(parts.scheme, parts.hostname)
+        key = (parts.scheme, parts.hostname, parts.port, proxy)
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        if proxy is not None and parts.scheme == 'http':
+            # 經 http 代理時請求行要帶完整網址
+            path = f"http://{parts.netloc}{path}"
+            headers = {**headers, **_proxy_auth_headers(urlsplit(proxy if '://' in proxy else f"http://{proxy}"))}
+        while True:
+            conn, reused = self._acquire(key, timeout)
+            try:
+                conn.request(method, path, headers=headers)
+                response = conn.getresponse()
+            except STALE_CONNECTION_ERRORS as e:
+                conn.close()
+                if reused:
+                    # 閒置連線已被伺服器關閉，換一條連線重送
+                    continue
+                raise URLError(e) from e
+            except (OSError, HTTPException) as e:
+                conn.close()
+                raise URLError(e) from e
+            return PooledResponse(self, key, conn, response, url)
+
+    def request(self, url, headers=None, timeout=None, method='GET', limiter=None):
+        """
+        送出請求並回傳 PooledResponse（請以 with 使用，讀完內容後連線會回到連線池）。
+        headers 會覆蓋預設標頭；自動跟隨最多 MAX_REDIRECTS 次轉址。
+        limiter（HostLimiter）有給時，每次連線前取得實際連到的主機（轉址後的主機）的名額，回應關閉時釋放。
+        """
+        merged = dict(self.headers)
+        merged.update(headers or {})
+        timeout = self.timeout if timeout is None else timeout
+        for _ in range(MAX_REDIRECTS + 1):
+            semaphore = limiter(url) if limiter is not None else None
+            if semaphore is not None:
+                semaphore.acquire()
+            try:
+                response = self._send(method, url, merged, timeout)
+            except BaseException:
+                if semaphore is not None:
+                    semaphore.release()
+                raise
+            response.semaphore = semaphore
+            location = response.headers.get('Location')
+            if response.status in REDIRECT_STATUS and location:
+                with response:
+                    response.read()
+                url = urljoin(url, location)
+                continue
+            if not 200 <= response.status < 300:
+                with response:
+                    body = response.read()
+                raise HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+            return response
+        raise URLError(f"轉址次數過多: {url}")
+
+    def fetch(self, url, headers=None, timeout=None, compressed=False):
+        """讀取完整內容並回傳 bytes；compressed=True 時要求 gzip 壓縮並自動解壓（適合 HTML 頁面）。"""
+        headers = dict(headers or {})
+        if compressed:
+            headers['Accept-Encoding'] = 'gzip'
+        with self.request(url, headers=headers, timeout=timeout) as response:
+            body = response.read()
+            if response.headers.get('Content-Encoding', '').lower() == 'gzip':
+                body = gzip.decompress(body)
+        return body
+
+    def close(self):
+        """關閉所有閒置連線。"""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+def _proxy_auth_headers(proxy_parts):
+    """代理網址帶有帳號密碼時回傳 Proxy-Authorization 標頭，否則回傳空字典。"""
+    if proxy_parts.username is None:
+        return {}
+    credentials = f"{unquote(proxy_parts.username)}:{unquote(proxy_parts.password or '')}"
+    return {'Proxy-Authorization': 'Basic ' + b64encode(credentials.encode('utf-8')).decode('ascii')}
+
+# 未指定 client 時共用的用戶端
+_default_client = HttpClient()
+
 class ImgurLinkParser(HTMLParser):
     """解析 HTML 中的 Imgur 連結"""
     def __init__(self):
@@ -43,24 +322,28 @@ class ImgurLinkParser(HTMLParser):
                         if '.gif' in value or 'i.imgur.com' in value:
                             self.imgur_links.append(value)
 
-def fetch_page(url, retries=3, delay=2):
-    """抓取網頁內容"""
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+def fetch_page(url, retries=3, delay=2, client=None):
+    """抓取網頁內容（透過共用的 HttpClient，要求 gzip 壓縮）"""
+    client = client or _default_client
     
     for attempt in range(retries):
         try:
-            req = Request(url, headers=headers)
-            with urlopen(req, timeout=10) as response:
-                return response.read().decode('utf-8', errors='ignore')
-        except (URLError, HTTPError) as e:
+            return client.fetch(url, timeout=10, compressed=True).decode('utf-8', errors='ignore')
+        except (URLError, HTTPError, OSError) as e:
             print(f"❌ 抓取失敗 (嘗試 {attempt + 1}/{retries}): {e}")
             if attempt < retries - 1:
                 time.sleep(delay)
     
     return None
 
+def canonical_imgur_url(link):
+    """
+    把 i.imgur.com 連結統一為 https://i.imgur.com/<ID>.gif，
+    讓 http/https、有無副檔名、帶查詢字串等寫法不會被當成不同的 GIF；其他連結原樣回傳。
+    """
+    match = re.match(r'^(?:https?:)?//i\.imgur\.com/([a-zA-Z0-9]+)(?:\.gif)?(?:[?#].*)?$', link)
+    return f"https://i.imgur.com/{match.group(1)}.gif" if match else link
+
 def extract_imgur_gifs(html_content):
     """從 HTML 中提取 Imgur GIF 連結"""
     if not html_content:
@@ -91,10 +374,156 @@ def extract_imgur_gifs(html_content):
             else:
                 gif_links.append(link)
     
-    return list(set(gif_links))  # 去重
+    return list({canonical_imgur_url(link) for link in gif_links})  # 統一寫法後去重
+
+def file_sha256(path):
+    """分塊計算檔案的 SHA-256（十六進位字串）。"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DownloadManifest:
+    """
+    下載清單：以檔名記錄 URL、ETag、Last-Modified、大小與 SHA-256，存成 JSON。
+    重新執行時據此送出條件式請求；未完成的 .part 檔則記錄其 ETag/Last-Modified 供續傳時的 If-Range 使用。
+    可在多個下載執行緒間共用，每次更新都以暫存檔加 os.replace 原子地寫回。
+
+    loaded 表示是否成功讀取了既有的清單（新建立或因損毀而重建時為 False），
+    loaded_blobs 為讀取當時清單所指向的 blob，供 build_gif_store 判斷哪些 blob 可以回收。
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.loaded = False
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+                if not isinstance(entries, dict):
+                    raise ValueError("格式不是 JSON 物件")
+                self.entries = entries
+                self.loaded = True
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 無法讀取下載清單，將重新建立: {e}")
+        self.loaded_blobs = {
+            entry['blob'] for entry in self.entries.values()
+            if isinstance(entry, dict) and BLOB_NAME_PATTERN.match(entry.get('blob') or '')
+        }
+
+    def get(self, filename):
+        """回傳 filename 的紀錄副本，沒有紀錄時回傳 None。"""
+        with self.lock:
+            entry = self.entries.get(filename)
+            return dict(entry) if entry is not None else None
+
+    def snapshot(self):
+        """回傳所有紀錄的副本 {檔名: 紀錄}。"""
+        with self.lock:
+            return {filename: dict(entry) for filename, entry in self.entries.items()}
+
+    def update(self, filename, **fields):
+        """更新 filename 的紀錄並寫回檔案；值為 None 的欄位會被移除。"""
+        with self.lock:
+            entry = self.entries.setdefault(filename, {})
+            for key, value in fields.items():
+                if value is None:
+                    entry.pop(key, None)
+                else:
+                    entry[key] = value
+            self._save()
+
+    def _save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                os.chmod(temp_path, FILE_MODE)
+                json.dump(self.entries, f, indent=2, ensure_ascii=False, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+def stream_to_file(response, output_path, verify_length=True, expected_size=None, partial_path=None, resume_from=0):
+    """
+    將回應內容分塊寫入同目錄的暫存檔，fsync 後再以 os.replace 原子地改名為 output_path，
+    回傳 (總位元組數, SHA-256)。verify_length=True 時檢查與 Content-Length 是否相符，
+    expected_size 有給時也檢查大小；不符或中途失敗時拋出例外，output_path 不會出現不完整的檔案。
 
-def download_gif(url, output_dir, filename=None):
-    """下載單個 GIF 檔案"""
+    partial_path 有給時改寫入這個固定路徑，resume_from > 0 代表接在既有的前 resume_from 個位元組後面
+    （206 回應）。連線中途斷掉時保留 partial_path 供下次以 Range 續傳；沒有給時使用隨機暫存檔，失敗即刪除。
+    """
+    content_length = response.headers.get('Content-Length')
+    digest = hashlib.sha256()
+    if partial_path is None:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(output_path) or '.', suffix='.part')
+        f = os.fdopen(fd, 'wb')
+        keep_partial = False
+    else:
+        temp_path = partial_path
+        if resume_from:
+            with open(temp_path, 'rb') as existing:
+                for chunk in iter(lambda: existing.read(DOWNLOAD_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+        f = open(temp_path, 'ab' if resume_from else 'wb')
+        keep_partial = True
+    try:
+        size = resume_from
+        with f:
+            os.chmod(temp_path, FILE_MODE)
+            while True:
+                chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        if verify_length and content_length is not None and size - resume_from != int(content_length):
+            raise IncompleteDownload(f"只收到 {size - resume_from} / {content_length} 位元組")
+        if expected_size is not None and size != expected_size:
+            # 內容已完整收到但大小不對，保留下來續傳也沒有意義
+            keep_partial = False
+            raise IncompleteDownload(f"大小為 {size} 位元組，預期 {expected_size}")
+        os.replace(temp_path, output_path)
+        return size, digest.hexdigest()
+    except BaseException:
+        if not keep_partial:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+        raise
+
+def _content_range_start(value):
+    """解析 'bytes start-end/total' 形式的 Content-Range，回傳 start；格式不符時回傳 None。"""
+    match = re.match(r'bytes\s+(\d+)-\d+/(?:\d+|\*)$', value or '')
+    return int(match.group(1)) if match else None
+
+def download_gif(url, output_dir, filename=None, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 bucket=None, host_limiter=None, label='', verify_length=True, expected_size=None,
+                 manifest=None, client=None):
+    """
+    下載單個 GIF 檔案，透過 client（HttpClient，預設為模組共用的用戶端）重複使用連線。失敗時最多重試 retries 次，每次等待時間加倍並加上隨機抖動。
+    bucket（TokenBucket）與 host_limiter（HostLimiter）用於並行下載時限速；label 會加在輸出訊息前面。
+    內容以固定大小分塊寫入暫存檔，完整且大小正確才改名（見 stream_to_file），
+    所以「檔案已存在」一定代表先前已完整下載。
+
+    有給 manifest（DownloadManifest）時：已存在且有 ETag/Last-Modified 紀錄的檔案改送
+    If-None-Match/If-Modified-Since，伺服器回 304 就不傳內容；未完成的 <檔名>.part 以 Range 加 If-Range 續傳，
+    伺服器回 200（不支援續傳或檔案已變）時從頭下載。完成後更新清單中的 ETag、Last-Modified、大小與 SHA-256。
+    清單中記錄的 blob 仍存在時也視為已下載，只做條件式檢查。
+    """
     try:
         if filename is None:
             # 從 URL 中提取檔名
@@ -102,33 +531,239 @@ def download_gif(url, output_dir, filename=None):
             if not filename.endswith('.gif'):
                 filename += '.gif'
         
+        client = client or _default_client
         output_path = os.path.join(output_dir, filename)
+        partial_path = output_path + '.part' if manifest is not None else None
+        entry = manifest.get(filename) if manifest is not None else None
+        # 已歸入內容定址儲存的檔案只剩 blob（見 build_gif_store），同樣視為已存在
+        blob = entry.get('blob') if entry else None
+        exists = os.path.exists(output_path) or bool(blob and os.path.exists(os.path.join(output_dir, blob)))
         
-        # 如果檔案已存在，跳過
-        if os.path.exists(output_path):
-            print(f"⏭️  已存在: {filename}")
+        # 檔案已存在但沒有可驗證的紀錄：跳過，並補記大小與雜湊
+        if exists and not (entry and (entry.get('etag') or entry.get('last_modified'))):
+            if manifest is not None and entry is None:
+                manifest.update(filename, url=url, size=os.path.getsize(output_path),
+                                sha256=file_sha256(output_path))
+            print(f"{label}⏭️  已存在: {filename}")
             return True
         
-        # 下載檔案
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-        }
-        req = Request(url, headers=headers)
+        print(f"{label}{'🔄 檢查更新' if exists else '⬇️  下載中'}: {filename}")
+        for attempt in range(retries + 1):
+            # 每次嘗試都重新讀取清單並決定請求標頭：上一次嘗試中斷時已記下 .part 的 ETag/Last-Modified，
+            # 同一次呼叫內的重試也能接著續傳
+            if attempt and manifest is not None:
+                entry = manifest.get(filename)
+            headers = {}
+            resume_from = 0
+            if exists:
+                if entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+                if entry.get('last_modified'):
+                    headers['If-Modified-Since'] = entry['last_modified']
+            elif partial_path is not None and os.path.exists(partial_path):
+                validator = entry and (entry.get('partial_etag') or entry.get('partial_last_modified'))
+                if validator and os.path.getsize(partial_path) > 0:
+                    resume_from = os.path.getsize(partial_path)
+                    headers['Range'] = f"bytes={resume_from}-"
+                    headers['If-Range'] = validator
+            try:
+                if bucket is not None:
+                    bucket.acquire()
+                # 主機名額依轉址後實際連到的主機計算（見 HttpClient.request）
+                with client.request(url, headers=headers, limiter=host_limiter) as response:
+                    etag = response.headers.get('ETag')
+                    last_modified = response.headers.get('Last-Modified')
+                    if resume_from and (response.status != 206
+                                        or _content_range_start(response.headers.get('Content-Range')) != resume_from):
+                        # 伺服器忽略 Range 或檔案已變更，從頭寫入
+                        resume_from = 0
+                    if manifest is not None:
+                        manifest.update(filename, partial_etag=etag, partial_last_modified=last_modified)
+                    size, sha256 = stream_to_file(response, output_path, verify_length, expected_size,
+                                                  partial_path, resume_from)
+                if manifest is not None:
+                    manifest.update(filename, url=url, etag=etag, last_modified=last_modified, size=size,
+                                    sha256=sha256, partial_etag=None, partial_last_modified=None)
+                break
+            except (URLError, OSError, IncompleteRead) as e:
+                if isinstance(e, HTTPError) and e.code == 304:
+                    print(f"{label}✔️  未變更: {filename}")
+                    return True
+                if isinstance(e, HTTPError) and e.code == 416 and resume_from:
+                    # 續傳的起點超出檔案範圍，捨棄 .part 後立刻從頭下載
+                    os.remove(partial_path)
+                    if attempt < retries:
+                        continue
+                retryable = not isinstance(e, HTTPError) or e.code in RETRYABLE_STATUS
+                if not retryable or attempt == retries:
+                    raise
+                wait = backoff * 2 ** attempt * (0.5 + random.random())
+                print(f"{label}🔁 重試 ({attempt + 1}/{retries}, {wait:.1f} 秒後): {filename}: {e}")
+                time.sleep(wait)
         
-        print(f"⬇️  下載中: {filename}")
-        with urlopen(req, timeout=30) as response:
-            with open(output_path, 'wb') as f:
-                f.write(response.read())
-        
-        print(f"✅ 完成: {filename}")
+        print(f"{label}✅ 完成: {filename}")
         return True
         
     except Exception as e:
-        print(f"❌ 下載失敗 ({filename}): {e}")
+        print(f"{label}❌ 下載失敗 ({filename}): {e}")
         return False
 
-def main():
+def blob_name(sha256):
+    """內容定址儲存中，SHA-256 為 sha256 的 GIF 的檔名。"""
+    return f"{sha256[:BLOB_HASH_LENGTH]}.gif"
+
+def build_gif_store(output_dir, manifest=None, collect=True):
+    """
+    將 output_dir 中以邏輯名稱（Imgur ID）存放的 GIF 改為內容定址儲存：以 SHA-256 命名（見 blob_name），
+    內容相同的只保留一份，同一動畫以不同 ID 重貼也不會重複佔用空間。
+    回傳 (對照表 {邏輯名稱: blob 檔名}, 移除的重複檔案數)。
+
+    有給 manifest 時把 blob 記入清單，對照表也包含先前已歸檔的項目。
+    collect=True 時回收舊版本：只刪除讀入清單時有被指向、現在已沒有任何邏輯名稱指向的 blob
+    （例如內容已更新的舊版本）。清單是新建立或重建的（manifest.loaded 為 False）時不回收，
+    以免清單遺失或損毀就刪掉所有 blob；本次有下載失敗時呼叫端應傳 collect=False。
+    """
+    entries = manifest.snapshot() if manifest is not None else {}
+    store = {
+        filename: entry['blob'] for filename, entry in entries.items()
+        if entry.get('blob') and os.path.exists(os.path.join(output_dir, entry['blob']))
+    }
+    duplicates = 0
+    for filename in sorted(os.listdir(output_dir)):
+        if not filename.endswith('.gif') or BLOB_NAME_PATTERN.match(filename):
+            continue
+        path = os.path.join(output_dir, filename)
+        size = os.path.getsize(path)
+        sha256 = file_sha256(path)
+        blob = blob_name(sha256)
+        blob_path = os.path.join(output_dir, blob)
+        if os.path.exists(blob_path):
+            os.remove(path)
+            if any(other == blob for name, other in store.items() if name != filename):
+                duplicates += 1
+        else:
+            os.replace(path, blob_path)
+        store[filename] = blob
+        if manifest is not None:
+            manifest.update(filename, blob=blob, size=size, sha256=sha256)
+
+    if collect and manifest is not None and manifest.loaded:
+        for blob in manifest.loaded_blobs - set(store.values()):
+            try:
+                os.remove(os.path.join(output_dir, blob))
+            except FileNotFoundError:
+                pass
+    return store, duplicates
+
+def gif_dhash(path, size=8):
+    """以第一個影格計算差異雜湊（dHash），回傳 size*size 位元的整數。需要 Pillow。"""
+    with Image.open(path) as image:
+        image.seek(0)
+        pixels = list(image.convert('L').resize((size + 1, size)).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = bits << 1 | (left > right)
+    return bits
+
+def find_similar_gifs(output_dir, blobs, max_distance=PHASH_DISTANCE):
+    """
+    找出感知雜湊距離不超過 max_distance 的 blob（例如重新壓縮或縮放過的同一動畫），
+    回傳群組列表 [[blob, ...], ...]。只做偵測不刪除；未安裝 Pillow 時回傳 None。
+    """
+    if Image is None:
+        return None
+    hashes = {}
+    for blob in sorted(set(blobs)):
+        try:
+            hashes[blob] = gif_dhash(os.path.join(output_dir, blob))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 無法計算感知雜湊 ({blob}): {e}")
+
+    # 以併查集把距離夠近的配對串成群組
+    parent = {blob: blob for blob in hashes}
+    def find(blob):
+        while parent[blob] != blob:
+            parent[blob] = parent[parent[blob]]
+            blob = parent[blob]
+        return blob
+    names = list(hashes)
+    for i, first in enumerate(names):
+        for second in names[i + 1:]:
+            if bin(hashes[first] ^ hashes[second]).count('1') <= max_distance:
+                parent[find(second)] = find(first)
+
+    groups = {}
+    for blob in names:
+        groups.setdefault(find(blob), []).append(blob)
+    return [group for group in groups.values() if len(group) > 1]
+
+def download_all(urls, output_dir, workers=DEFAULT_WORKERS, per_host=DEFAULT_PER_HOST, rate=DEFAULT_RATE,
+                 burst=DEFAULT_BURST, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, manifest=None, client=None):
+    """
+    以執行緒池並行下載所有 GIF，回傳 (成功數, 失敗數)。
+    以令牌桶限制整體每秒請求數、以 HostLimiter 限制每個主機同時進行的請求數，
+    取代原本每個檔案固定等待的做法，下載速度只受頻寬與伺服器限制。
+    manifest（DownloadManifest）有給時啟用條件式請求與續傳（見 download_gif）。
+    所有下載共用 client（HttpClient）的連線池；沒有給時建立一個連線池大小足夠所有工作執行緒的用戶端。
+    """
+    if workers < 1 or per_host < 1:
+        raise ValueError(f"workers 與 per_host 必須至少為 1：{workers}、{per_host}")
+    owns_client = client is None
+    if owns_client:
+        client = HttpClient(pool_size=max(workers, per_host))
+    bucket = TokenBucket(rate, burst) if rate else None
+    host_limiter = HostLimiter(per_host)
+    total = len(urls)
+    success_count = 0
+    fail_count = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(download_gif, url, output_dir, retries=retries, backoff=backoff,
+                            bucket=bucket, host_limiter=host_limiter, label=f"[{i}/{total}] ",
+                            manifest=manifest, client=client)
+            for i, url in enumerate(urls, 1)
+        ]
+        for future in as_completed(futures):
+            if future.result():
+                success_count += 1
+            else:
+                fail_count += 1
+    if owns_client:
+        client.close()
+    return success_count, fail_count
+
+def _positive_int(text):
+    """argparse 用的正整數型別。"""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"必須至少為 1：{text}")
+    return value
+
+def _non_negative(kind):
+    """argparse 用的非負數型別（kind 為 int 或 float）。"""
+    def parse(text):
+        value = kind(text)
+        if value < 0:
+            raise argparse.ArgumentTypeError(f"不可為負數：{text}")
+        return value
+    parse.__name__ = kind.__name__
+    return parse
+
+def main(argv=None):
     """主程序"""
+    parser = argparse.ArgumentParser(description='從巴哈姆特論壇抓取並下載 Tokyo Ghoul GIF 圖片')
+    parser.add_argument('--workers', type=_positive_int, default=DEFAULT_WORKERS, help='同時下載的檔案數')
+    parser.add_argument('--per-host', type=_positive_int, default=DEFAULT_PER_HOST, help='每個主機同時進行的請求數')
+    parser.add_argument('--rate', type=_non_negative(float), default=DEFAULT_RATE, help='每秒最多發出的請求數（0 為不限）')
+    parser.add_argument('--burst', type=_positive_int, default=DEFAULT_BURST, help='瞬間可連發的請求數')
+    parser.add_argument('--retries', type=_non_negative(int), default=DEFAULT_RETRIES, help='每個檔案失敗時的重試次數')
+    parser.add_argument('--phash', action='store_true', help='以感知雜湊找出相似的 GIF（需要 Pillow）')
+    parser.add_argument('--phash-distance', type=_non_negative(int), default=PHASH_DISTANCE, help='視為相似的最大感知雜湊距離')
+    args = parser.parse_args(argv)
+
     print("🎬 Tokyo Ghoul GIF 下載工具")
     print("=" * 50)
     
@@ -147,12 +782,15 @@ def main():
     print(f"📁 輸出目錄: {output_dir}")
     print()
     
+    # 抓取網頁與下載共用同一個用戶端，同一主機的請求重複使用連線
+    client = HttpClient(pool_size=max(args.workers, args.per_host))
+    
     # 收集所有 GIF 連結
     all_gif_links = []
     
     for i, url in enumerate(urls, 1):
         print(f"📄 正在抓取第 {i} 頁...")
-        html = fetch_page(url)
+        html = fetch_page(url, client=client)
         
         if html:
             gif_links = extract_imgur_gifs(html)
@@ -179,26 +817,17 @@ def main():
     print(f"💾 連結列表已保存: {json_path}")
     print()
     
-    # 下載所有 GIF
+    # 下載所有 GIF（依下載清單送出條件式請求並續傳未完成的檔案）
+    manifest_path = os.path.join(project_root, 'data', 'gif-manifest.json')
+    manifest = DownloadManifest(manifest_path)
     print(f"⬇️  開始下載 {len(all_gif_links)} 個 GIF...")
     print()
     
-    success_count = 0
-    fail_count = 0
-    
-    for i, url in enumerate(all_gif_links, 1):
-        print(f"[{i}/{len(all_gif_links)}]", end=" ")
-        
-        if download_gif(url, output_dir):
-            success_count += 1
-        else:
-            fail_count += 1
-        
-        # 避免請求過快
-        if i % 10 == 0:
-            time.sleep(2)
-        else:
-            time.sleep(0.5)
+    success_count, fail_count = download_all(
+        all_gif_links, output_dir, workers=args.workers, per_host=args.per_host,
+        rate=args.rate, burst=args.burst, retries=args.retries, manifest=manifest, client=client,
+    )
+    client.close()
     
     print()
     print("=" * 50)
@@ -206,8 +835,25 @@ def main():
     print(f"❌ 失敗: {fail_count} 個")
     print(f"📁 GIF 保存在: {output_dir}")
     print(f"📄 連結列表: {json_path}")
+    print(f"🧾 下載清單: {manifest_path}")
+    
+    # 改為內容定址儲存，相同內容只保留一份；有下載失敗時不回收舊 blob
+    store, duplicates = build_gif_store(output_dir, manifest, collect=fail_count == 0)
+    store_path = os.path.join(project_root, 'data', 'gif-store.json')
+    with open(store_path, 'w', encoding='utf-8') as f:
+        json.dump(store, f, indent=2, ensure_ascii=False, sort_keys=True)
+    print(f"🗃️  內容定址對照表: {store_path}（移除 {duplicates} 個重複檔案）")
+    
+    if args.phash:
+        groups = find_similar_gifs(output_dir, store.values(), args.phash_distance)
+        if groups is None:
+            print("⚠️ 未安裝 Pillow，略過相似 GIF 偵測")
+        else:
+            for group in groups:
+                print(f"🪞 相似 GIF: {', '.join(group)}")
+            print(f"🪞 共 {len(groups)} 組相似 GIF")
     
-    # 創建索引文件
+    # 創建索引文件（只列出不重複的 blob，前端從中隨機挑選）
     downloaded_files = [f for f in os.listdir(output_dir) if f.endswith('.gif')]
     index_path = os.path.join(project_root, 'data', 'gif-index.json')
     
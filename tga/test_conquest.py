@@ -0,0 +1,114 @@
+"""conquest.py 的單元測試：參數檢查與結果正確性，不需要 numpy。"""
+
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import conquest
+
+class TimelineTest(unittest.TestCase):
+
+    def setUp(self):
+        boss = next(iter(conquest.GAME_DATA))
+        self.schedule = [(0, boss, next(iter(conquest.GAME_DATA[boss])))]
+
+    def plan(self, refills):
+        return conquest.plan_timeline(1, 6, 100, self.schedule, refills=refills)
+
+    def test_refill(self):
+        self.assertGreater(self.plan([(0, 60, 50)])['stamina_used'], self.plan([])['stamina_used'])
+
+    def test_rejects_invalid_refill(self):
+        for refill in [(0, -60, 50), (-1, 60, 50), (0, 60, 0), (0, 60, -50)]:
+            with self.subTest(refill=refill), self.assertRaises(ValueError):
+                self.plan([refill])
+
+    def test_cli_rejects_negative_period(self):
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            conquest.build_parser().parse_args(['timeline', '--regen-minutes', '6', '--cap', '100',
+                                                '--refill', '0:-60:50', '--schedule', '0=野呂-困難'])
+
+class DropLogTest(unittest.TestCase):
+
+    def read(self, suffix, text):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return conquest.read_drop_log(path)
+
+    def assertBadLine(self, suffix, text, line_number, field):
+        with self.assertRaises(ValueError) as caught:
+            self.read(suffix, text)
+        self.assertIn(f"第 {line_number} 行", str(caught.exception))
+        self.assertIn(field, str(caught.exception))
+
+    def test_quantity_is_parsed(self):
+        counts = self.read('.csv', 'stage,drop_type,item,quantity,count\n野呂-困難,一般掉落,強化石,2,3\n野呂-困難,一般掉落,,,1\n')
+        self.assertEqual(counts, {('野呂-困難', '一般掉落', '強化石', 2): 3, ('野呂-困難', '一般掉落', '', 0): 1})
+
+    def test_rejects_malformed_quantity(self):
+        header = 'stage,drop_type,item,quantity\n野呂-困難,一般掉落,強化石,1\n'
+        self.assertBadLine('.csv', header + '野呂-困難,一般掉落,強化石,abc\n', 3, 'quantity')
+        self.assertBadLine('.csv', header + '野呂-困難,一般掉落,強化石,1.5\n', 3, 'quantity')
+        self.assertBadLine('.ndjson', '{"stage": "野呂-困難", "drop_type": "一般掉落", "item": "強化石"}\n', 1, 'quantity')
+
+    def test_rejects_empty_count(self):
+        self.assertBadLine('.csv', 'stage,drop_type,item,quantity,count\n野呂-困難,一般掉落,強化石,1,\n', 2, 'count')
+
+class EvCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        conquest.clear_ev_cache()
+        self.game_data = json.loads(json.dumps({boss: dict(conquest.GAME_DATA[boss]) for boss in conquest.GAME_DATA}))
+
+    def test_in_place_pool_edit_invalidates_only_that_stage(self):
+        boss = next(iter(self.game_data))
+        difficulty = next(iter(self.game_data[boss]))
+        stage_name = f"{boss}-{difficulty}"
+        details = self.game_data[boss][difficulty]
+        drop = next(iter(details['drops'].values()))
+        item = drop['pool'][0]['item']
+        before = conquest.cached_ev_per_stamina(self.game_data)[item][stage_name]
+        conquest.cached_best_stages(self.game_data)
+        cached = set(conquest._ev_cache)
+
+        drop['pool'][0]['prob'] *= 2
+        after = conquest.cached_ev_per_stamina(self.game_data)
+        self.assertGreater(after[item][stage_name], before)
+        self.assertEqual(after, conquest.calculate_ev_per_stamina(conquest.compile_game_data(self.game_data)))
+        self.assertEqual(conquest.cached_best_stages(self.game_data)[item],
+                         conquest.find_best_stage(after)[item])
+        # 只多了被修改關卡的效率與整份數據的最佳關卡兩筆，其他關卡沿用原本的快取
+        self.assertEqual(len(set(conquest._ev_cache) - cached), 2)
+        self.assertTrue(cached <= set(conquest._ev_cache))
+
+class ArgumentTest(unittest.TestCase):
+
+    def assertCliError(self, *argv):
+        # 錯誤訊息要指出最後一個選項，避免因為其他參數寫錯而誤判為通過
+        stderr = io.StringIO()
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(stderr):
+            conquest.build_parser().parse_args(list(argv))
+        self.assertIn(f"argument {argv[-2]}", stderr.getvalue())
+
+    def test_sweep_rejects_negative_stamina(self):
+        with self.assertRaises(ValueError):
+            conquest.sweep_stages(-100)
+        self.assertCliError('sweep', '--stamina', '-100')
+
+    def test_simulate_rejects_negative_runs(self):
+        boss = next(iter(conquest.GAME_DATA))
+        difficulty = next(iter(conquest.GAME_DATA[boss]))
+        for engine in ('auto', 'python'):
+            with self.subTest(engine=engine), self.assertRaises(ValueError):
+                conquest.simulate_runs(boss, difficulty, -5, engine=engine, verbose=False)
+        self.assertCliError('simulate', '--boss', boss, '--difficulty', difficulty, '--runs', '-5')
+        self.assertCliError('simulate', '--boss', boss, '--difficulty', difficulty, '--stamina', '-300')
+        self.assertCliError('validate', '--runs', '-5')
+
+if __name__ == '__main__':
+    unittest.main()
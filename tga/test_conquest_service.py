@@ -0,0 +1,84 @@
+"""conquest.py HTTP 服務的端對端測試：在 port 0 啟動 ThreadingHTTPServer，以 http.client 發送請求。"""
+
+import http.client
+import json
+import threading
+import unittest
+import urllib.parse
+from http.server import ThreadingHTTPServer
+
+import conquest
+
+class ConquestServiceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.service = conquest.ConquestService(workers=1)
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), conquest._make_request_handler(cls.service))
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.port = cls.server.server_address[1]
+        cls.boss = next(iter(conquest.GAME_DATA))
+        cls.difficulty = next(iter(conquest.GAME_DATA[cls.boss]))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.service.close()
+
+    def request(self, method, path, payload=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        try:
+            body = None if payload is None else json.dumps(payload)
+            connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+        finally:
+            connection.close()
+
+    def assertFieldError(self, method, path, payload, field):
+        status, document = self.request(method, path, payload)
+        self.assertEqual(status, 400, document)
+        self.assertEqual(document.get('field'), field, document)
+        self.assertNotIn('Traceback', document['error'])
+
+    def test_health(self):
+        self.assertEqual(self.request('GET', '/health'), (200, {'status': 'ok'}))
+
+    def test_analyze(self):
+        status, best = self.request('GET', '/analyze')
+        self.assertEqual(status, 200)
+        item = next(iter(best))
+        status, ranked = self.request('GET', '/analyze?top=1&item=' + urllib.parse.quote(item))
+        self.assertEqual(status, 200)
+        self.assertEqual(len(ranked[item]), 1)
+        self.assertFieldError('GET', '/analyze?top=abc&item=' + urllib.parse.quote(item), None, 'top')
+        self.assertFieldError('POST', '/analyze', {'item': [item]}, 'item')
+        self.assertFieldError('POST', '/analyze', {'item': item, 'min': 'low'}, 'min')
+
+    @unittest.skipIf(conquest.np is None, "需要 numpy")
+    def test_simulate(self):
+        payload = {'boss': self.boss, 'difficulty': self.difficulty, 'runs': 200, 'seed': 7}
+        status, first = self.request('POST', '/simulate', payload)
+        self.assertEqual(status, 200, first)
+        self.assertEqual(self.request('POST', '/simulate', payload), (200, first))
+        self.assertFieldError('POST', '/simulate', dict(payload, runs='200'), 'runs')
+        self.assertFieldError('POST', '/simulate', dict(payload, runs=True), 'runs')
+        self.assertFieldError('POST', '/simulate', dict(payload, runs=conquest.SERVICE_MAX_RUNS + 1), 'runs')
+        self.assertFieldError('POST', '/simulate', dict(payload, seed=-1), 'seed')
+        self.assertFieldError('POST', '/simulate', dict(payload, histogram='yes'), 'histogram')
+        self.assertFieldError('POST', '/simulate', dict(payload, histogram=True, window_runs=10**12), 'window_runs')
+        self.assertFieldError('POST', '/simulate', {'difficulty': self.difficulty, 'runs': 1}, 'boss')
+
+    def test_optimize_errors(self):
+        item = next(iter(self.request('GET', '/analyze')[1]))
+        self.assertFieldError('POST', '/optimize', {'targets': [item]}, 'targets')
+        self.assertFieldError('POST', '/optimize', {'targets': {item: 'ten'}}, 'targets')
+        self.assertFieldError('POST', '/optimize', {'targets': {item: 10}, 'stages': [1]}, 'stages')
+        self.assertFieldError('POST', '/optimize', {'targets': {item: 10}, 'confidence': 1.5}, 'confidence')
+        self.assertFieldError('POST', '/optimize', {'targets': {item: 10}, 'trials': 0}, 'trials')
+        self.assertFieldError('POST', '/optimize', {'targets': {item: 10}, 'method': 'guess'}, 'method')
+
+if __name__ == '__main__':
+    unittest.main()